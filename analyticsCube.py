@@ -0,0 +1,352 @@
+import numpy
+
+from localTime import to_local
+
+# the attributes incidents can be grouped by, besides the local hour and month of discovery
+GROUP_FIELDS = {'county': 'POOCounty', 'cause': 'FireCause'}
+
+# dimensions of the count tables, in the order of their axes
+DIMENSIONS = ('hour', 'county', 'cause', 'month')
+
+SIZE_FIELD = 'IncidentSize'
+TIME_FIELD = 'FireDiscoveryDateTime'
+
+# cells a cube's sparse delta holds before it is folded into a new dense table
+MAX_DELTA_CELLS = 65536
+
+
+def group_codes(store, group_by: str, rows: numpy.ndarray) -> numpy.ndarray:
+    """
+    Returns the group of each row as a small integer: 0 for a null value, otherwise the
+    dictionary code of the attribute plus one. Codes are stable across refreshes, since the
+    string dictionaries only grow.
+    """
+    column = store.column(GROUP_FIELDS[group_by])
+    return numpy.where(column.valid[rows], column.values[rows] + 1, 0).astype(numpy.int64)
+
+
+def group_labels(store, group_by: str) -> list:
+    """
+    Returns the label of every group code of an attribute, None for the group of null values.
+    """
+    return [None] + list(store.column(GROUP_FIELDS[group_by]).categories)
+
+
+def group_size(store, dimension: str) -> int:
+    """
+    Returns the number of distinct codes of a dimension.
+    """
+    if dimension == 'hour':
+        return 24
+    if dimension == 'month':
+        return 12
+    return len(store.column(GROUP_FIELDS[dimension]).categories) + 1
+
+
+def dimension_codes(store, rows: numpy.ndarray, timezone: str, dimensions: tuple = DIMENSIONS) -> dict:
+    """
+    Returns the code of every dimension for rows that have a discovery time: the local hour
+    (0-23), the local month (0-11) and the county and cause group codes. Only the given
+    dimensions are computed.
+    """
+    codes = {}
+    if 'hour' in dimensions or 'month' in dimensions:
+        local = to_local(store.values(TIME_FIELD)[rows], timezone)
+    if 'hour' in dimensions:
+        codes['hour'] = (local // 3600000) % 24
+    for group_by in GROUP_FIELDS:
+        if group_by in dimensions:
+            codes[group_by] = group_codes(store, group_by, rows)
+    if 'month' in dimensions:
+        codes['month'] = local.astype('datetime64[ms]').astype('datetime64[M]').astype(numpy.int64) % 12
+    return codes
+
+
+def count_table(store, rows: numpy.ndarray, timezone: str, dimensions: tuple) -> numpy.ndarray:
+    """
+    Counts the given rows over some of the DIMENSIONS, skipping rows without a discovery time.
+
+    Returns:
+    - numpy.ndarray: One axis per dimension, in the order given.
+    """
+    rows = rows[store.not_null(TIME_FIELD)[rows]]
+    shape = tuple(group_size(store, dimension) for dimension in dimensions)
+    codes = dimension_codes(store, rows, timezone)
+    cells = numpy.ravel_multi_index(tuple(codes[dimension] for dimension in dimensions), shape) if dimensions else numpy.zeros(len(rows), dtype=numpy.int64)
+    return numpy.bincount(cells, minlength=int(numpy.prod(shape))).reshape(shape)
+
+
+def count_tables(store, selections: list, timezone: str, dimensions: list) -> list:
+    """
+    Counts several selections of rows at once, like count_table on each. The dimension codes
+    of the union of the selections are computed once and every selection's cells are counted
+    by a single bincount, with each table at its own offset.
+
+    Parameters:
+    - store (FeatureStore): The incidents.
+    - selections (list): Arrays of rows, one per table.
+    - timezone (str): The time zone of the hour and month dimensions.
+    - dimensions (list): The dimensions of each table, a tuple of DIMENSIONS per selection.
+
+    Returns:
+    - list: One table per selection, with one axis per dimension in the order given.
+    """
+    if not selections:
+        return []
+    with_time = store.not_null(TIME_FIELD)
+    selections = [rows[with_time[rows]] for rows in selections]
+    shapes = [tuple(group_size(store, dimension) for dimension in table_dimensions) for table_dimensions in dimensions]
+    sizes = [int(numpy.prod(shape)) for shape in shapes]
+    offsets = numpy.cumsum([0] + sizes[:-1])
+
+    selected = numpy.zeros(len(store), dtype=bool)
+    for rows in selections:
+        selected[rows] = True
+    union = numpy.flatnonzero(selected)
+    # position of every row of the union within it
+    positions_of = numpy.zeros(len(store), dtype=numpy.int64)
+    positions_of[union] = numpy.arange(len(union))
+    codes = dimension_codes(store, union, timezone, {dimension for table_dimensions in dimensions for dimension in table_dimensions})
+    cells = []
+    for rows, table_dimensions, shape, offset in zip(selections, dimensions, shapes, offsets):
+        positions = positions_of[rows]
+        if table_dimensions:
+            cells.append(offset + numpy.ravel_multi_index(tuple(codes[dimension][positions] for dimension in table_dimensions), shape))
+        else:
+            cells.append(numpy.full(len(rows), offset, dtype=numpy.int64))
+
+    counts = numpy.bincount(numpy.concatenate(cells), minlength=sum(sizes))
+    return [counts[offset:offset + size].reshape(shape) for offset, size, shape in zip(offsets, sizes, shapes)]
+
+
+def hour_counts(counts: numpy.ndarray) -> dict:
+    """
+    Returns the hours (0-23) of a table over the hour dimension that have incidents, mapped to their counts.
+    """
+    return {hour: count for hour, count in enumerate(counts.tolist()) if count}
+
+
+def hour_counts_by_group(store, table: numpy.ndarray, group_by: str) -> dict:
+    """
+    Returns each group of a (group_by, 'hour') table with incidents (a county or cause name,
+    None for a missing value, or a month 1-12) mapped to its hour_counts.
+    """
+    labels = list(range(1, 13)) if group_by == 'month' else group_labels(store, group_by)
+    return {labels[code]: hour_counts(counts) for code, counts in enumerate(table) if counts.any()}
+
+
+class AnalyticsCube:
+    """
+    Incident counts by local hour, county, cause and local month of discovery in one time zone.
+
+    The counts are kept in a dense table with one axis per dimension, and the totals over any
+    subset of the dimensions are computed once per cube and then looked up. A refresh does not
+    copy the dense table: the changed incidents are added, and the previous state of the
+    replaced ones taken out, in a sparse delta of the cells they fall in, which the updated
+    cube shares the dense table with. Once the delta holds more than MAX_DELTA_CELLS cells it
+    is folded into a new dense table.
+    """
+    def __init__(self, timezone: str, counts: numpy.ndarray, shape: tuple = None, cells: numpy.ndarray = None,
+                 deltas: numpy.ndarray = None, base_tables: dict = None):
+        """
+        Parameters:
+        - timezone (str): The time zone of the hour and month dimensions.
+        - counts (numpy.ndarray): The dense table, one axis per dimension.
+        - shape (tuple, optional): The size of every dimension, at least the dense table's. Defaults to its shape.
+        - cells (numpy.ndarray, optional): Sorted flat indexes, in `shape`, of the cells the delta changes.
+        - deltas (numpy.ndarray, optional): The change of the count of each of `cells`.
+        - base_tables (dict, optional): Totals of the dense table already computed, shared by the cubes built on it.
+        """
+        self.timezone = timezone
+        self.counts = counts
+        self.shape = counts.shape if shape is None else shape
+        self.cells = numpy.zeros(0, dtype=numpy.int64) if cells is None else cells
+        self.deltas = numpy.zeros(0, dtype=counts.dtype) if deltas is None else deltas
+        self._base_tables = {} if base_tables is None else base_tables
+        self._tables = {}
+
+    @classmethod
+    def build(cls, store, timezone: str) -> 'AnalyticsCube':
+        """
+        Builds the cube of every incident of a store.
+        """
+        return cls(timezone, count_table(store, numpy.arange(len(store)), timezone, DIMENSIONS))
+
+    def _cells(self, store, rows: numpy.ndarray, shape: tuple) -> numpy.ndarray:
+        # the flat cell of each of the rows with a discovery time
+        rows = rows[store.not_null(TIME_FIELD)[rows]]
+        codes = dimension_codes(store, rows, self.timezone)
+        return numpy.ravel_multi_index(tuple(codes[dimension] for dimension in DIMENSIONS), shape)
+
+    def updated(self, previous_store, store, changed_rows: numpy.ndarray) -> 'AnalyticsCube':
+        """
+        Returns a cube reflecting new values at `changed_rows`.
+
+        Parameters:
+        - previous_store (FeatureStore): The store this cube was built on.
+        - store (FeatureStore): The store after the update.
+        - changed_rows (numpy.ndarray): The rows that were replaced or appended.
+
+        Returns:
+        - AnalyticsCube: The updated cube. This cube is left untouched.
+        """
+        changed_rows = numpy.unique(changed_rows)
+        shape = tuple(group_size(store, dimension) for dimension in DIMENSIONS)
+        replaced = changed_rows[changed_rows < len(previous_store)]
+        # group codes only grow, so the cells of the previous store are valid in the new shape
+        previous_cells = numpy.ravel_multi_index(numpy.unravel_index(self.cells, self.shape), shape)
+        removed = self._cells(previous_store, replaced, shape)
+        added = self._cells(store, changed_rows, shape)
+
+        cells, inverse = numpy.unique(numpy.concatenate((previous_cells, removed, added)), return_inverse=True)
+        deltas = numpy.zeros(len(cells), dtype=self.counts.dtype)
+        numpy.add.at(deltas, inverse, numpy.concatenate((self.deltas, numpy.full(len(removed), -1), numpy.ones(len(added), dtype=numpy.int64))))
+        nonzero = deltas != 0
+        cells, deltas = cells[nonzero], deltas[nonzero]
+
+        if len(cells) <= MAX_DELTA_CELLS:
+            return AnalyticsCube(self.timezone, self.counts, shape, cells, deltas, self._base_tables)
+        counts = numpy.zeros(shape, dtype=self.counts.dtype)
+        counts[tuple(slice(0, size) for size in self.counts.shape)] = self.counts
+        numpy.add.at(counts.reshape(-1), cells, deltas)
+        return AnalyticsCube(self.timezone, counts)
+
+    def table(self, dimensions: tuple) -> numpy.ndarray:
+        """
+        Returns the incident counts over some of the DIMENSIONS, one axis per dimension in the order given.
+        """
+        dimensions = tuple(dimensions)
+        if dimensions not in self._tables:
+            unknown = [dimension for dimension in dimensions if dimension not in DIMENSIONS]
+            if unknown:
+                raise ValueError(f"Unknown dimensions: {', '.join(unknown)}. Use any of: {', '.join(DIMENSIONS)}")
+            kept = sorted(DIMENSIONS.index(dimension) for dimension in dimensions)
+            order = [kept.index(DIMENSIONS.index(dimension)) for dimension in dimensions]
+
+            base = self._base_tables.get(dimensions)
+            if base is None:
+                summed = self.counts.sum(axis=tuple(axis for axis in range(len(DIMENSIONS)) if axis not in kept))
+                base = self._base_tables[dimensions] = numpy.transpose(summed, order)
+            shape = tuple(self.shape[DIMENSIONS.index(dimension)] for dimension in dimensions)
+            if not len(self.cells) and base.shape == shape:
+                self._tables[dimensions] = base
+                return base
+            table = numpy.zeros(shape, dtype=self.counts.dtype)
+            table[tuple(slice(0, size) for size in base.shape)] = base
+            if len(self.cells):
+                codes = numpy.unravel_index(self.cells, self.shape)
+                flat = numpy.ravel_multi_index(tuple(codes[DIMENSIONS.index(dimension)] for dimension in dimensions), shape) if dimensions else numpy.zeros(len(self.cells), dtype=numpy.int64)
+                numpy.add.at(table.reshape(-1), flat, self.deltas)
+            self._tables[dimensions] = table
+        return self._tables[dimensions]
+
+
+class SizeDistribution:
+    """
+    The non-null incident sizes in ascending order, optionally per group.
+
+    Sizes are sorted by (group, size), so the sizes of a group form one contiguous sorted run:
+    the number of incidents above any threshold is a binary search and every percentile is an
+    index into the run.
+    """
+    def __init__(self, group_by: str, keys: numpy.ndarray, sizes: numpy.ndarray, rows: numpy.ndarray):
+        self.group_by = group_by
+        self.keys = keys
+        self.sizes = sizes
+        self.rows = rows
+        self._groups = None
+
+    @staticmethod
+    def _keys(store, group_by: str, rows: numpy.ndarray) -> numpy.ndarray:
+        if group_by is None:
+            return numpy.zeros(len(rows), dtype=numpy.int64)
+        return group_codes(store, group_by, rows)
+
+    @classmethod
+    def build(cls, store, group_by: str = None, rows: numpy.ndarray = None) -> 'SizeDistribution':
+        """
+        Builds the distribution of a store's incident sizes.
+
+        Parameters:
+        - store (FeatureStore): The incidents.
+        - group_by (str, optional): One of GROUP_FIELDS, or None for a single group.
+        - rows (numpy.ndarray, optional): The incidents to include. All of them if not given.
+        """
+        if group_by is not None and group_by not in GROUP_FIELDS:
+            raise ValueError(f"Cannot group by '{group_by}'. Use one of: {', '.join(GROUP_FIELDS)}")
+        if rows is None:
+            rows = numpy.flatnonzero(store.not_null(SIZE_FIELD))
+        else:
+            rows = rows[store.not_null(SIZE_FIELD)[rows]]
+        keys = cls._keys(store, group_by, rows)
+        sizes = store.values(SIZE_FIELD)[rows]
+        order = numpy.lexsort((sizes, keys))
+        return cls(group_by, keys[order], sizes[order], rows[order])
+
+    def updated(self, store, changed_rows: numpy.ndarray) -> 'SizeDistribution':
+        """
+        Returns a distribution reflecting new values at `changed_rows`, without re-sorting the unchanged entries.
+
+        Returns:
+        - SizeDistribution: The updated distribution. This one is left untouched.
+        """
+        keep = ~numpy.isin(self.rows, changed_rows)
+        keys, sizes, rows = self.keys[keep], self.sizes[keep], self.rows[keep]
+
+        changed_rows = numpy.unique(changed_rows)
+        changed_rows = changed_rows[store.not_null(SIZE_FIELD)[changed_rows]]
+        new_keys = self._keys(store, self.group_by, changed_rows)
+        new_sizes = store.values(SIZE_FIELD)[changed_rows]
+        order = numpy.lexsort((new_sizes, new_keys))
+        new_keys, new_sizes, changed_rows = new_keys[order], new_sizes[order], changed_rows[order]
+
+        # position within the run of the same group
+        low = numpy.searchsorted(keys, new_keys, side='left')
+        high = numpy.searchsorted(keys, new_keys, side='right')
+        positions = [lo + numpy.searchsorted(sizes[lo:hi], size, side='right') for lo, hi, size in zip(low, high, new_sizes)]
+        return SizeDistribution(self.group_by, numpy.insert(keys, positions, new_keys), numpy.insert(sizes, positions, new_sizes),
+                                numpy.insert(rows, positions, changed_rows))
+
+    def groups(self) -> dict:
+        """
+        Returns each group key present mapped to the (start, end) of its run.
+        """
+        if self._groups is None:
+            starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(self.keys)) + 1)) if len(self.keys) else numpy.array([], dtype=numpy.int64)
+            ends = numpy.append(starts[1:], len(self.keys))
+            self._groups = {int(self.keys[start]): (int(start), int(end)) for start, end in zip(starts, ends)}
+        return self._groups
+
+    def _run(self, key: int = 0):
+        start, end = self.groups().get(key, (0, 0))
+        return self.sizes[start:end]
+
+    def count(self, key: int = 0) -> int:
+        start, end = self.groups().get(key, (0, 0))
+        return end - start
+
+    def count_above(self, threshold: float, key: int = 0) -> int:
+        """
+        Returns the number of incidents of a group strictly larger than `threshold`.
+        """
+        run = self._run(key)
+        return len(run) - int(numpy.searchsorted(run, threshold, side='right'))
+
+    def percentiles(self, percentiles: list, key: int = 0) -> dict:
+        """
+        Returns the given percentiles (0-100) of a group's sizes, linearly interpolated like
+        numpy.percentile, or None for each when the group is empty.
+        """
+        run = self._run(key)
+        result = {}
+        for percentile in percentiles:
+            if not 0 <= percentile <= 100:
+                raise ValueError(f"Percentiles must lie within 0 and 100, got {percentile}")
+            if len(run) == 0:
+                result[percentile] = None
+                continue
+            position = percentile / 100 * (len(run) - 1)
+            low = int(position)
+            high = min(low + 1, len(run) - 1)
+            result[percentile] = float(run[low] + (run[high] - run[low]) * (position - low))
+        return result
@@ -1,31 +1,306 @@
-from datetime import datetime, timedelta
-from collections import defaultdict
-import matplotlib.pyplot as plt
-from feature import *
-from field import *
-from spatialReference import *
-import pytz
+import copy
+import uuid
+from collections import OrderedDict
+from field import Field
+from spatialReference import SpatialReference
+from featureStore import FeatureStore
+from timeIndex import TimeIndex, TIME_FIELDS
+from locationIndex import LocationIndex, normalize
+from localTime import hour_histogram
+from spatialIndex import SpatialIndex
+from timeSeries import TimeSeries, time_size_histogram
+from analyticsCube import AnalyticsCube, SizeDistribution, count_table, hour_counts_by_group
 import numpy
-import matplotlib
-matplotlib.use('Agg')  # Set the backend to 'Agg' for non-GUI usage
-import matplotlib.pyplot as plt
+import plotRenderer
+import metrics
+
+# number of memoized hour histograms kept per response
+HOUR_CACHE_SIZE = 256
+
+# time zones whose analytics cube is kept per response, the least recently used dropped first;
+# every kept cube is also updated on each merge
+CUBE_CACHE_SIZE = 4
+
+# (frequency, time zone) time series kept per response
+TIME_SERIES_CACHE_SIZE = 12
+
+
+def _cached(cache: OrderedDict, key, build, size: int):
+    """
+    Returns the value of a key in a small LRU cache, building and adding it if missing.
+    Concurrent misses may build the same value twice, which only costs time.
+    """
+    value = cache.get(key)
+    if value is None:
+        value = cache[key] = build()
+    else:
+        try:
+            cache.move_to_end(key)
+        except KeyError:
+            # dropped by another thread in the meantime
+            pass
+    while len(cache) > size:
+        try:
+            cache.popitem(last=False)
+        except KeyError:
+            break
+    return value
+
 
 class ArcGISResponse:
-    def __init__(self, objectIdFieldName, uniqueIdField, globalIdFieldName, geometryType, spatialReference, fields, exceededTransferLimit, features):
+    def __init__(self, objectIdFieldName=None, uniqueIdField=None, globalIdFieldName=None, geometryType=None, spatialReference=None, fields=(),
+                 exceededTransferLimit=False, features=(), **extra):
+        # other members of a query response (hasZ, geometryProperties, ...) are not used
         self.objectIdFieldName = objectIdFieldName
         self.uniqueIdField = uniqueIdField
         self.globalIdFieldName = globalIdFieldName
         self.geometryType = geometryType
-        self.spatialReference = SpatialReference(**spatialReference)
+        self.spatialReference = SpatialReference(**(spatialReference or {}))
         self.fields = [Field(**field) for field in fields]
         self.exceededTransferLimit = exceededTransferLimit
-        self.features = [Feature(**feature['attributes'], geometry=feature['geometry']) for feature in features]
+        self._attach(FeatureStore.from_features(self.fields, features))
+
+    @classmethod
+    def from_store(cls, store: FeatureStore, header: dict, version: int = 0, high_water_mark: int = None,
+                   time_indexes: dict = None, spatial_index: SpatialIndex = None, epoch: str = None) -> 'ArcGISResponse':
+        """
+        Builds a response around an existing FeatureStore, e.g. one opened from a snapshot.
+
+        Parameters:
+        - store (FeatureStore): The incidents.
+        - header (dict): The non-feature members of a query response (fields, spatialReference, ...).
+        - version (int, optional): The data version. Defaults to 0.
+        - high_water_mark (int, optional): Latest ModifiedOnDateTime_dt. Computed from the store if not provided.
+        - time_indexes (dict, optional), spatial_index (SpatialIndex, optional): Prebuilt indexes; built if not provided.
+        - epoch (str, optional): The epoch the version counts in. A new one if not provided.
+
+        Returns:
+        - ArcGISResponse: The response.
+        """
+        response = cls(**header, features=[])
+        response._attach(store, version, high_water_mark, time_indexes, spatial_index, epoch)
+        return response
+
+    def header(self) -> dict:
+        """
+        Returns the non-feature members of the response in the shape of a query response.
+        """
+        return {
+            'objectIdFieldName': self.objectIdFieldName,
+            'uniqueIdField': self.uniqueIdField,
+            'globalIdFieldName': self.globalIdFieldName,
+            'geometryType': self.geometryType,
+            'spatialReference': dict(vars(self.spatialReference)),
+            'fields': [dict(vars(field)) for field in self.fields],
+            'exceededTransferLimit': self.exceededTransferLimit,
+        }
+
+    def _attach(self, store: FeatureStore, version: int = 0, high_water_mark: int = None, time_indexes: dict = None,
+                spatial_index: SpatialIndex = None, epoch: str = None):
+        self.store = store
+        self.version = version
+        # versions are only comparable within an epoch: every collection loaded from scratch
+        # starts a new one, the ones merged into it stay in it
+        self.epoch = epoch or uuid.uuid4().hex
+        # the store merged into the previous version to make this one, None for a collection loaded whole
+        self.delta = None
+        self.high_water_mark = self._latest_modification(store) if high_water_mark is None else high_water_mark
+        self.time_indexes = time_indexes if time_indexes is not None else {
+            name: TimeIndex.build(store.column(name)) for name in TIME_FIELDS if name in store.columns
+        }
+        self.spatial_index = spatial_index if spatial_index is not None else SpatialIndex.build(store, self.wkid)
+        self._location_index = None
+        self._cubes = OrderedDict()
+        self._size_distributions = {}
+        self._time_series = OrderedDict()
+        self._features = None
+        self._hour_cache = {}
+
+    @property
+    def wkid(self) -> int:
+        return self.spatialReference.latestWkid or self.spatialReference.wkid
+
+    @property
+    def location_index(self) -> LocationIndex:
+        """
+        The inverted index of the location fields, built on first use.
+        """
+        if self._location_index is None:
+            self._location_index = LocationIndex.build(self.store)
+        return self._location_index
+
+    def analytics_cube(self, timezone: str = 'US/Pacific') -> AnalyticsCube:
+        """
+        The incident counts by hour, county, cause and month in a time zone, built on first use
+        and kept up to date by upsert for the last CUBE_CACHE_SIZE time zones used.
+        """
+        return _cached(self._cubes, timezone, lambda: AnalyticsCube.build(self.store, timezone), CUBE_CACHE_SIZE)
+
+    def size_distribution(self, group_by: str = None) -> SizeDistribution:
+        """
+        The sorted incident sizes, optionally per 'county' or 'cause', built on first use and
+        kept up to date by upsert.
+        """
+        if group_by not in self._size_distributions:
+            self._size_distributions[group_by] = SizeDistribution.build(self.store, group_by)
+        return self._size_distributions[group_by]
+
+    @property
+    def features(self) -> list:
+        """
+        Every incident as a Feature object. These are built on first access; the analyses work on
+        `store` directly and only materialize the rows they return.
+        """
+        if self._features is None:
+            self._features = self.store.features()
+        return self._features
+
+    def time_index(self, field: str = 'FireDiscoveryDateTime') -> TimeIndex:
+        """
+        Returns the sorted index of one of the TIME_FIELDS.
+        """
+        if field not in self.time_indexes:
+            raise ValueError(f"No time index for '{field}'. Use one of: {', '.join(self.time_indexes)}")
+        return self.time_indexes[field]
+
+    @staticmethod
+    def _latest_modification(store: FeatureStore):
+        if 'ModifiedOnDateTime_dt' not in store.columns or not store.not_null('ModifiedOnDateTime_dt').any():
+            return None
+        return store.values('ModifiedOnDateTime_dt')[store.not_null('ModifiedOnDateTime_dt')].max().item()
+
+    def upsert(self, features) -> 'ArcGISResponse':
+        """
+        Merges updated or new incidents into a copy of this response.
+        Incidents are matched by SourceGlobalID (or SourceOID when that is missing); matches are
+        replaced in place and new ones are appended. This response is left untouched, so readers
+        holding it keep a consistent view while the copy is swapped in.
+
+        Parameters:
+        - features (list): Raw features as returned by the query endpoint ({'attributes': ..., 'geometry': ...}).
+
+        Returns:
+        - ArcGISResponse: A new response with a bumped version and high water mark.
+        """
+        return self.merge(FeatureStore.from_features(self.fields, features))
+
+    def merge(self, delta: FeatureStore) -> 'ArcGISResponse':
+        """
+        Merges the incidents of a store with the same columns into a copy of this response, like upsert.
+        """
+        updated = copy.copy(self)
+        updated.store, changed_rows = self.store.upsert(delta)
+        updated.time_indexes = {
+            name: index.updated(updated.store.column(name), changed_rows) for name, index in self.time_indexes.items()
+        }
+        updated._location_index = self._location_index.updated(updated.store) if self._location_index is not None else None
+        updated.spatial_index = self.spatial_index.updated(updated.store, changed_rows, self.wkid)
+        # readers of this response may add entries meanwhile, so iterate over copies
+        updated._cubes = OrderedDict((tz, cube.updated(self.store, updated.store, changed_rows)) for tz, cube in list(self._cubes.items()))
+        updated._size_distributions = {
+            group_by: distribution.updated(updated.store, changed_rows) for group_by, distribution in list(self._size_distributions.items())
+        }
+        updated.version = self.version + 1
+        updated.delta = delta
+        latest = self._latest_modification(delta)
+        updated.high_water_mark = self.high_water_mark if latest is None or (self.high_water_mark is not None and self.high_water_mark >= latest) else latest
+        updated._time_series = OrderedDict()
+        updated._features = None
+        updated._hour_cache = {}
+        return updated
+
+    def _discovery_times(self, location: str = None):
+        """
+        Returns the non-null FireDiscoveryDateTime values, of the incidents matching the location if one is given.
+        """
+        store = self.store
+        selected = store.not_null('FireDiscoveryDateTime')
+
+        if location is not None:
+            in_location = self.location_index.search(location)
+            if len(in_location) == 0:
+                return None
+            selected = in_location[selected[in_location]]
+
+        return store.values('FireDiscoveryDateTime')[selected]
+
+    def get_incident_hours_by_timezone(self, location: str = None, timezones: list = ('US/Pacific',)) -> dict:
+        """
+        Counts incidents by local hour of FireDiscoveryDateTime for several time zones at once.
+        The incidents are selected once and every zone is a vectorized pass over their timestamps,
+        with daylight saving handled through the zone's UTC offset transitions. Results are
+        memoized per location, time zone and data version.
+
+        Parameters:
+        - location (str, optional): Filters incidents by a specified location. Defaults to None.
+        - timezones (list, optional): The time zones to count in. Defaults to ('US/Pacific',).
+
+        Returns:
+        - dict: Each time zone mapped to a dictionary of hours (0-23) and incident counts,
+          or an empty dictionary if the location matches no incident.
+        """
+        location_key = None if location is None else normalize(location)
+        # read into locals once: other threads may clear the shared cache at any time
+        histograms = {tz: self._hour_cache.get((location_key, tz, self.version)) for tz in timezones}
+        missing = [tz for tz, histogram in histograms.items() if histogram is None]
+        for tz in timezones:
+            metrics.cache_lookup('hours', tz not in missing)
+
+        if missing and location is None:
+            for tz in missing:
+                counts = self.analytics_cube(tz).table(('hour',)).tolist()
+                histograms[tz] = {hour: count for hour, count in enumerate(counts) if count}
+        elif missing:
+            timestamps = self._discovery_times(location)
+            if timestamps is None:
+                print("Could not find specified location")
+                return {}
+            for tz in missing:
+                histograms[tz] = hour_histogram(timestamps, tz)
+
+        if missing:
+            if len(self._hour_cache) + len(missing) > HOUR_CACHE_SIZE:
+                self._hour_cache.clear()
+            for tz in missing:
+                self._hour_cache[(location_key, tz, self.version)] = histograms[tz]
+
+        return {tz: dict(histograms[tz]) for tz in timezones}
+
+    def get_incident_hours_by_group(self, location: str = None, timezone: str = 'US/Pacific', group_by: str = 'county') -> dict:
+        """
+        Counts incidents by local hour of FireDiscoveryDateTime separately for each county, cause or month.
+        Without a location the counts are read from the analytics cube; with one, only the
+        matching incidents are counted.
+
+        Parameters:
+        - location (str, optional): Filters incidents by a specified location. Defaults to None.
+        - timezone (str, optional): The time zone to count in. Defaults to 'US/Pacific'.
+        - group_by (str, optional): 'county', 'cause' or 'month'. Defaults to 'county'.
+
+        Returns:
+        - dict: Each group with incidents (a county or cause name, None for a missing value, or a
+          month 1-12) mapped to a dictionary of hours (0-23) and incident counts.
+        """
+        if group_by not in ('county', 'cause', 'month'):
+            raise ValueError(f"Cannot group by '{group_by}'. Use one of: county, cause, month")
+
+        if location is None:
+            table = self.analytics_cube(timezone).table((group_by, 'hour'))
+        else:
+            rows = self.location_index.search(location)
+            if len(rows) == 0:
+                print("Could not find specified location")
+                return {}
+            table = count_table(self.store, rows, timezone, (group_by, 'hour'))
+
+        return hour_counts_by_group(self.store, table, group_by)
 
     def get_incident_hours(self, location: str = None, timezone: str = 'US/Pacific') -> dict:
         """
         Extracts the hour of the day from FireDiscoveryDateTime for incidents.
         Converts UTC timestamps to the specified local time zone.
-        If a location is provided, filters incidents by location.
+        If a location is provided, filters incidents by location, matching it case-insensitively
+        against POOCity, POOCounty, IncidentShortDescription and IncidentName.
 
          Parameters:
         - location (str, optional): Filters incidents by a specified location. Defaults to None.
@@ -34,58 +309,24 @@ class ArcGISResponse:
         Returns:
         Returns a dictionary with hours (0-23) as keys and incident counts as values.
         """
-        hour_count = defaultdict(int)  # Initialize a dictionary to count incidents by hour
-
-        collection = []
-
-        # Filter features by location if provided
-        if location is not None:
-            temp_collection = [
-                f for f in self.features
-                if (f.IncidentShortDescription is not None and location in f.IncidentShortDescription) or
-                    (f.POOCity is not None and location in f.POOCity)
-            ]
-            if len(temp_collection) == 0:
-                print("Could not find specified location")
-                return {}
-            else:
-                collection = temp_collection
-        else:
-            collection = self.features
-
-        # Define the time zone
-        tz = pytz.timezone(timezone)
-
-        # Extract the hour of the day from FireDiscoveryDateTime and convert to local time
-        for feature in collection:
-            if feature.FireDiscoveryDateTime is not None and isinstance(feature.FireDiscoveryDateTime, (int, float)):
-                timestamp_seconds = feature.FireDiscoveryDateTime / 1000
-                # Get UTC time
-                utc_time = datetime.utcfromtimestamp(timestamp_seconds)  
-                # Convert to local time
-                local_time = utc_time.replace(tzinfo=pytz.utc).astimezone(tz)  
-                # Extract the hour (0-23)
-                hour = local_time.hour
-                # Increment the count for this hour
-                hour_count[hour] += 1  
-
-        return hour_count
+        return self.get_incident_hours_by_timezone(location, [timezone]).get(timezone, {})
     
     # You can either specify the location (str) and the timeZone (str) ['US/Pacific', 'US/Eastern', 'US/Central', 'US/Mountain']
     # or leave the field empty, which by default the location = None and the timeZone = 'US/Pacific'
     # Example: arcgis_response.plot_incident_hours("Ventura", 'US/Pacific')
     # arcgis_response.plot_incident_hours()
-    def plot_incident_hours(self, location: str = None, timezone: str = 'US/Pacific', save_path: str = None):
+    def plot_incident_hours(self, location: str = None, timezone: str = 'US/Pacific', save_path: str = None, format: str = 'png'):
         """
         Plots the frequency of incidents by hour of the day and saves the plot as an image if a path is provided.
         
         Parameters:
         - location (str, optional): Filters incidents by a specified location. Defaults to None.
         - timezone (str, optional): Specifies the time zone for converting timestamps. Defaults to 'US/Pacific'.
-        - save_path (str, optional): Path to save the plot image. If not provided, the plot will not be saved.
+        - save_path (str, optional): Path to save the plot image. If not provided, the image is returned as bytes.
+        - format (str, optional): Image format, 'png' or 'svg'. Defaults to 'png'.
         
         Returns:
-        - str or None: The path to the saved plot image if save_path is provided; otherwise, None.
+        - str, bytes or None: The path to the saved plot image if save_path is provided; otherwise the image bytes. None if there is no data.
         """
         hour_count = self.get_incident_hours(location, timezone)
 
@@ -97,63 +338,57 @@ class ArcGISResponse:
         hours = sorted(hour_count.keys())
         counts = [hour_count[hour] for hour in hours]
 
-        # Plot the data
-        plt.figure()
-        plt.bar(hours, counts, color='skyblue')
-        plt.xlabel('Hour of the Day')
-        plt.ylabel('Number of Incidents')
-        plt.title(f'Incident Frequency by Hour of the Day ({location if location else "All Locations"})')
-        plt.xticks(range(24))  # Ensure all hours (0-23) are shown on the x-axis
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
+        image = plotRenderer.render(plotRenderer.draw_incident_hours, hours, counts, location, format=format)
+        return self._save_plot(image, save_path)
 
+    @staticmethod
+    def _save_plot(image: bytes, save_path: str = None):
         # Save the plot as an image
         if save_path:
-            plt.savefig(save_path)
-            plt.close()
+            with open(save_path, 'wb') as f:
+                f.write(image)
             return save_path
         else:
-            return None
+            return image
 
     def get_affected_areas(self):
         """
-        Retrieves a list of the sizes of incidents (e.g., affected areas in acres).
+        Retrieves the sizes of incidents (e.g., affected areas in acres).
         
         Returns:
-        - list: A list of incident sizes.
+        - numpy.ndarray: The non-null incident sizes.
         """
-        areas = [f.IncidentSize for f in self.features if hasattr(f, 'IncidentSize') and f.IncidentSize is not None]
-        return areas
+        return self.store.values('IncidentSize')[self.store.not_null('IncidentSize')]
 
-    def plot_affected_areas(self, save_path: str = None):
+    def get_ignition_sizes(self):
+        """
+        Retrieves the discovery time and size of the incidents that have both.
+
+        Returns:
+        - tuple: (discovery timestamps in epoch ms, incident sizes) as NumPy arrays.
+        """
+        store = self.store
+        selected = store.not_null('FireDiscoveryDateTime') & store.not_null('IncidentSize')
+        return store.values('FireDiscoveryDateTime')[selected], store.values('IncidentSize')[selected]
+
+    def plot_affected_areas(self, save_path: str = None, format: str = 'png'):
         """
         Plots the distribution of fire-affected areas and saves the plot as an image if a path is provided.
         
         Parameters:
-        - save_path (str, optional): Path to save the plot image. If not provided, the plot will not be saved.
+        - save_path (str, optional): Path to save the plot image. If not provided, the image is returned as bytes.
+        - format (str, optional): Image format, 'png' or 'svg'. Defaults to 'png'.
         
         Returns:
-        - str or None: The path to the saved plot image if save_path is provided; otherwise, None.
+        - str, bytes or None: The path to the saved plot image if save_path is provided; otherwise the image bytes. None if there is no data.
         """
         areas = self.get_affected_areas()
-        if not areas:
+        if len(areas) == 0:
             print("No data to plot.")
             return None
 
-        # Plot the data
-        plt.figure()
-        plt.hist(areas, bins=50, color='orange')
-        plt.xlabel('Affected Area (acres)')
-        plt.ylabel('Frequency')
-        plt.title('Distribution of Fire Affected Areas')
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
-
-        # Save the plot as an image
-        if save_path:
-            plt.savefig(save_path)
-            plt.close()
-            return save_path
-        else:
-            return None
+        image = plotRenderer.render(plotRenderer.draw_affected_areas, areas, format=format)
+        return self._save_plot(image, save_path)
 
 
     # Correlation between the time the fire was discovered and the size of the fire
@@ -165,57 +400,65 @@ class ArcGISResponse:
         Returns:
         - float or None: The correlation coefficient between discovery times and incident sizes, or None if insufficient data.
         """
-        data = []
-        for f in self.features:
-            if hasattr(f, 'FireDiscoveryDateTime') and f.FireDiscoveryDateTime is not None and hasattr(f, 'IncidentSize') and f.IncidentSize is not None:
-                data.append((f.FireDiscoveryDateTime, f.IncidentSize))
-
-        if not data:
+        ignition_times, areas = self.get_ignition_sizes()
+        # a correlation needs at least two points
+        if len(areas) < 2:
             return None
 
-        ignition_times = [d[0] for d in data]
-        areas = [d[1] for d in data]
-        
         # Calculate correlation
-        correlation_matrix = numpy.corrcoef(ignition_times, areas) if len(data) > 1 else None
+        correlation_matrix = numpy.corrcoef(ignition_times, areas)
         correlation = correlation_matrix[0, 1]  # Extract the correlation coefficient
         return correlation
 
-    def plot_correlation(self, save_path: str = None):
+    def plot_correlation(self, save_path: str = None, format: str = 'png'):
         """
         Plots the correlation between ignition time and final area and saves the plot as an image.
+        The incidents are drawn as a 2-D histogram of discovery time by size.
 
          Parameters:
-        - save_path (str, optional): Path to save the plot image. If not provided, the plot will not be saved.
+        - save_path (str, optional): Path to save the plot image. If not provided, the image is returned as bytes.
+        - format (str, optional): Image format, 'png' or 'svg'. Defaults to 'png'.
         
         Returns:
-        - str or None: The path to the saved plot image if save_path is provided; otherwise, None.
+        - str, bytes or None: The path to the saved plot image if save_path is provided; otherwise the image bytes. None if there is no data.
         """
-        data = []
-        for f in self.features:
-            if hasattr(f, 'FireDiscoveryDateTime') and f.FireDiscoveryDateTime is not None and hasattr(f, 'IncidentSize') and f.IncidentSize is not None:
-                data.append((f.FireDiscoveryDateTime, f.IncidentSize))
-
-        if not data:
+        ignition_times, areas = self.get_ignition_sizes()
+        if len(areas) == 0:
             print("No data to plot.")
             return None
 
-        ignition_times = [d[0] for d in data]
-        areas = [d[1] for d in data]
-
-        # Plot the data
-        plt.figure()
-        plt.scatter(ignition_times, areas, alpha=0.5)
-        plt.xlabel('Ignition Time (Timestamp)')
-        plt.ylabel('Affected Area (acres)')
-        plt.title('Correlation Between Ignition Time and Final Area')
-        plt.grid(linestyle='--', alpha=0.7)
-
-        # Save the plot as an image
+        image = plotRenderer.render(plotRenderer.draw_correlation, *time_size_histogram(ignition_times, areas), format=format)
         if save_path:
             print(f"Saving plot to: {save_path}")
-            plt.savefig(save_path)
-            plt.close()
-            return save_path
-        else:
+        return self._save_plot(image, save_path)
+
+    def time_series(self, frequency: str = 'month', timezone: str = 'US/Pacific') -> TimeSeries:
+        """
+        The incident counts and acreage per day, week or month of discovery, built on first use
+        for every version and kept for the last TIME_SERIES_CACHE_SIZE combinations used.
+        """
+        return _cached(self._time_series, (frequency, timezone),
+                       lambda: TimeSeries.build(self.store, frequency, timezone), TIME_SERIES_CACHE_SIZE)
+
+    def plot_time_series(self, frequency: str = 'month', timezone: str = 'US/Pacific', save_path: str = None, format: str = 'png'):
+        """
+        Plots the incidents and affected area per day, week or month and saves the plot as an image.
+        Series longer than plotRenderer.MAX_PLOT_PERIODS are merged into coarser periods.
+
+        Parameters:
+        - frequency (str, optional): 'day', 'week' or 'month'. Defaults to 'month'.
+        - timezone (str, optional): The time zone the periods are delimited in. Defaults to 'US/Pacific'.
+        - save_path (str, optional): Path to save the plot image. If not provided, the image is returned as bytes.
+        - format (str, optional): Image format, 'png' or 'svg'. Defaults to 'png'.
+
+        Returns:
+        - str, bytes or None: The path to the saved plot image if save_path is provided; otherwise the image bytes. None if there is no data.
+        """
+        series = self.time_series(frequency, timezone)
+        if len(series) == 0:
+            print("No data to plot.")
             return None
+
+        starts, counts, acres = series.downsampled(plotRenderer.MAX_PLOT_PERIODS)
+        image = plotRenderer.render(plotRenderer.draw_time_series, starts, counts, acres, frequency, format=format)
+        return self._save_plot(image, save_path)
@@ -0,0 +1,285 @@
+"""
+Asynchronous download of a layer query.
+
+All the page requests of a download are scheduled at once on an event loop and at most
+`concurrency` of them are in flight at a time over a persistent connection pool. Each page
+is decoded as soon as it arrives, in a worker thread, so decoding overlaps with the pages
+still downloading.
+
+With aiohttp installed the pages are fetched by an aiohttp ClientSession, which negotiates
+gzip. Without it the pooled, retrying requests session of `ingestion` serves the same
+requests from a bounded thread pool, decoding each body while it streams in.
+
+`fetch_all` returns the usual payload of feature dictionaries; `fetch_store` decodes the
+pages straight into columns instead. Both run the download from synchronous code.
+"""
+import asyncio
+import io
+import json
+import threading
+
+import requests
+
+import columnDecoder
+import ingestion
+import metrics
+from featureStore import FeatureStore
+from field import Field
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+DEFAULT_CONCURRENCY = 8
+
+# statuses worth retrying, as in ingestion.create_session
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def decode_page(body: bytes) -> dict:
+    """
+    Decodes an ArcGIS JSON payload, turning an 'error' body into a ValueError like ingestion.fetch_json.
+    """
+    with metrics.stage('parse'):
+        data = json.loads(body)
+    if 'error' in data:
+        raise ValueError(f"ArcGIS query failed: {data['error']}")
+    return data
+
+
+class AiohttpTransport:
+    """
+    Fetches pages over one aiohttp connection pool of `concurrency` connections.
+    """
+    def __init__(self, concurrency: int, timeout: float, retries: int = ingestion.DEFAULT_RETRIES,
+                 backoff_factor: float = ingestion.DEFAULT_BACKOFF):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=concurrency),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            headers={'Accept-Encoding': 'gzip, deflate'},
+        )
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+    async def _get_body(self, url: str) -> bytes:
+        with metrics.stage('fetch'):
+            return await self._get_body_retrying(url)
+
+    async def _get_body_retrying(self, url: str) -> bytes:
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.session.get(url) as response:
+                    if response.status in RETRY_STATUSES and attempt < self.retries:
+                        await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+                        continue
+                    response.raise_for_status()
+                    return await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    # callers handle download failures as requests errors, whatever the transport
+                    raise requests.RequestException(f"{url}: {e!r}") from e
+                await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+
+    async def get_json(self, url: str) -> dict:
+        body = await self._get_body(url)
+        return await asyncio.to_thread(decode_page, body)
+
+    async def get_decoded(self, url: str, decode):
+        body = await self._get_body(url)
+        return await asyncio.to_thread(self._decode, decode, body)
+
+    @staticmethod
+    def _decode(decode, body: bytes):
+        with metrics.stage('parse'):
+            return decode(io.BytesIO(body))
+
+    async def close(self):
+        await self.session.close()
+
+
+class ThreadTransport:
+    """
+    Fetches pages with ingestion's pooled requests session, one worker thread per request in flight.
+    """
+    def __init__(self, concurrency: int, timeout: float):
+        self.session = ingestion.create_session(pool_size=concurrency)
+        self.timeout = timeout
+
+    async def get_json(self, url: str) -> dict:
+        return await asyncio.to_thread(ingestion.fetch_json, self.session, url, self.timeout)
+
+    def _get_decoded(self, url: str, decode):
+        # the fetch stage ends with the headers: the body is decoded while it arrives, so the
+        # rest of the transfer is counted in the parse stage rather than in both
+        with metrics.stage('fetch'):
+            response = self.session.get(url, timeout=self.timeout, stream=True)
+        with response:
+            response.raise_for_status()
+            # gzip is undone on the way
+            response.raw.decode_content = True
+            with metrics.stage('parse'):
+                return decode(response.raw)
+
+    async def get_decoded(self, url: str, decode):
+        return await asyncio.to_thread(self._get_decoded, url, decode)
+
+    async def close(self):
+        self.session.close()
+
+
+def create_transport(concurrency: int = DEFAULT_CONCURRENCY, timeout: float = ingestion.DEFAULT_TIMEOUT):
+    """
+    Returns the aiohttp transport if aiohttp is installed, the requests based one otherwise.
+    """
+    if aiohttp is not None:
+        return AiohttpTransport(concurrency, timeout)
+    return ThreadTransport(concurrency, timeout)
+
+
+async def plan_pages(transport, url: str, strategy: str, first_page: dict, page_size: int) -> list:
+    """
+    Returns the urls of every page of a capped query: after the record count by resultOffset
+    ('offset'), or after the object ids by ranges of them ('oid').
+
+    Parameters:
+    - first_page (dict): The header of the first, capped, response.
+    - page_size (int): The number of features in that response, i.e. the server's record limit.
+    """
+    if page_size == 0:
+        raise ValueError("Server reported exceededTransferLimit on an empty page")
+
+    if strategy == 'offset':
+        object_id_field = first_page.get('objectIdFieldName')
+        if not object_id_field:
+            object_id_field = (await transport.get_json(ingestion.with_params(url, returnIdsOnly='true')))['objectIdFieldName']
+        record_count = (await transport.get_json(ingestion.with_params(url, returnCountOnly='true')))['count']
+        return ingestion.offset_page_urls(url, page_size, record_count, object_id_field)
+
+    ids = await transport.get_json(ingestion.with_params(url, returnIdsOnly='true'))
+    return ingestion.oid_page_urls(url, page_size, ids['objectIdFieldName'], sorted(ids.get('objectIds') or []))
+
+
+async def fetch_all_async(url: str, strategy: str = 'offset', concurrency: int = DEFAULT_CONCURRENCY,
+                          timeout: float = ingestion.DEFAULT_TIMEOUT, on_page=None) -> dict:
+    """
+    Downloads every record of a layer query, following exceededTransferLimit.
+    The first page is requested normally. If the server reports that it capped the result,
+    the size of that page is taken as its record limit, the remaining pages are planned by
+    plan_pages and requested concurrently.
+
+    Parameters:
+    - url (str): The layer query url.
+    - strategy (str, optional): 'offset' or 'oid'. Defaults to 'offset'.
+    - concurrency (int, optional): Maximum number of requests in flight. Defaults to DEFAULT_CONCURRENCY.
+    - timeout (float, optional): Timeout of each request, in seconds. Defaults to ingestion.DEFAULT_TIMEOUT.
+    - on_page (callable, optional): Called with (page number, decoded page) as each page arrives,
+      in arrival order.
+
+    Returns:
+    - dict: A payload in the shape of a single query response, holding all the features in page order.
+    """
+    if strategy not in ('offset', 'oid'):
+        raise ValueError(f"Unknown paging strategy: {strategy}")
+
+    transport = create_transport(concurrency, timeout)
+    try:
+        first_page = await transport.get_json(url)
+        if not first_page.get('exceededTransferLimit'):
+            if on_page is not None:
+                on_page(0, first_page)
+            return first_page
+
+        page_urls = await plan_pages(transport, url, strategy, first_page, len(first_page['features']))
+        limit = asyncio.Semaphore(concurrency)
+
+        async def fetch_page(number: int, page_url: str):
+            async with limit:
+                page = await transport.get_json(page_url)
+            if on_page is not None:
+                on_page(number, page)
+            return page
+
+        pages = await asyncio.gather(*(fetch_page(number, page_url) for number, page_url in enumerate(page_urls)))
+        return ingestion.merge_pages(first_page, pages)
+    finally:
+        await transport.close()
+
+
+async def fetch_store_async(url: str, strategy: str = 'offset', concurrency: int = DEFAULT_CONCURRENCY,
+                            timeout: float = ingestion.DEFAULT_TIMEOUT) -> tuple:
+    """
+    Downloads every record of a layer query straight into columns.
+    Each page is decoded by columnDecoder as it streams in, so no page is ever held as a
+    list of feature dictionaries, and the pages are concatenated once all have arrived.
+
+    Returns:
+    - tuple: (the header of the query response, the FeatureStore of all the features in page order)
+    """
+    if strategy not in ('offset', 'oid'):
+        raise ValueError(f"Unknown paging strategy: {strategy}")
+
+    transport = create_transport(concurrency, timeout)
+    try:
+        header, first_store = await transport.get_decoded(url, columnDecoder.decode_store)
+        if not header.get('exceededTransferLimit'):
+            return header, first_store
+
+        page_urls = await plan_pages(transport, url, strategy, header, len(first_store))
+        fields = [Field(**field) for field in header.get('fields', [])]
+        del first_store
+
+        limit = asyncio.Semaphore(concurrency)
+
+        async def fetch_page(page_url: str):
+            async with limit:
+                _, store = await transport.get_decoded(page_url, lambda stream: columnDecoder.decode_store(stream, fields))
+            return store
+
+        stores = await asyncio.gather(*(fetch_page(page_url) for page_url in page_urls))
+        header['exceededTransferLimit'] = False
+        return header, FeatureStore.concatenate(stores)
+    finally:
+        await transport.close()
+
+
+def run_sync(coroutine):
+    """
+    Runs a coroutine to completion from synchronous code and returns its result.
+    If the calling thread already runs an event loop, the coroutine runs on its own loop in a helper thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = asyncio.run(coroutine)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run, name='async-ingestion')
+    thread.start()
+    thread.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def fetch_all(url: str, strategy: str = 'offset', concurrency: int = DEFAULT_CONCURRENCY,
+              timeout: float = ingestion.DEFAULT_TIMEOUT, on_page=None) -> dict:
+    """
+    Synchronous entry point of fetch_all_async.
+    """
+    return run_sync(fetch_all_async(url, strategy, concurrency, timeout, on_page))
+
+
+def fetch_store(url: str, strategy: str = 'offset', concurrency: int = DEFAULT_CONCURRENCY,
+                timeout: float = ingestion.DEFAULT_TIMEOUT) -> tuple:
+    """
+    Synchronous entry point of fetch_store_async.
+    """
+    return run_sync(fetch_store_async(url, strategy, concurrency, timeout))
@@ -0,0 +1,414 @@
+"""
+Benchmarks of the ingestion, the main.py functions and the Flask routes on synthetic layers.
+
+For every size, a synthetic layer is written by syntheticData, served by standInServer in a
+process of its own and measured in another fresh process, so the peak RSS reported for a size
+covers that size only. The results are saved as JSON, named after the time and the git
+revision, and two result files can be compared to spot regressions between versions.
+
+Usage:
+    python benchmark.py --sizes 10000 100000 1000000 --output benchmarks
+    python benchmark.py --compare benchmarks/<before>.json benchmarks/<after>.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+import syntheticData
+
+DEFAULT_SIZES = (10000, 100000)
+
+# timed calls of every case after the first, cold, one
+REPEAT = 20
+
+# record cap of the stand-in server
+MAX_RECORD_COUNT = 2000
+
+# a case is reported as a regression when its median grows by more than this factor
+REGRESSION_THRESHOLD = 1.2
+
+# seconds to wait for the stand-in server to load a layer
+SERVER_START_TIMEOUT = 600
+
+# cumulative import time budgets in milliseconds, measured with `python -X importtime`
+IMPORT_BUDGETS_MS = {
+    'main': 500,
+    'flask_app': 750,
+}
+
+# modules that must only be imported on first use, never when the app starts
+LAZY_MODULES = ('matplotlib',)
+
+# runs of `python -X importtime` per module; the fastest one is kept
+IMPORT_RUNS = 5
+
+# query string of every route; routes missing here are requested without parameters
+ROUTE_QUERIES = {
+    '/fires/location': 'location=Ventura',
+    '/fires/date': 'start_date=2020-07-01&end_date=2020-07-31',
+    '/fires/areas': 'limit=1000',
+    '/fires/query': 'min_size=10&location=Riverside&cause=Human&order_by=size',
+    '/fires/bbox': 'min_lon=-119&min_lat=33&max_lon=-116&max_lat=35',
+    '/fires/near': 'lat=34.36&lon=-119.13&radius_km=50',
+    '/plots/incident_hours': 'location=Ventura&timezone=US/Pacific',
+    '/plots/affected_areas': '',
+    '/plots/correlation': '',
+    '/analysis/ignition_times': 'location=Ventura&timezone=US/Pacific&group_by=cause',
+    '/analysis/affected_areas': 'group_by=county&percentiles=50,90,99',
+    '/analysis/time_series': 'frequency=week&window=8',
+    '/plots/time_series': 'frequency=day',
+}
+
+
+def main_cases() -> dict:
+    """
+    Returns a call of every public data function of main.py, by name.
+    """
+    import main
+    from fireQuery import FireQuery
+
+    return {
+        'get_larger_areas': lambda: main.get_larger_areas(),
+        'get_features_matching': lambda: main.get_features_matching(FireQuery(min_size=10, location='Riverside', causes=['Human'], order_by='size')),
+        'get_features_by_location': lambda: main.get_features_by_location('Ventura'),
+        'get_features_between_date_range': lambda: main.get_features_between_date_range(datetime(2020, 7, 1), datetime(2020, 7, 31)),
+        'get_features_in_bbox': lambda: main.get_features_in_bbox(-119, 33, -116, 35),
+        'get_features_near': lambda: main.get_features_near(34.36, -119.13, 50),
+        'analyze_affected_areas': lambda: main.analyze_affected_areas(group_by='county', percentiles=[50, 90, 99]),
+        'analyze_ignition_times': lambda: main.analyze_ignition_times('Ventura', 'US/Pacific', 'cause'),
+        'analyze_ignition_times_by_timezone': lambda: main.analyze_ignition_times_by_timezone(None, ['US/Pacific', 'US/Mountain', 'UTC']),
+        'analyze_batch': lambda: main.analyze_batch([{'location': county, 'timezone': timezone, 'group_by': 'cause', 'threshold': threshold}
+                                                     for county, *_ in syntheticData.COUNTIES[:10] for timezone in ('US/Pacific', 'UTC')
+                                                     for threshold in (100, 1000)]),
+        'analyze_time_series': lambda: main.analyze_time_series('week', 'US/Pacific', 'Ventura', window=8),
+        'plot_incident_hours': lambda: main.plot_incident_hours('Ventura', 'US/Pacific'),
+        'plot_affected_areas': lambda: main.plot_affected_areas(),
+        'plot_correlation': lambda: main.plot_correlation(),
+        'plot_time_series': lambda: main.plot_time_series('day'),
+    }
+
+
+def route_cases() -> dict:
+    """
+    Returns a request to every GET route of the Flask app, by path. Responses are read to the end,
+    so streamed bodies are serialized within the measurement.
+    """
+    from flask_app import app
+
+    client = app.test_client()
+    cases = {}
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static' or 'GET' not in rule.methods:
+            continue
+        url = f"{rule.rule}?{ROUTE_QUERIES.get(rule.rule, '')}"
+        cases[rule.rule] = lambda url=url: client.get(url).get_data()
+    return cases
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of this process, in MiB.
+    """
+    # getrusage keeps the peak of the parent across fork and exec, the high water mark of /proc does not
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def timed(call, repeat: int = REPEAT) -> dict:
+    """
+    Times a first call and `repeat` more.
+
+    Returns:
+    - dict: The first call and the min, median, p95 and mean of the others, in milliseconds.
+    """
+    start = time.perf_counter()
+    call()
+    first = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'first_ms': first,
+        'min_ms': timings[0],
+        'median_ms': statistics.median(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'mean_ms': statistics.fmean(timings),
+    }
+
+
+def measure(url: str, repeat: int = REPEAT) -> dict:
+    """
+    Downloads the layer served at `url` like the application does and times every case on it.
+    Meant to run in a fresh process, see benchmark.
+
+    Returns:
+    - dict: Ingestion and snapshot timings, peak RSS figures and the timings of every case.
+    """
+    import ingestion
+    import main
+    import snapshot
+
+    result = {'rss_baseline_mb': peak_rss_mb()}
+    main.BASE_URL = ingestion.with_params(url, outFields=ingestion.query_param(main.BASE_URL, 'outFields'))
+    main.SNAPSHOT_DIR = tempfile.mkdtemp(prefix='benchmark-snapshot-')
+
+    start = time.perf_counter()
+    dataset = main.download()
+    result['ingestion_s'] = time.perf_counter() - start
+    result['rss_ingestion_mb'] = peak_rss_mb()
+    result['incidents'] = len(dataset.store)
+    main._dataset.publish(dataset)
+
+    start = time.perf_counter()
+    main.save_snapshot(dataset)
+    result['snapshot_save_s'] = time.perf_counter() - start
+    start = time.perf_counter()
+    snapshot.load(main.SNAPSHOT_DIR)
+    result['snapshot_load_s'] = time.perf_counter() - start
+
+    result['main'] = {name: timed(call, repeat) for name, call in main_cases().items()}
+    result['routes'] = {path: timed(call, repeat) for path, call in route_cases().items()}
+    result['rss_peak_mb'] = peak_rss_mb()
+    return result
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, server: subprocess.Popen, timeout: float = SERVER_START_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("The stand-in server exited before serving")
+        try:
+            requests.get(url, params={'returnCountOnly': 'true'}, timeout=5)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError("The stand-in server did not start in time")
+
+
+def revision() -> str:
+    """
+    Returns the short git revision of the working tree, with '-dirty' if it has local changes, or 'unknown'.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory, stderr=subprocess.DEVNULL, text=True).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], cwd=directory, stderr=subprocess.DEVNULL) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def benchmark_size(size: int, seed: int = 0, repeat: int = REPEAT, max_record_count: int = MAX_RECORD_COUNT) -> dict:
+    """
+    Generates, serves and measures a synthetic layer of `size` incidents.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as directory:
+        layer = os.path.join(directory, 'layer.json')
+        start = time.perf_counter()
+        with open(layer, 'w') as f:
+            syntheticData.write(f, size, seed)
+        generation = time.perf_counter() - start
+
+        port = free_port()
+        url = f"http://127.0.0.1:{port}/query?where=1%3D1&f=json"
+        server = subprocess.Popen([sys.executable, os.path.join(here, 'standInServer.py'), layer, '--port', str(port),
+                                   '--max-record-count', str(max_record_count)], stdout=subprocess.DEVNULL)
+        try:
+            wait_for(url, server)
+            output = os.path.join(directory, 'result.json')
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', url, '--repeat', str(repeat), '--result', output],
+                           cwd=directory, check=True)
+            with open(output) as f:
+                result = json.load(f)
+        finally:
+            server.terminate()
+            server.wait()
+
+    result['generation_s'] = generation
+    return result
+
+
+def benchmark(sizes: list, output: str, seed: int = 0, repeat: int = REPEAT, max_record_count: int = MAX_RECORD_COUNT) -> str:
+    """
+    Runs the benchmarks at every size and saves the results.
+
+    Parameters:
+    - sizes (list): Numbers of incidents, e.g. [10000, 100000, 5000000].
+    - output (str): Directory the results are saved to.
+    - seed (int, optional): Seed of the synthetic layers. Defaults to 0.
+    - repeat (int, optional): Timed calls per case after the first one. Defaults to REPEAT.
+    - max_record_count (int, optional): Record cap of the stand-in server. Defaults to MAX_RECORD_COUNT.
+
+    Returns:
+    - str: The path of the saved results.
+    """
+    created = datetime.now()
+    results = {
+        'created': created.isoformat(timespec='seconds'),
+        'revision': revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'repeat': repeat,
+        'max_record_count': max_record_count,
+        'imports_ms': {module: import_times(module)['total_ms'] for module in IMPORT_BUDGETS_MS},
+        'sizes': {},
+    }
+    for size in sizes:
+        print(f"-- BENCHMARKING {size} INCIDENTS --")
+        results['sizes'][str(size)] = benchmark_size(size, seed, repeat, max_record_count)
+
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, f"{created.strftime('%Y%m%d-%H%M%S')}-{results['revision']}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def import_times(module: str, runs: int = IMPORT_RUNS) -> dict:
+    """
+    Measures the import of a module in fresh interpreters with `python -X importtime`.
+
+    Parameters:
+    - module (str): The module to import, e.g. 'flask_app'.
+    - runs (int, optional): Interpreters to start; the fastest run is kept. Defaults to IMPORT_RUNS.
+
+    Returns:
+    - dict: The cumulative milliseconds of the import, the modules it loaded with their
+      cumulative milliseconds, and the LAZY_MODULES it loaded.
+    """
+    fastest = None
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                   capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if completed.returncode != 0:
+            raise ValueError(f"Importing {module} failed:\n{completed.stderr}")
+        loaded = {}
+        for line in completed.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            loaded[name.strip()] = int(cumulative) / 1000
+        if fastest is None or loaded[module] < fastest[module]:
+            fastest = loaded
+    lazy = sorted(name for name in fastest if name.split('.')[0] in LAZY_MODULES)
+    return {'total_ms': fastest[module], 'modules': fastest, 'lazy_modules_loaded': lazy}
+
+
+def check_imports(budgets: dict = IMPORT_BUDGETS_MS, heaviest: int = 10) -> list:
+    """
+    Prints the import time of every budgeted module and its heaviest top-level imports.
+
+    Returns:
+    - list: The modules over their budget or loading one of the LAZY_MODULES.
+    """
+    failures = []
+    for module, budget in budgets.items():
+        measured = import_times(module)
+        over = measured['total_ms'] > budget
+        print(f"-- IMPORT {module}: {measured['total_ms']:.1f} ms of {budget} ms{' OVER BUDGET' if over else ''} --")
+        top_level = {name: ms for name, ms in measured['modules'].items() if '.' not in name and name != module}
+        for name, ms in sorted(top_level.items(), key=lambda item: -item[1])[:heaviest]:
+            print(f"{name:40} {ms:10.1f}")
+        if measured['lazy_modules_loaded']:
+            print(f"-- {module} LOADED {', '.join(measured['lazy_modules_loaded'][:5])} AT IMPORT --")
+        if over or measured['lazy_modules_loaded']:
+            failures.append(module)
+    return failures
+
+
+def compare(before: dict, after: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    """
+    Prints the change of every figure measured in both results, at the sizes measured in both.
+
+    Returns:
+    - list: (size, name) of the figures that grew by more than `threshold` times.
+    """
+    regressions = []
+    imports = [(module, before['imports_ms'][module], after['imports_ms'][module])
+               for module in before.get('imports_ms', {}) if module in after.get('imports_ms', {})]
+    if imports:
+        print(f"-- IMPORTS: {before['revision']} -> {after['revision']} --")
+    for name, old_value, new_value in imports:
+        ratio = new_value / old_value if old_value else float('inf')
+        flag = ' REGRESSION' if ratio > threshold else ''
+        print(f"{'import ' + name:40} {old_value:12.3f} {new_value:12.3f} {ratio:8.2f}x{flag}")
+        if flag:
+            regressions.append(('imports', name))
+    for size in sorted(set(before['sizes']) & set(after['sizes']), key=int):
+        old, new = before['sizes'][size], after['sizes'][size]
+        figures = [(name, old[name], new[name]) for name in ('ingestion_s', 'snapshot_save_s', 'snapshot_load_s', 'rss_ingestion_mb', 'rss_peak_mb')
+                   if name in old and name in new]
+        for group in ('main', 'routes'):
+            figures.extend((name, old[group][name]['median_ms'], new[group][name]['median_ms'])
+                           for name in old.get(group, {}) if name in new.get(group, {}))
+
+        print(f"-- {size} INCIDENTS: {before['revision']} -> {after['revision']} --")
+        for name, old_value, new_value in figures:
+            ratio = new_value / old_value if old_value else float('inf')
+            flag = ' REGRESSION' if ratio > threshold else ''
+            print(f"{name:40} {old_value:12.3f} {new_value:12.3f} {ratio:8.2f}x{flag}")
+            if flag:
+                regressions.append((size, name))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark ingestion, queries and routes on synthetic layers.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='Numbers of incidents to benchmark.')
+    parser.add_argument('--output', default='benchmarks', help='Directory the results are saved to.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--max-record-count', type=int, default=MAX_RECORD_COUNT)
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two saved results instead.')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--imports', action='store_true', help='Check the import times against IMPORT_BUDGETS_MS instead.')
+    parser.add_argument('--measure', metavar='URL', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # the child process of benchmark_size
+        measured = measure(args.measure, args.repeat)
+        with open(args.result, 'w') as f:
+            json.dump(measured, f)
+    elif args.imports:
+        sys.exit(1 if check_imports() else 0)
+    elif args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        sys.exit(1 if compare(before, after, args.threshold) else 0)
+    else:
+        print(benchmark(args.sizes, args.output, args.seed, args.repeat, args.max_record_count))
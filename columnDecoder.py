@@ -0,0 +1,176 @@
+"""
+Decoding of ArcGIS query payloads straight into columns.
+
+The body is read from a binary stream a block at a time. Header members (fields,
+spatialReference, ...) are decoded whole, while the features array is decoded one feature
+at a time and converted into typed column chunks every BATCH_SIZE features. Only one batch
+of feature dictionaries exists at any moment, so peak memory stays close to the size of the
+columns. The columns follow the `fields` schema of the payload itself: attributes missing
+from the schema are ignored and values that do not fit their field become nulls.
+"""
+import codecs
+import json
+
+from featureStore import FeatureStore
+from field import Field
+
+# bytes read from the stream at a time
+READ_SIZE = 64 * 1024
+
+# features converted to columns at a time
+BATCH_SIZE = 1000
+
+WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """
+    A text buffer over a binary stream, refilled as values are decoded from it.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.position = 0
+        self.exhausted = False
+
+    def fill(self) -> bool:
+        if self.exhausted:
+            return False
+        block = self.stream.read(READ_SIZE)
+        self.exhausted = not block
+        self.buffer = self.buffer[self.position:] + self.text.decode(block or b'', final=self.exhausted)
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Returns the next non-whitespace character without consuming it, '' at the end of the stream.
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ''
+
+    def take(self, expected: str = None) -> str:
+        character = self.peek()
+        if expected is not None and character != expected:
+            raise ValueError(f"Malformed JSON payload: expected '{expected}' at '{self.buffer[self.position:self.position + 20]}'")
+        self.position += 1
+        return character
+
+    def value(self):
+        """
+        Decodes the next JSON value, reading more of the stream until it is complete.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as e:
+                if self.fill():
+                    continue
+                raise ValueError(f"Malformed JSON payload: {e}")
+            # a number running up to the end of the buffer may continue in the next block
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.position = end
+            return value
+
+
+def decode(stream, on_features, batch_size: int = BATCH_SIZE, header: dict = None) -> dict:
+    """
+    Decodes a query payload from a binary stream, handing its features over in batches.
+
+    Parameters:
+    - stream: A binary file-like object (an open file, a raw HTTP response, ...).
+    - on_features (callable): Receives each batch of raw features, in order.
+    - batch_size (int, optional): Features per batch. Defaults to BATCH_SIZE.
+    - header (dict, optional): Filled with the other members as they are decoded, so
+      `on_features` can already use the ones that precede the features.
+
+    Returns:
+    - dict: The other members of the payload.
+    """
+    reader = _Reader(stream)
+    header = {} if header is None else header
+    reader.take('{')
+    if reader.peek() == '}':
+        return header
+
+    while True:
+        key = reader.value()
+        reader.take(':')
+        if key == 'features':
+            reader.take('[')
+            batch = []
+            if reader.peek() == ']':
+                reader.take()
+            else:
+                while True:
+                    batch.append(reader.value())
+                    if len(batch) >= batch_size:
+                        on_features(batch)
+                        batch = []
+                    if reader.take() == ']':
+                        break
+                    reader.position -= 1
+                    reader.take(',')
+            if batch:
+                on_features(batch)
+        else:
+            header[key] = reader.value()
+
+        if reader.take() == '}':
+            return header
+        reader.position -= 1
+        reader.take(',')
+
+
+def decode_store(stream, fields: list = None, batch_size: int = BATCH_SIZE) -> tuple:
+    """
+    Decodes a query payload from a binary stream into a FeatureStore.
+
+    Parameters:
+    - stream: A binary file-like object.
+    - fields (list, optional): Field objects to build the columns from. Taken from the payload if not given.
+    - batch_size (int, optional): Features converted to columns at a time. Defaults to BATCH_SIZE.
+
+    Returns:
+    - tuple: (the other members of the payload, the FeatureStore of its features)
+
+    Raises:
+    - ValueError: If the payload is malformed or is an ArcGIS error.
+    """
+    header = {}
+    chunks = []
+    pending = []
+
+    def schema():
+        nonlocal fields
+        if fields is None and 'fields' in header:
+            fields = [Field(**field) for field in header['fields']]
+        return fields
+
+    def on_features(batch):
+        current = schema()
+        if current is None:
+            # the fields came after the features; convert once they are known
+            pending.append(batch)
+        else:
+            chunks.append(FeatureStore.from_features(current, batch))
+
+    decode(stream, on_features, batch_size, header)
+    if 'error' in header:
+        raise ValueError(f"ArcGIS query failed: {header['error']}")
+
+    current = schema() or []
+    chunks.extend(FeatureStore.from_features(current, batch) for batch in pending)
+    if not chunks:
+        return header, FeatureStore.from_features(current, [])
+    return header, chunks[0] if len(chunks) == 1 else FeatureStore.concatenate(chunks)
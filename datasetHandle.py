@@ -0,0 +1,85 @@
+import threading
+
+
+class DatasetHandle:
+    """
+    The reference to the dataset currently served.
+
+    Datasets are never modified once published: a refresh builds a new one with a higher
+    version and swaps the reference. Readers take `get()` once and keep working on that
+    dataset, without locks, while newer versions are published. The first load is single
+    flight: however many callers ask for the dataset before it exists, `load` runs once and
+    the others wait for its result.
+    """
+    def __init__(self, load):
+        """
+        Parameters:
+        - load (callable): Returns the initial dataset, or None if it could not be loaded.
+        """
+        self._load = load
+        self._current = None
+        self._load_lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+
+    @property
+    def current(self):
+        """
+        The dataset currently served, or None before the first load. Never loads.
+        """
+        return self._current
+
+    @property
+    def version(self):
+        """
+        The version of the dataset currently served, or None before the first load.
+        Versions only increase, so caches and ETags can key on them.
+        """
+        current = self._current
+        return None if current is None else current.version
+
+    def get(self):
+        """
+        Returns the dataset currently served, loading it on first use.
+
+        Returns:
+        - The dataset, or None if loading it failed; the next call tries again.
+        """
+        current = self._current
+        if current is not None:
+            return current
+
+        with self._load_lock:
+            if self._current is None:
+                dataset = self._load()
+                if dataset is not None:
+                    self.publish(dataset)
+            return self._current
+
+    def publish(self, dataset, replace: bool = False) -> bool:
+        """
+        Swaps in a newer dataset. The swap is a single reference assignment, so readers see
+        either the old or the new dataset, never a partially updated one.
+
+        Parameters:
+        - dataset: The dataset to serve.
+        - replace (bool, optional): Serve the dataset whatever its version, e.g. a full reload,
+          numbering it as the version after the one served. Defaults to False.
+
+        Returns:
+        - bool: False if the dataset is not newer than the one served, which is then kept.
+        """
+        with self._publish_lock:
+            current = self._current
+            if replace and current is not None:
+                dataset.version = current.version + 1
+            elif current is not None and dataset.version <= current.version:
+                return False
+            self._current = dataset
+            return True
+
+    def clear(self):
+        """
+        Forgets the dataset served, so the next `get()` loads it again.
+        """
+        with self._publish_lock:
+            self._current = None
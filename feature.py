@@ -1,31 +1,83 @@
-from geometry import *
+import sys
+from functools import lru_cache
+
+from geometry import Geometry
+
+
+def _to_int(value):
+    return int(value)
+
+
+def _to_float(value):
+    return float(value)
+
+
+def _to_string(value):
+    # the same county, cause, ... strings repeat across thousands of records
+    return sys.intern(value if isinstance(value, str) else str(value))
+
+
+# how an attribute of each column kind is converted when a record is built
+KIND_COERCIONS = {'date': _to_int, 'integer': _to_int, 'double': _to_float, 'string': _to_string}
+
 
 class Feature:
-    def __init__(self, ContainmentDateTime,ControlDateTime,IncidentSize,DiscoveryAcres,FinalAcres, FireCause,FireCauseSpecific,FireDiscoveryDateTime, FireOutDateTime, FireStrategyPointZonePercent, IncidentName, IncidentShortDescription, IncidentTypeKind, IsFireCauseInvestigated, IsFireCodeRequested, CreatedOnDateTime_dt, ModifiedOnDateTime_dt, SourceGlobalID, IncidentComplexityLevel, POOCity, POOCounty, SourceOID, FireStrategyMonitorPercent, InitialLatitude, InitialLongitude, geometry):
-        
-        self.SourceOID = SourceOID
-        self.ContainmentDateTime = ContainmentDateTime
-        self.ControlDateTime = ControlDateTime
-        self.IncidentSize = IncidentSize
-        self.DiscoveryAcres = DiscoveryAcres
-        self.FinalAcres = FinalAcres
-        self.FireCause = FireCause
-        self.FireCauseSpecific = FireCauseSpecific
-        self.FireDiscoveryDateTime = FireDiscoveryDateTime
-        self.FireOutDateTime = FireOutDateTime
-        self.FireStrategyPointZonePercent = FireStrategyPointZonePercent
-        self.IncidentName = IncidentName
-        self.IncidentShortDescription = IncidentShortDescription
-        self.IncidentTypeKind = IncidentTypeKind
-        self.IsFireCauseInvestigated = IsFireCauseInvestigated
-        self.IsFireCodeRequested = IsFireCodeRequested
-        self.CreatedOnDateTime_dt = CreatedOnDateTime_dt
-        self.ModifiedOnDateTime_dt = ModifiedOnDateTime_dt
-        self.SourceGlobalID = SourceGlobalID
-        self.IncidentComplexityLevel = IncidentComplexityLevel
-        self.FireStrategyMonitorPercent = FireStrategyMonitorPercent
-        self.InitialLatitude = InitialLatitude
-        self.InitialLongitude = InitialLongitude
-        self.POOCity = POOCity
-        self.POOCounty = POOCounty
-        self.geometry = Geometry(**geometry)
\ No newline at end of file
+    """
+    The base of the record classes generated from a layer's fields.
+
+    Each generated class lists its attribute names in `field_names` and stores them in
+    `__slots__`, so a record holds one pointer per attribute and no per-instance `__dict__`.
+    Attributes are coerced to the Python type of their field when the record is built:
+    dates to integer epoch milliseconds, doubles to float and strings interned.
+    """
+    __slots__ = ('geometry',)
+    field_names = ()
+    _coercions = ()
+
+    def __init__(self, geometry=None, **attributes):
+        """
+        Parameters:
+        - geometry (dict, optional): The point geometry ({'x': ..., 'y': ...}).
+        - **attributes: The attributes of the record. Missing ones are None, unknown ones are ignored.
+        """
+        for name, to_type in zip(self.field_names, self._coercions):
+            value = attributes.get(name)
+            setattr(self, name, None if value is None else to_type(value))
+        self.geometry = None if geometry is None else Geometry(**geometry)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the attributes of the record and its geometry as a dictionary.
+        """
+        result = {name: getattr(self, name) for name in self.field_names}
+        result['geometry'] = None if self.geometry is None else self.geometry.to_dict()
+        return result
+
+    def __eq__(self, other):
+        if not isinstance(other, Feature):
+            return NotImplemented
+        return self.field_names == other.field_names and self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Feature({', '.join(f'{name}={getattr(self, name)!r}' for name in self.field_names)})"
+
+
+@lru_cache(maxsize=None)
+def record_class(schema: tuple) -> type:
+    """
+    Returns the record class of a schema, generated once per distinct schema.
+
+    Parameters:
+    - schema (tuple): (name, kind) pairs in attribute order, kind being one of KIND_COERCIONS.
+
+    Returns:
+    - type: A subclass of Feature with one slot per attribute.
+    """
+    names = tuple(name for name, _ in schema if name != 'geometry')
+    invalid = [name for name in names if not name.isidentifier()]
+    if invalid:
+        raise ValueError(f"Field names cannot be record attributes: {', '.join(invalid)}")
+    coercions = tuple(KIND_COERCIONS.get(kind, _to_string) for name, kind in schema if name != 'geometry')
+    return type('Feature', (Feature,), {'__slots__': names, 'field_names': names, '_coercions': coercions})
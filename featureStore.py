@@ -0,0 +1,355 @@
+import numpy
+from feature import Feature, record_class
+
+# how each esri field type is held in memory
+FIELD_KINDS = {
+    'esriFieldTypeDate': 'date',
+    'esriFieldTypeDouble': 'double',
+    'esriFieldTypeSingle': 'double',
+    'esriFieldTypeInteger': 'integer',
+    'esriFieldTypeSmallInteger': 'integer',
+    'esriFieldTypeBigInteger': 'integer',
+    'esriFieldTypeOID': 'integer',
+}
+
+KIND_DTYPES = {'date': numpy.int64, 'integer': numpy.int64, 'double': numpy.float64, 'string': numpy.int32}
+
+
+def field_kind(field_type: str) -> str:
+    """
+    Returns the column kind ('date', 'integer', 'double' or 'string') of an esri field type.
+    Anything that is not numeric or a date is dictionary encoded as a string.
+    """
+    return FIELD_KINDS.get(field_type, 'string')
+
+
+def coerce(kind: str, value):
+    """
+    Converts a value to the Python type of a column kind, or None if it cannot be.
+    """
+    if value is None:
+        return None
+    if kind == 'string':
+        return value if isinstance(value, str) else str(value)
+    try:
+        converted = KIND_DTYPES[kind](value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return converted.item()
+
+
+class Column:
+    """
+    A typed column of one attribute.
+
+    Numeric and date values live in a NumPy array next to a `valid` mask marking the non-null
+    rows. Strings are dictionary encoded: `values` holds an int32 code per row (-1 for null)
+    pointing into `categories`, the list of distinct strings.
+    """
+    def __init__(self, kind: str, values, valid, categories: list = None):
+        self.kind = kind
+        self.values = values
+        self.valid = valid
+        self.categories = categories
+        self._lookup = None
+
+    @classmethod
+    def from_values(cls, kind: str, raw: list) -> 'Column':
+        """
+        Builds a column from a list of Python values, None marking nulls.
+        Values that do not fit the kind (e.g. text in a numeric field) are converted if
+        possible and stored as nulls otherwise, so an odd record never stops ingestion.
+        """
+        try:
+            return cls._from_values(kind, raw)
+        except (TypeError, ValueError, OverflowError):
+            return cls._from_values(kind, [coerce(kind, value) for value in raw])
+
+    @classmethod
+    def _from_values(cls, kind: str, raw: list) -> 'Column':
+        if kind == 'string':
+            lookup = {}
+            codes = numpy.fromiter(
+                (-1 if value is None else lookup.setdefault(value, len(lookup)) for value in raw),
+                dtype=numpy.int32, count=len(raw))
+            column = cls(kind, codes, codes >= 0, list(lookup))
+            column._lookup = lookup
+            return column
+
+        valid = numpy.fromiter((value is not None for value in raw), dtype=bool, count=len(raw))
+        values = numpy.fromiter((0 if value is None else value for value in raw), dtype=KIND_DTYPES[kind], count=len(raw))
+        return cls(kind, values, valid)
+
+    @classmethod
+    def concatenate(cls, columns: list) -> 'Column':
+        """
+        Returns the rows of several columns of the same kind one after the other.
+        String columns are re-encoded against one shared dictionary.
+        """
+        kind = columns[0].kind
+        valid = numpy.concatenate([column.valid for column in columns])
+        if kind != 'string':
+            return cls(kind, numpy.concatenate([column.values for column in columns]), valid)
+
+        lookup = {}
+        parts = []
+        for column in columns:
+            remap = numpy.array([lookup.setdefault(category, len(lookup)) for category in column.categories], dtype=numpy.int32)
+            parts.append(numpy.where(column.valid, remap[column.values] if len(remap) else -1, -1).astype(numpy.int32))
+        result = cls(kind, numpy.concatenate(parts), valid, list(lookup))
+        result._lookup = lookup
+        return result
+
+    @property
+    def lookup(self) -> dict:
+        if self._lookup is None:
+            self._lookup = {category: code for code, category in enumerate(self.categories)}
+        return self._lookup
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, row: int):
+        """
+        Returns the Python value of a row, or None if it is null.
+        """
+        if not self.valid[row]:
+            return None
+        if self.kind == 'string':
+            return self.categories[self.values[row]]
+        return self.values[row].item()
+
+    def take(self, rows) -> 'Column':
+        """
+        Returns a new column holding the given rows.
+        """
+        return Column(self.kind, self.values[rows], self.valid[rows], self.categories)
+
+    def matching(self, predicate) -> numpy.ndarray:
+        """
+        Evaluates a predicate once per distinct string and returns the mask of the rows whose value satisfies it.
+        """
+        codes = [code for code, category in enumerate(self.categories) if predicate(category)]
+        return self.valid & numpy.isin(self.values, codes)
+
+    def equal_at(self, rows: numpy.ndarray, other: 'Column', other_rows: numpy.ndarray) -> numpy.ndarray:
+        """
+        Returns whether each of `rows` holds the same value (or null) as the matching row of `other_rows` in `other`.
+        """
+        valid = self.valid[rows]
+        if self.kind == 'string':
+            # codes of the other column's strings in this column's dictionary, -1 where absent
+            remap = numpy.array([self.lookup.get(category, -1) for category in other.categories] + [-1], dtype=numpy.int32)
+            other_values = remap[other.values[other_rows]]
+        else:
+            other_values = other.values[other_rows]
+        same = self.values[rows] == other_values
+        if self.values.dtype.kind == 'f':
+            same |= numpy.isnan(self.values[rows]) & numpy.isnan(other_values)
+        return (valid == other.valid[other_rows]) & (same | ~valid)
+
+    def merged_into(self, target: 'Column', positions: numpy.ndarray, size: int) -> 'Column':
+        """
+        Returns a copy of `target`, grown to `size` rows, with the rows of this column written at `positions`.
+        """
+        values = numpy.zeros(size, dtype=target.values.dtype)
+        valid = numpy.zeros(size, dtype=bool)
+        values[:len(target)] = target.values
+        valid[:len(target)] = target.valid
+
+        if self.kind != 'string':
+            values[positions] = self.values
+            valid[positions] = self.valid
+            return Column(self.kind, values, valid)
+
+        # re-encode the new strings against the existing dictionary
+        lookup = dict(target.lookup)
+        remap = numpy.array([lookup.setdefault(category, len(lookup)) for category in self.categories], dtype=numpy.int32)
+        values[positions] = numpy.where(self.valid, remap[self.values] if len(remap) else -1, -1)
+        valid[positions] = self.valid
+        column = Column(self.kind, values, valid, list(lookup))
+        column._lookup = lookup
+        return column
+
+
+class FeatureStore:
+    """
+    Columnar storage of the incidents of a layer.
+
+    Every attribute listed in the layer's fields becomes a typed Column and the point geometry
+    is kept as two float64 arrays (NaN when missing). Feature objects are only built on demand,
+    for the rows that are actually returned to a caller.
+    """
+    def __init__(self, columns: dict, x, y):
+        self.columns = columns
+        self.x = x
+        self.y = y
+        self._positions = None
+
+    @classmethod
+    def from_features(cls, fields: list, features: list) -> 'FeatureStore':
+        """
+        Builds a store from raw query features.
+
+        Parameters:
+        - fields (list): The Field objects describing the layer's attributes.
+        - features (list): Raw features ({'attributes': ..., 'geometry': ...}).
+
+        Returns:
+        - FeatureStore: The store holding the features in the order given.
+        """
+        columns = {}
+        for field in fields:
+            columns[field.name] = Column.from_values(
+                field_kind(field.type), [feature['attributes'].get(field.name) for feature in features])
+
+        x = numpy.fromiter(
+            (numpy.nan if not feature.get('geometry') or feature['geometry'].get('x') is None else feature['geometry']['x'] for feature in features),
+            dtype=numpy.float64, count=len(features))
+        y = numpy.fromiter(
+            (numpy.nan if not feature.get('geometry') or feature['geometry'].get('y') is None else feature['geometry']['y'] for feature in features),
+            dtype=numpy.float64, count=len(features))
+        return cls(columns, x, y)
+
+    @classmethod
+    def concatenate(cls, stores: list) -> 'FeatureStore':
+        """
+        Returns the rows of several stores with the same columns one after the other.
+        """
+        columns = {name: Column.concatenate([store.columns[name] for store in stores]) for name in stores[0].columns}
+        return cls(columns, numpy.concatenate([store.x for store in stores]), numpy.concatenate([store.y for store in stores]))
+
+    def __len__(self):
+        return len(self.x)
+
+    def column(self, name: str) -> Column:
+        return self.columns[name]
+
+    def values(self, name: str) -> numpy.ndarray:
+        return self.columns[name].values
+
+    def not_null(self, name: str) -> numpy.ndarray:
+        return self.columns[name].valid
+
+    def attributes(self, row: int) -> dict:
+        """
+        Returns the attributes of a row as a dictionary.
+        """
+        return {name: column.get(row) for name, column in self.columns.items()}
+
+    def geometry(self, row: int) -> dict:
+        x, y = self.x[row], self.y[row]
+        return {'x': None if numpy.isnan(x) else x.item(), 'y': None if numpy.isnan(y) else y.item()}
+
+    def feature_class(self, fields: list = None) -> type:
+        """
+        Returns the record class of the store's attributes, generated from the kinds of its columns.
+
+        Parameters:
+        - fields (list, optional): The attributes the records hold, in order. All of them if not given.
+
+        Raises:
+        - ValueError: If a field is not an attribute of the store.
+        """
+        if fields is None:
+            fields = list(self.columns)
+        unknown = [name for name in fields if name not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return record_class(tuple((name, self.columns[name].kind) for name in fields))
+
+    def feature(self, row: int, fields: list = None) -> Feature:
+        """
+        Builds the Feature record of a row, holding the given fields or all of them.
+        """
+        cls = self.feature_class(fields)
+        return cls(geometry=self.geometry(row), **{name: self.columns[name].get(row) for name in cls.field_names})
+
+    def features(self, rows=None, fields: list = None) -> list:
+        """
+        Builds the Feature records of the given rows (a mask or an array of row numbers), or of every row.
+
+        Parameters:
+        - rows (optional): The rows to build. Every row if not given.
+        - fields (list, optional): The attributes the records hold. All of them if not given.
+        """
+        if rows is None:
+            rows = range(len(self))
+        elif getattr(rows, 'dtype', None) == bool:
+            rows = numpy.flatnonzero(rows)
+        cls = self.feature_class(fields)
+        columns = [(name, self.columns[name]) for name in cls.field_names]
+        return [cls(geometry=self.geometry(row), **{name: column.get(row) for name, column in columns}) for row in map(int, rows)]
+
+    def take(self, rows) -> 'FeatureStore':
+        """
+        Returns a new store holding the given rows.
+        """
+        return FeatureStore({name: column.take(rows) for name, column in self.columns.items()}, self.x[rows], self.y[rows])
+
+    def keys(self) -> list:
+        """
+        Returns the identity of every row: SourceGlobalID, or SourceOID when that is missing.
+        """
+        global_ids = self.columns.get('SourceGlobalID')
+        source_oids = self.columns.get('SourceOID')
+        keys = []
+        for row in range(len(self)):
+            key = global_ids.get(row) if global_ids is not None else None
+            if key is None and source_oids is not None:
+                key = source_oids.get(row)
+            keys.append(key)
+        return keys
+
+    def changed_rows(self, delta: 'FeatureStore') -> numpy.ndarray:
+        """
+        Returns the rows of `delta` that upsert would add or alter: rows with a new key, and
+        rows whose attributes or geometry differ from the stored row with the same key.
+        """
+        if self._positions is None:
+            self._positions = {key: row for row, key in enumerate(self.keys())}
+
+        stored = numpy.fromiter((self._positions.get(key, -1) for key in delta.keys()), dtype=numpy.int64, count=len(delta))
+        known = numpy.flatnonzero(stored >= 0)
+        rows = stored[known]
+        same = numpy.ones(len(known), dtype=bool)
+        for name, column in self.columns.items():
+            same &= column.equal_at(rows, delta.columns[name], known)
+        for mine, theirs in ((self.x, delta.x), (self.y, delta.y)):
+            same &= (mine[rows] == theirs[known]) | (numpy.isnan(mine[rows]) & numpy.isnan(theirs[known]))
+
+        changed = numpy.ones(len(delta), dtype=bool)
+        changed[known[same]] = False
+        return numpy.flatnonzero(changed)
+
+    def upsert(self, delta: 'FeatureStore') -> tuple:
+        """
+        Returns a new store where the rows of `delta` replace the rows with the same key and
+        the remaining ones are appended. This store is left untouched.
+
+        Returns:
+        - tuple: (the new store, the row number each delta row was written to)
+        """
+        if self._positions is None:
+            self._positions = {key: row for row, key in enumerate(self.keys())}
+
+        positions = dict(self._positions)
+        targets = numpy.empty(len(delta), dtype=numpy.int64)
+        size = len(self)
+        for row, key in enumerate(delta.keys()):
+            if key not in positions:
+                positions[key] = size
+                size += 1
+            targets[row] = positions[key]
+
+        columns = {name: delta.columns[name].merged_into(column, targets, size) for name, column in self.columns.items()}
+        x = numpy.full(size, numpy.nan)
+        y = numpy.full(size, numpy.nan)
+        x[:len(self)] = self.x
+        y[:len(self)] = self.y
+        x[targets] = delta.x
+        y[targets] = delta.y
+
+        store = FeatureStore(columns, x, y)
+        store._positions = positions
+        return store, targets
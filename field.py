@@ -1,5 +1,6 @@
 class Field:
-    def __init__(self, name, type, alias, sqlType, domain, defaultValue, length=None):
+    def __init__(self, name, type, alias=None, sqlType=None, domain=None, defaultValue=None, length=None, **extra):
+        # members newer servers add (nullable, editable, ...) are not needed here
         self.name = name
         self.type = type
         self.alias = alias
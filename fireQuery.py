@@ -0,0 +1,223 @@
+"""
+Composable incident queries.
+
+A FireQuery is a set of predicates that must all hold. Predicates that have an index (size,
+date range, location and bounding box) can produce their matching rows directly and estimate
+how many there are without producing them; the others are only evaluated as vectorized masks.
+The planner starts from the indexed predicate with the smallest estimate and narrows its rows
+with the masks of all the remaining predicates, so a query costs about as much as its most
+selective predicate.
+"""
+import numpy
+
+from analyticsCube import SIZE_FIELD
+from timeIndex import TIME_FIELDS
+
+# attributes filtered by a list of accepted values
+CATEGORY_FIELDS = {'cause': 'FireCause', 'type_kind': 'IncidentTypeKind', 'complexity': 'IncidentComplexityLevel'}
+
+# what the results can be ordered by, besides row order
+ORDERS = {'size': SIZE_FIELD, **{field: field for field in TIME_FIELDS}}
+
+
+class SizeRange:
+    """
+    IncidentSize within inclusive bounds, answered from the sorted sizes.
+    """
+    indexed = True
+
+    def __init__(self, min_size: float = None, max_size: float = None):
+        if min_size is not None and max_size is not None and min_size > max_size:
+            raise ValueError("The minimum size must not be larger than the maximum size.")
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def _bounds(self, dataset) -> tuple:
+        sizes = dataset.size_distribution().sizes
+        low = 0 if self.min_size is None else int(numpy.searchsorted(sizes, self.min_size, side='left'))
+        high = len(sizes) if self.max_size is None else int(numpy.searchsorted(sizes, self.max_size, side='right'))
+        return low, max(high, low)
+
+    def estimate(self, dataset) -> int:
+        low, high = self._bounds(dataset)
+        return high - low
+
+    def rows(self, dataset) -> numpy.ndarray:
+        low, high = self._bounds(dataset)
+        return dataset.size_distribution().rows[low:high]
+
+    def mask(self, dataset, rows: numpy.ndarray) -> numpy.ndarray:
+        sizes = dataset.store.values(SIZE_FIELD)[rows]
+        mask = dataset.store.not_null(SIZE_FIELD)[rows]
+        if self.min_size is not None:
+            mask &= sizes >= self.min_size
+        if self.max_size is not None:
+            mask &= sizes <= self.max_size
+        return mask
+
+
+class DateRange:
+    """
+    One of the TIME_FIELDS within inclusive bounds, answered from its TimeIndex.
+    """
+    indexed = True
+
+    def __init__(self, start: int = None, end: int = None, field: str = 'FireDiscoveryDateTime'):
+        if field not in TIME_FIELDS:
+            raise ValueError(f"Invalid date field. Use one of: {', '.join(TIME_FIELDS)}")
+        self.start = start
+        self.end = end
+        self.field = field
+
+    def estimate(self, dataset) -> int:
+        return dataset.time_index(self.field).count(self.start, self.end)
+
+    def rows(self, dataset) -> numpy.ndarray:
+        return dataset.time_index(self.field).range(self.start, self.end)
+
+    def mask(self, dataset, rows: numpy.ndarray) -> numpy.ndarray:
+        timestamps = dataset.store.values(self.field)[rows]
+        mask = dataset.store.not_null(self.field)[rows]
+        if self.start is not None:
+            mask &= timestamps >= self.start
+        if self.end is not None:
+            mask &= timestamps <= self.end
+        return mask
+
+
+class Location:
+    """
+    A location matched through the LocationIndex.
+    """
+    indexed = True
+
+    def __init__(self, location: str):
+        if not location or not location.strip():
+            raise ValueError("The location must not be empty.")
+        self.location = location
+        self._searched = (None, None)
+
+    def rows(self, dataset) -> numpy.ndarray:
+        # the trigram search is cheap next to a scan, so its result doubles as the estimate
+        searched_in, rows = self._searched
+        if searched_in is not dataset:
+            rows = dataset.location_index.search(self.location)
+            self._searched = (dataset, rows)
+        return rows
+
+    def estimate(self, dataset) -> int:
+        return len(self.rows(dataset))
+
+    def mask(self, dataset, rows: numpy.ndarray) -> numpy.ndarray:
+        matching = self.rows(dataset)
+        positions = numpy.minimum(numpy.searchsorted(matching, rows), max(len(matching) - 1, 0))
+        return matching[positions] == rows if len(matching) else numpy.zeros(len(rows), dtype=bool)
+
+
+class BoundingBox:
+    """
+    A location inside a box, answered from the SpatialIndex.
+    """
+    indexed = True
+
+    def __init__(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float):
+        if min_lon > max_lon or min_lat > max_lat:
+            raise ValueError("The minimum corner of the box must be south-west of the maximum corner.")
+        self.bbox = (min_lon, min_lat, max_lon, max_lat)
+
+    def estimate(self, dataset) -> int:
+        return dataset.spatial_index.estimate_bbox(*self.bbox)
+
+    def rows(self, dataset) -> numpy.ndarray:
+        return dataset.spatial_index.within_bbox(*self.bbox)
+
+    def mask(self, dataset, rows: numpy.ndarray) -> numpy.ndarray:
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        lon, lat = dataset.spatial_index.lon[rows], dataset.spatial_index.lat[rows]
+        return (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+
+
+class Category:
+    """
+    One of a list of accepted values of a string attribute; no index, mask only.
+    """
+    indexed = False
+
+    def __init__(self, field: str, values: list):
+        self.field = field
+        self.values = list(values)
+
+    def mask(self, dataset, rows: numpy.ndarray) -> numpy.ndarray:
+        column = dataset.store.column(self.field)
+        codes = [column.lookup[value] for value in self.values if value in column.lookup]
+        return column.valid[rows] & numpy.isin(column.values[rows], codes)
+
+
+class FireQuery:
+    """
+    The predicates an incident has to satisfy, all optional.
+    """
+    def __init__(self, min_size: float = None, max_size: float = None, location: str = None,
+                 start: int = None, end: int = None, date_field: str = 'FireDiscoveryDateTime',
+                 causes: list = None, type_kinds: list = None, complexity_levels: list = None,
+                 bbox: tuple = None, order_by: str = None):
+        """
+        Parameters:
+        - min_size, max_size (float, optional): Inclusive IncidentSize bounds, in acres.
+        - location (str, optional): Matched like find_by_location.
+        - start, end (int, optional): Inclusive bounds of `date_field`, in epoch milliseconds.
+        - date_field (str, optional): One of TIME_FIELDS. Defaults to 'FireDiscoveryDateTime'.
+        - causes, type_kinds, complexity_levels (list, optional): Accepted FireCause, IncidentTypeKind
+          and IncidentComplexityLevel values.
+        - bbox (tuple, optional): (min_lon, min_lat, max_lon, max_lat), in degrees.
+        - order_by (str, optional): 'size' or one of TIME_FIELDS, ascending. Row order if not given.
+
+        Raises:
+        - ValueError: If a predicate or the order is invalid.
+        """
+        if order_by is not None and order_by not in ORDERS:
+            raise ValueError(f"Cannot order by '{order_by}'. Use one of: {', '.join(ORDERS)}")
+        self.order_by = order_by
+
+        self.predicates = []
+        if min_size is not None or max_size is not None:
+            self.predicates.append(SizeRange(min_size, max_size))
+        if start is not None or end is not None:
+            self.predicates.append(DateRange(start, end, date_field))
+        if location is not None:
+            self.predicates.append(Location(location))
+        if bbox is not None:
+            self.predicates.append(BoundingBox(*bbox))
+        for name, values in (('cause', causes), ('type_kind', type_kinds), ('complexity', complexity_levels)):
+            if values:
+                self.predicates.append(Category(CATEGORY_FIELDS[name], values))
+
+    def plan(self, dataset) -> list:
+        """
+        Returns the predicates in evaluation order: the indexed ones by ascending estimate,
+        then the rest. The first one, if indexed, produces the candidate rows.
+        """
+        indexed = sorted((predicate for predicate in self.predicates if predicate.indexed), key=lambda predicate: predicate.estimate(dataset))
+        return indexed + [predicate for predicate in self.predicates if not predicate.indexed]
+
+    def execute(self, dataset) -> numpy.ndarray:
+        """
+        Returns the rows of the dataset satisfying every predicate, in the requested order.
+        """
+        plan = self.plan(dataset)
+        if plan and plan[0].indexed:
+            rows = numpy.asarray(plan[0].rows(dataset), dtype=numpy.int64)
+            plan = plan[1:]
+        else:
+            rows = numpy.arange(len(dataset.store))
+
+        for predicate in plan:
+            if len(rows) == 0:
+                break
+            rows = rows[predicate.mask(dataset, rows)]
+
+        if self.order_by is None:
+            return numpy.sort(rows)
+        # ties keep row order, incidents without a value go last
+        field = ORDERS[self.order_by]
+        return rows[numpy.lexsort((rows, dataset.store.values(field)[rows], ~dataset.store.not_null(field)[rows]))]
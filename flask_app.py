@@ -1,57 +1,248 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Blueprint, current_app, request, jsonify, g
 from datetime import datetime
+import functools
+import itertools
+import time
 import main 
-from geometry import Geometry
-import os
+import metrics
+from stackSampler import StackSampler
+from timeIndex import TIME_FIELDS
+from fireQuery import FireQuery
+from plotRenderer import FORMATS
+from timeSeries import FREQUENCIES
+import pytz
+import serialization
+from responseCache import CachedResponse, ResponseCache
 
-app = Flask(__name__)
+# the routes, registered on an application by create_app
+api = Blueprint('api', __name__)
 
-def serialize_feature(f):
+def create_app() -> Flask:
     """
-    Serialize a feature object to a dictionary, converting the geometry to a dictionary if applicable.
+    Creates the Flask application serving the API. Importing this module creates nothing;
+    `flask --app flask_app run` and WSGI servers call this factory instead.
+    
+    Returns:
+    - Flask: The application.
+    """
+    application = Flask(__name__)
+    application.register_blueprint(api)
+    return application
+
+_app = None
+
+def __getattr__(name: str):
+    # `flask_app.app` keeps working, created on first access rather than at import
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@api.before_app_request
+def start_request():
+    """
+    Notes when the request started and, for a request with 'profile=1', starts sampling its stack.
+    """
+    g.started = time.perf_counter()
+    if main.REQUEST_PROFILING and request.args.get('profile') == '1':
+        g.sampler = StackSampler().start()
+
+@api.after_app_request
+def finish_request(response):
+    """
+    Records the latency and status of the request. A profiled request is answered with its
+    sampled stacks in the folded format instead, ready for flamegraph.pl or speedscope; its
+    body is produced before sampling stops, so a streamed serialization is part of the profile.
+    """
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.started, endpoint=endpoint)
+    metrics.REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+
+    sampler = g.pop('sampler', None)
+    if sampler is None:
+        return response
+    response.get_data()
+    sampler.stop()
+    profile = current_app.response_class(sampler.folded(), mimetype='text/plain')
+    profile.headers['X-Profile-Samples'] = str(sampler.samples)
+    profile.headers['X-Profile-Seconds'] = f"{sampler.duration:.6f}"
+    profile.headers['X-Profiled-Status'] = str(response.status_code)
+    return profile
+
+@api.teardown_app_request
+def stop_profiling(error=None):
+    # a request that failed before after_request still stops its sampler
+    sampler = g.pop('sampler', None)
+    if sampler is not None:
+        sampler.stop()
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Endpoint exposing the stage timings, cache counters, dataset and refresh gauges and
+    request metrics in the Prometheus text format.
+    
+    Returns:
+    - Text: The metrics.
+    """
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def cached_response(view):
+    """
+    Serves a GET route from the response cache, keyed on its path, its query parameters and
+    the version of the collection. A client sending the ETag of a cached response gets a 304,
+    identical concurrent misses wait for one computation, and responses larger than
+    main.RESPONSE_CACHE_MAX_ENTRY_BYTES are streamed as usual. Profiled requests and requests
+    arriving before the collection is loaded bypass the cache.
+    """
+    @functools.wraps(view)
+    def serve(*args, **kwargs):
+        version = main.get_version()
+        if version is None or 'sampler' in g:
+            return view(*args, **kwargs)
+
+        key = ResponseCache.request_key(request.path, request.args, version)
+        if request.if_none_match.contains_weak(key):
+            return cache_headers(current_app.response_class(status=304), key)
+
+        uncached = []
+        def render():
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                uncached.append(response)
+                return None
+            body = read_body(response, main.RESPONSE_CACHE_MAX_ENTRY_BYTES)
+            if body is None or main.get_version() != version:
+                # too large, or computed from a newer collection than the key says
+                uncached.append(response)
+                return None
+            return CachedResponse.encode(response.status_code, list(response.headers.items()), body, main.RESPONSE_CACHE_GZIP)
+
+        entry = main.get_response_cache().get_or_render(key, render)
+        if entry is None:
+            # this request computed a response that is not cached, or waited for one
+            return uncached[0] if uncached else view(*args, **kwargs)
+
+        body, encoding = entry.payload('gzip' in request.accept_encodings)
+        response = current_app.response_class(body, status=entry.status, headers=entry.headers)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return cache_headers(response, key)
+    return serve
+
+def read_body(response, max_bytes: int):
+    """
+    Reads the body of a response. If it turns out longer than `max_bytes`, returns None and
+    leaves the response streaming what was read followed by the rest.
+    """
+    if not response.is_streamed:
+        body = response.get_data()
+        return body if len(body) <= max_bytes else None
+
+    chunks, size = [], 0
+    iterator = response.iter_encoded()
+    for chunk in iterator:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            response.response = itertools.chain(chunks, iterator)
+            return None
+    response.response = chunks
+    return b''.join(chunks)
+
+def cache_headers(response, key: str):
+    """
+    Tags a response of the response cache with its key as weak ETag (the body may be sent
+    compressed or not); clients may keep it but must revalidate.
+    """
+    response.set_etag(key, weak=True)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+def send_features(dataset, rows, extra: dict = None):
+    """
+    Streams the given rows of the dataset as they are serialized.
+    Honours the optional query parameters:
+    - 'format': 'json' (a JSON array, the default), 'ndjson' (one feature per line) or 'geojson' (a FeatureCollection).
+    - 'fields': comma separated attributes to include ('geometry' included); all by default.
+    - 'limit' and 'cursor': return at most 'limit' features, continuing from a previous page's cursor.
+    The total number of matches is sent in X-Total-Count, the version of the data in X-Data-Version
+    and the cursor of the next page, if any, in X-Next-Cursor.
     
     Parameters:
-    - f: The feature object to serialize.
+    - dataset: The ArcGISResponse the rows belong to.
+    - rows: The row numbers to send, in order.
+    - extra (dict, optional): Additional values per row (name -> sequence aligned with rows).
     
     Returns:
-    - dict: A dictionary representation of the feature.
+    - Response: The streamed features, or an error message.
     """
-    feature_dict = vars(f).copy()
-    if 'geometry' in feature_dict and isinstance(feature_dict['geometry'], Geometry):
-        feature_dict['geometry'] = feature_dict['geometry'].to_dict()
-        return feature_dict
+    format = request.args.get('format', 'json')
+    if format not in serialization.STREAMS:
+        return jsonify({"error": f"Invalid format. Use one of: {', '.join(serialization.STREAMS)}"}), 400
+
+    try:
+        fields = serialization.resolve_fields(dataset.store, request.args.get('fields'))
+        offset = serialization.decode_cursor(request.args['cursor'], dataset.version) if 'cursor' in request.args else 0
+        limit = int(request.args['limit']) if 'limit' in request.args else len(rows)
+        if limit < 0:
+            raise ValueError("The limit must not be negative.")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    page = rows[offset:offset + limit]
+    extra = {name: values[offset:offset + limit] for name, values in (extra or {}).items()}
+    records = serialization.iter_records(dataset.store, page, fields, extra)
 
-@app.route('/fires/location', methods=['GET'])
+    body = metrics.timed_iter('serialize', serialization.STREAMS[format](records))
+    response = current_app.response_class(body, mimetype=serialization.MIMETYPES[format])
+    response.headers['X-Total-Count'] = str(len(rows))
+    response.headers['X-Data-Version'] = str(dataset.version)
+    if offset + limit < len(rows):
+        response.headers['X-Next-Cursor'] = serialization.encode_cursor(dataset.version, offset + limit)
+    return response
+
+@api.route('/fires/location', methods=['GET'])
+@cached_response
 def get_fires_by_location():
     """
     Endpoint to get fire incidents by location.
-    Expects a 'location' query parameter.
+    Expects a 'location' query parameter, plus the optional parameters of send_features.
     
     Returns:
     - JSON: A list of serialized fire features matching the location.
     """
     location = request.args.get('location', '')
 
-    results = []
-    if location:
-        results.extend(main.get_features_by_location(location))
+    dataset = main.get_dataset()
+    rows = main.find_by_location(dataset, location) if location else []
 
-    return jsonify([serialize_feature(f) for f in results])
+    return send_features(dataset, rows)
 
 
-@app.route('/fires/date', methods=['GET'])
+@api.route('/fires/date', methods=['GET'])
+@cached_response
 def get_fires_between_range():
     """
     Endpoint to get fire incidents between a date range.
     Expects 'start_date' and 'end_date' query parameters in YYYY-MM-DD format.
+    An optional 'field' query parameter selects the timestamp to filter on
+    (FireDiscoveryDateTime, ContainmentDateTime, FireOutDateTime or ModifiedOnDateTime_dt).
+    Also takes the optional parameters of send_features.
     
     Returns:
     - JSON: A list of serialized fire features within the date range or an error message.
     """
     start_date = request.args.get('start_date', '')
     end_date = request.args.get('end_date', '')
+    field = request.args.get('field', 'FireDiscoveryDateTime')
 
-    results = []
+    if field not in TIME_FIELDS:
+        return jsonify({"error": f"Invalid field. Use one of: {', '.join(TIME_FIELDS)}"}), 400
 
     # Convert dates
     try:
@@ -61,105 +252,328 @@ def get_fires_between_range():
         return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
     
     if start_dt and end_dt:
-        results.extend(main.get_features_between_date_range(start_dt, end_dt))
+        dataset = main.get_dataset()
+        rows = main.find_between_date_range(dataset, start_dt, end_dt, field)
     else:
         return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
     
-    return jsonify([serialize_feature(f) for f in results])
+    return send_features(dataset, rows)
         
-@app.route('/fires/areas', methods=['GET'])
+@api.route('/fires/areas', methods=['GET'])
+@cached_response
 def get_larger_fire_areas():
     """
     Endpoint to get fire areas larger than a certain threshold.
+    Takes the optional parameters of send_features.
     
     Returns:
     - JSON: A list of serialized fire features with large areas or a message if none are found.
     """
-    results = []
-    results.extend(main.get_larger_areas())
-    if len(results) == 0:
+    dataset = main.get_dataset()
+    rows = main.find_larger_areas(dataset)
+    if len(rows) == 0:
         return jsonify({"message": "Could not find any areas"})
     else:
-        return jsonify([serialize_feature(f) for f in results])
+        return send_features(dataset, rows)
+
+def list_arg(name: str) -> list:
+    """
+    Returns the values of a query parameter given comma separated and/or repeated.
+    """
+    return [value.strip() for given in request.args.getlist(name) for value in given.split(',') if value.strip()]
+
+@api.route('/fires/query', methods=['GET'])
+@cached_response
+def query_fires():
+    """
+    Endpoint to get the fire incidents satisfying a combination of predicates, all optional:
+    - 'min_size' and 'max_size': inclusive IncidentSize bounds, in acres.
+    - 'location': matched like /fires/location.
+    - 'start_date' and 'end_date' (YYYY-MM-DD) on 'date_field' (FireDiscoveryDateTime by default).
+    - 'cause', 'type_kind' and 'complexity': accepted FireCause, IncidentTypeKind and
+      IncidentComplexityLevel values, comma separated or repeated.
+    - 'bbox': min_lon,min_lat,max_lon,max_lat in degrees.
+    - 'order_by': 'size' or a date field; row order by default.
+    Also takes the optional parameters of send_features.
+    
+    Returns:
+    - JSON: A list of serialized fire features matching every predicate or an error message.
+    """
+    args = request.args
+    try:
+        start_date = datetime.strptime(args['start_date'], "%Y-%m-%d") if 'start_date' in args else None
+        end_date = datetime.strptime(args['end_date'], "%Y-%m-%d") if 'end_date' in args else None
+        bbox = [float(value) for value in args['bbox'].split(',')] if 'bbox' in args else None
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError("Provide the bbox as min_lon,min_lat,max_lon,max_lat.")
+        query = FireQuery(
+            min_size=float(args['min_size']) if 'min_size' in args else None,
+            max_size=float(args['max_size']) if 'max_size' in args else None,
+            location=args.get('location'),
+            start=main.timestamp_ms(start_date) if start_date else None,
+            end=main.timestamp_ms(end_date) if end_date else None,
+            date_field=args.get('date_field', 'FireDiscoveryDateTime'),
+            causes=list_arg('cause'),
+            type_kinds=list_arg('type_kind'),
+            complexity_levels=list_arg('complexity'),
+            bbox=bbox,
+            order_by=args.get('order_by'),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    dataset, rows = main.query_dataset(query)
+    return send_features(dataset, rows)
+
+@api.route('/fires/bbox', methods=['GET'])
+@cached_response
+def get_fires_in_bbox():
+    """
+    Endpoint to get fire incidents inside a bounding box.
+    Expects 'min_lon', 'min_lat', 'max_lon' and 'max_lat' query parameters in degrees,
+    plus the optional parameters of send_features.
+    
+    Returns:
+    - JSON: A list of serialized fire features inside the box or an error message.
+    """
+    dataset = main.get_dataset()
+    try:
+        bbox = [float(request.args[name]) for name in ('min_lon', 'min_lat', 'max_lon', 'max_lat')]
+        rows = main.find_in_bbox(dataset, *bbox)
+    except (KeyError, ValueError):
+        return jsonify({"error": "Provide min_lon, min_lat, max_lon and max_lat in degrees, min below max."}), 400
+
+    return send_features(dataset, rows)
+
+@api.route('/fires/near', methods=['GET'])
+@cached_response
+def get_fires_near():
+    """
+    Endpoint to get fire incidents within a radius of a point, closest first.
+    Expects 'lat', 'lon' and 'radius_km' query parameters, plus the optional parameters of send_features.
+    
+    Returns:
+    - JSON: A list of serialized fire features, each with its 'distance_km', or an error message.
+    """
+    dataset = main.get_dataset()
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        radius_km = float(request.args['radius_km'])
+        rows, distances = main.find_near(dataset, lat, lon, radius_km)
+    except (KeyError, ValueError):
+        return jsonify({"error": "Provide lat, lon and a non-negative radius_km."}), 400
+
+    return send_features(dataset, rows, {'distance_km': distances.tolist()})
+
+def send_plot(plot_key: str, render, format: str = 'png'):
+    """
+    Sends a plot image tagged with its content address as ETag.
+    Clients revalidating with a matching If-None-Match get a 304 without the plot being rendered.
+    
+    Parameters:
+    - plot_key (str): The cache key of the plot.
+    - render (callable): Returns the image bytes, or None if there is no data to plot.
+    - format (str, optional): Image format, 'png' or 'svg'.
+    
+    Returns:
+    - Response: The plot image, a 304, or an error message.
+    """
+    if format not in FORMATS:
+        return jsonify({"error": f"Invalid format. Use one of: {', '.join(FORMATS)}"}), 400
+
+    if plot_key in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        image = render()
+        if not image:
+            return jsonify({"error": "No data to plot."}), 404
+        response = current_app.response_class(image, mimetype=FORMATS[format])
 
-@app.route('/plots/incident_hours', methods=['GET'])
+    response.set_etag(plot_key)
+    # the plot only changes with the data, so clients may keep it but must revalidate
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+@api.route('/plots/incident_hours', methods=['GET'])
 def get_incident_hours_plot():
     """
     Endpoint to get a plot of incident hours.
-    Expects optional 'location' and 'timezone' query parameters.
+    Expects optional 'location', 'timezone' and 'format' ('png' or 'svg') query parameters.
     
     Returns:
-    - File: The plot image file if available, or an error message.
+    - File: The plot image if available, or an error message.
     """
     location = request.args.get('location', None)
     timezone = request.args.get('timezone', 'US/Pacific')
-    plot_path = main.plot_incident_hours(location, timezone)
-    if plot_path:
-        return send_from_directory(os.path.dirname(plot_path), os.path.basename(plot_path))
-    else:
-        return jsonify({"error": "No data to plot."}), 404
+    format = request.args.get('format', 'png')
+    try:
+        pytz.timezone(timezone)
+    except pytz.UnknownTimeZoneError as e:
+        return jsonify({"error": f"Unknown timezone: {e}"}), 400
+
+    # the ETag and the image must come from the same version, so both use one dataset
+    dataset = main.get_dataset()
+    plot_key = main.plot_key('incident_hours', dataset, location=location, timezone=timezone, format=format)
+    return send_plot(plot_key, lambda: main.plot_incident_hours(location, timezone, format, dataset), format)
 
-@app.route('/plots/affected_areas', methods=['GET'])
+@api.route('/plots/affected_areas', methods=['GET'])
 def get_affected_areas_plot():
     """
     Endpoint to get a plot of affected areas.
+    Expects an optional 'format' ('png' or 'svg') query parameter.
     
     Returns:
-    - File: The plot image file if available, or an error message.
+    - File: The plot image if available, or an error message.
     """
-    plot_path = main.plot_affected_areas()
-    if plot_path:
-        #return jsonify({"message" : f"image is saved in {plot_path}"})
-         return send_from_directory(os.path.dirname(plot_path), os.path.basename(plot_path))
-    else:
-        return jsonify({"error": "No data to plot."}), 404
+    format = request.args.get('format', 'png')
+    dataset = main.get_dataset()
+    return send_plot(main.plot_key('affected_areas', dataset, format=format), lambda: main.plot_affected_areas(format, dataset), format)
 
-@app.route('/plots/correlation', methods=['GET'])
+@api.route('/plots/correlation', methods=['GET'])
 def get_correlation_plot():
     """
     Endpoint to get a plot of the correlation between fire ignition time and affected area.
+    Expects an optional 'format' ('png' or 'svg') query parameter.
     
     Returns:
-    - File: The plot image file if available, or an error message.
+    - File: The plot image if available, or an error message.
     """
-    plot_path = main.plot_correlation()
-    if plot_path:
-        return send_from_directory(os.path.dirname(plot_path), os.path.basename(plot_path))
-    else:
-        print("No data to plot.")
-        return jsonify({"error": "No data to plot."}), 404
+    format = request.args.get('format', 'png')
+    dataset = main.get_dataset()
+    return send_plot(main.plot_key('correlation', dataset, format=format), lambda: main.plot_correlation(format, dataset), format)
 
-@app.route('/analysis/ignition_times', methods=['GET'])
+@api.route('/plots/time_series', methods=['GET'])
+def get_time_series_plot():
+    """
+    Endpoint to get a plot of the incidents and affected area per period.
+    Expects optional 'frequency' ('day', 'week' or 'month'), 'timezone' and 'format' ('png' or 'svg') query parameters.
+    
+    Returns:
+    - File: The plot image if available, or an error message.
+    """
+    frequency = request.args.get('frequency', 'month')
+    timezone = request.args.get('timezone', 'US/Pacific')
+    format = request.args.get('format', 'png')
+    if frequency not in FREQUENCIES:
+        return jsonify({"error": f"Invalid frequency. Use one of: {', '.join(FREQUENCIES)}"}), 400
+    try:
+        pytz.timezone(timezone)
+    except pytz.UnknownTimeZoneError as e:
+        return jsonify({"error": f"Unknown timezone: {e}"}), 400
+
+    dataset = main.get_dataset()
+    plot_key = main.plot_key('time_series', dataset, frequency=frequency, timezone=timezone, format=format)
+    return send_plot(plot_key, lambda: main.plot_time_series(frequency, timezone, format, dataset), format)
+
+@api.route('/analysis/ignition_times', methods=['GET'])
+@cached_response
 def analyze_ignition_times():
     """
     Endpoint to analyze ignition times of fires.
-    Expects optional 'location' and 'timezone' query parameters.
+    Expects optional 'location', 'timezone' and 'group_by' (county, cause or month) query parameters.
+    Several time zones can be given, comma separated or as repeated 'timezone' parameters,
+    in which case the result holds one analysis per time zone.
     
     Returns:
     - JSON: Analysis results or an error message if no data is available.
     """
     location = request.args.get('location', None)
-    timezone = request.args.get('timezone', 'US/Pacific')
+    timezones = list_arg('timezone') or ['US/Pacific']
+    group_by = request.args.get('group_by', None)
+
+    try:
+        if len(timezones) == 1:
+            analysis_result = main.analyze_ignition_times(location, timezones[0], group_by)
+        else:
+            analysis_result = main.analyze_ignition_times_by_timezone(location, timezones, group_by)
+    except pytz.UnknownTimeZoneError as e:
+        return jsonify({"error": f"Unknown timezone: {e}"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    analysis_result = main.analyze_ignition_times(location, timezone)
     if analysis_result:
         return jsonify(analysis_result)
     else:
         return jsonify({"error": "No data to analyze."}), 404
     
-@app.route('/analysis/affected_areas', methods=['GET'])
+@api.route('/analysis/affected_areas', methods=['GET'])
+@cached_response
 def analyze_affected_areas():
     """
     Endpoint to analyze affected areas of fires.
+    Expects optional 'threshold' (acres), 'group_by' (county or cause) and 'percentiles'
+    (comma separated, 0-100) query parameters.
     
     Returns:
     - JSON: Analysis results or an error message if no data is available.
     """
-    analysis_result = main.analyze_affected_areas()
+    try:
+        threshold = float(request.args['threshold']) if 'threshold' in request.args else None
+        percentiles = [float(p) for p in request.args.get('percentiles', '').split(',') if p.strip()]
+        analysis_result = main.analyze_affected_areas(threshold, request.args.get('group_by', None), percentiles)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     if analysis_result:
         return jsonify(analysis_result)
     else:
         return jsonify({"error": "No data to analyze."}), 404
 
+@api.route('/analysis/time_series', methods=['GET'])
+@cached_response
+def analyze_time_series():
+    """
+    Endpoint to analyze the incidents and affected area per day, week or month of discovery.
+    Expects optional 'frequency' ('day', 'week' or 'month'), 'timezone', 'location',
+    'start_date' and 'end_date' (YYYY-MM-DD, on FireDiscoveryDateTime) and 'window' (periods
+    of the rolling correlation) query parameters.
+    
+    Returns:
+    - JSON: Analysis results or an error message if no data is available.
+    """
+    args = request.args
+    try:
+        start_date = datetime.strptime(args['start_date'], "%Y-%m-%d") if 'start_date' in args else None
+        end_date = datetime.strptime(args['end_date'], "%Y-%m-%d") if 'end_date' in args else None
+        window = int(args['window']) if 'window' in args else None
+        analysis_result = main.analyze_time_series(args.get('frequency', 'month'), args.get('timezone', 'US/Pacific'),
+                                                   args.get('location'), start_date, end_date, window)
+    except pytz.UnknownTimeZoneError as e:
+        return jsonify({"error": f"Unknown timezone: {e}"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if analysis_result:
+        return jsonify(analysis_result)
+    else:
+        return jsonify({"error": "No data to analyze."}), 404
+
+@api.route('/analysis/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Endpoint to evaluate many analyses at once, e.g. the tiles of a dashboard.
+    Expects a JSON body {"specs": [...]} (or just the list), each spec an object with the optional
+    keys 'location', 'start_date', 'end_date', 'date_field', 'timezone', 'group_by', 'threshold',
+    'percentiles' and 'analyses', as described by main.analyze_batch.
+    
+    Returns:
+    - JSON: The dataset version and one result per spec, or an error message.
+    """
+    body = request.get_json(silent=True)
+    specs = body.get('specs') if isinstance(body, dict) else body
+    if not isinstance(specs, list):
+        return jsonify({"error": "Provide a JSON body with a list of specs."}), 400
+
+    try:
+        analysis_result = main.analyze_batch(specs)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(analysis_result)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000, debug=True)
+    # keeps the cached incidents current without a restart
+    main.start_refresher()
+    create_app().run(host='0.0.0.0', port=8000, debug=True)
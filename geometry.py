@@ -1,4 +1,6 @@
 class Geometry:
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -0,0 +1,136 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import metrics
+
+DEFAULT_WORKERS = 4
+DEFAULT_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+
+
+def create_session(pool_size: int = DEFAULT_WORKERS, retries: int = DEFAULT_RETRIES, backoff_factor: float = DEFAULT_BACKOFF):
+    """
+    Creates a pooled HTTP session that retries failed GET requests with exponential backoff.
+
+    Parameters:
+    - pool_size (int, optional): Maximum number of connections kept open per host. Defaults to DEFAULT_WORKERS.
+    - retries (int, optional): Number of retries for connection errors and 429/5xx responses. Defaults to DEFAULT_RETRIES.
+    - backoff_factor (float, optional): Backoff factor between retries, in seconds. Defaults to DEFAULT_BACKOFF.
+
+    Returns:
+    - requests.Session: The configured session.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def with_params(url: str, **params) -> str:
+    """
+    Returns the url with the given query parameters added or replaced.
+    """
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    query.update({key: str(value) for key, value in params.items()})
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+def query_param(url: str, name: str, default: str = None) -> str:
+    """
+    Returns the value of a query parameter of the url, or `default` if it has none.
+    """
+    return dict(parse_qsl(urlsplit(url).query)).get(name, default)
+
+
+def fetch_json(session, url: str, timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """
+    Performs a GET request and decodes the ArcGIS JSON payload.
+
+    ArcGIS reports query errors with a 200 status and an 'error' object in the body,
+    so those are turned into a ValueError here.
+
+    Returns:
+    - dict: The decoded JSON payload.
+    """
+    with metrics.stage('fetch'):
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+    with metrics.stage('parse'):
+        data = response.json()
+    if 'error' in data:
+        raise ValueError(f"ArcGIS query failed: {data['error']}")
+    return data
+
+
+def get_object_ids(session, url: str, timeout: float = DEFAULT_TIMEOUT):
+    """
+    Retrieves the object id field name and the sorted object ids matching the query.
+
+    Returns:
+    - tuple: (objectIdFieldName, sorted list of object ids)
+    """
+    data = fetch_json(session, with_params(url, returnIdsOnly='true'), timeout)
+    return data['objectIdFieldName'], sorted(data.get('objectIds') or [])
+
+
+def get_record_count(session, url: str, timeout: float = DEFAULT_TIMEOUT) -> int:
+    """
+    Retrieves the number of records matching the query.
+    """
+    data = fetch_json(session, with_params(url, returnCountOnly='true'), timeout)
+    return data['count']
+
+
+def oid_ranges(object_ids: list, page_size: int) -> list:
+    """
+    Splits a sorted list of object ids into (first, last) ranges of at most page_size ids each.
+    """
+    return [
+        (object_ids[i], object_ids[min(i + page_size, len(object_ids)) - 1])
+        for i in range(0, len(object_ids), page_size)
+    ]
+
+
+def offset_page_urls(url: str, page_size: int, record_count: int, object_id_field: str) -> list:
+    """
+    Returns the urls of every page of a query, paged by resultOffset/resultRecordCount in object id order.
+    """
+    # the first page was not ordered, so it is requested again in a stable order
+    return [
+        with_params(url, resultOffset=offset, resultRecordCount=page_size, orderByFields=object_id_field)
+        for offset in range(0, max(record_count, page_size), page_size)
+    ]
+
+
+def oid_page_urls(url: str, page_size: int, object_id_field: str, object_ids: list) -> list:
+    """
+    Returns the urls of every page of a query, paged by ranges of at most page_size object ids.
+    """
+    where = query_param(url, 'where', '1=1')
+    return [
+        with_params(url, where=f"({where}) AND {object_id_field} >= {first} AND {object_id_field} <= {last}")
+        for first, last in oid_ranges(object_ids, page_size)
+    ]
+
+
+def merge_pages(first_page: dict, pages: list) -> dict:
+    """
+    Returns the first page's payload holding the features of all the pages, in page order.
+    """
+    merged = dict(first_page)
+    merged['features'] = [feature for page in pages for feature in page['features']]
+    merged['exceededTransferLimit'] = False
+    return merged
+
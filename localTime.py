@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy
+import pytz
+
+EPOCH = datetime(1970, 1, 1)
+
+
+@lru_cache(maxsize=64)
+def offset_transitions(timezone: str) -> tuple:
+    """
+    Returns the UTC offset changes of a time zone.
+
+    Parameters:
+    - timezone (str): An IANA time zone name, e.g. 'US/Pacific'.
+
+    Returns:
+    - tuple: (transition moments in epoch ms, UTC offset in ms in effect from each moment on),
+      both as NumPy arrays. Zones without transitions have a single entry.
+    """
+    tz = pytz.timezone(timezone)
+    transitions = getattr(tz, '_utc_transition_times', None)
+    if not transitions:
+        offset = tz.utcoffset(datetime(2000, 1, 1))
+        return numpy.array([numpy.iinfo(numpy.int64).min], dtype=numpy.int64), numpy.array([offset // timedelta(milliseconds=1)], dtype=numpy.int64)
+
+    # pytz stores the first transition as datetime.min, well before any incident
+    moments = numpy.array([(moment - EPOCH) // timedelta(milliseconds=1) if moment.year > 1 else numpy.iinfo(numpy.int64).min
+                           for moment in transitions], dtype=numpy.int64)
+    offsets = numpy.array([info[0] // timedelta(milliseconds=1) for info in tz._transition_info], dtype=numpy.int64)
+    return moments, offsets
+
+
+def to_local(timestamps: numpy.ndarray, timezone: str) -> numpy.ndarray:
+    """
+    Shifts UTC epoch ms timestamps to the wall clock of a time zone, daylight saving included.
+    """
+    moments, offsets = offset_transitions(timezone)
+    positions = numpy.searchsorted(moments, timestamps, side='right') - 1
+    return timestamps + offsets[numpy.maximum(positions, 0)]
+
+
+def local_hours(timestamps: numpy.ndarray, timezone: str) -> numpy.ndarray:
+    """
+    Returns the local hour of the day (0-23) of every UTC epoch ms timestamp.
+    """
+    return (to_local(timestamps, timezone) // 3600000) % 24
+
+
+def hour_histogram(timestamps: numpy.ndarray, timezone: str) -> dict:
+    """
+    Counts the timestamps per local hour of the day.
+
+    Returns:
+    - dict: Hours (0-23) that occur, mapped to their number of timestamps.
+    """
+    counts = numpy.bincount(local_hours(timestamps, timezone), minlength=24)
+    return {hour: int(count) for hour, count in enumerate(counts.tolist()) if count}
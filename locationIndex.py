@@ -0,0 +1,165 @@
+import re
+from collections import defaultdict
+
+import numpy
+
+# the text attributes searched when looking up a location
+LOCATION_FIELDS = ('POOCity', 'POOCounty', 'IncidentShortDescription', 'IncidentName')
+
+GRAM_SIZE = 3
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def normalize(text: str) -> str:
+    """
+    Case-folds a text and collapses its whitespace, so lookups are case and spacing insensitive.
+    """
+    return ' '.join(text.casefold().split())
+
+
+def grams(text: str) -> set:
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class LocationIndex:
+    """
+    Inverted index over the location fields of a FeatureStore.
+
+    The string columns are dictionary encoded, so the index works on their distinct values:
+    every distinct normalized text gets a value id, with postings from its tokens and its
+    trigrams to that id. A lookup finds the matching value ids, maps them to dictionary codes
+    of each field and from there to rows, without touching the rows that do not match.
+
+    The vocabulary and postings only ever grow, so an updated index shares them with the one
+    it was derived from and each index simply ignores the value ids past its own `value_count`.
+    """
+    def __init__(self, values: list = None, value_ids: dict = None, token_postings: dict = None, gram_postings: dict = None):
+        self.values = [] if values is None else values                  # value id -> normalized text
+        self.value_ids = {} if value_ids is None else value_ids         # normalized text -> value id
+        self.token_postings = defaultdict(list) if token_postings is None else token_postings
+        self.gram_postings = defaultdict(list) if gram_postings is None else gram_postings
+        self.value_count = len(self.values)
+        self.code_value_ids = {}    # field -> array mapping dictionary code to value id
+        self.code_rows = {}         # field -> (rows ordered by code, start offset of each code)
+        self._frozen = {}
+
+    @classmethod
+    def build(cls, store, fields: tuple = LOCATION_FIELDS) -> 'LocationIndex':
+        """
+        Builds the index over the given string fields of a FeatureStore.
+        """
+        index = cls()
+        for field in fields:
+            if field in store.columns:
+                index._add_field(field, store.column(field))
+        index.value_count = len(index.values)
+        return index
+
+    def _value_id(self, text: str) -> int:
+        normalized = normalize(text)
+        value_id = self.value_ids.get(normalized)
+        if value_id is None:
+            value_id = len(self.values)
+            self.value_ids[normalized] = value_id
+            self.values.append(normalized)
+            for token in set(TOKEN_PATTERN.findall(normalized)):
+                self.token_postings[token].append(value_id)
+            for gram in grams(normalized):
+                self.gram_postings[gram].append(value_id)
+        return value_id
+
+    def _add_field(self, field: str, column, known_codes: int = 0):
+        new_ids = [self._value_id(category) for category in column.categories[known_codes:]]
+        previous = self.code_value_ids.get(field, numpy.empty(0, dtype=numpy.int64))
+        self.code_value_ids[field] = numpy.concatenate([previous[:known_codes], numpy.array(new_ids, dtype=numpy.int64)])
+
+        # rows grouped by dictionary code; null rows (code -1) sort first and are skipped
+        order = numpy.argsort(column.values, kind='stable')
+        starts = numpy.searchsorted(column.values[order], numpy.arange(-1, len(column.categories) + 1))
+        self.code_rows[field] = (order, starts)
+        self._frozen.clear()
+
+    def updated(self, store, fields: tuple = LOCATION_FIELDS) -> 'LocationIndex':
+        """
+        Returns an index over an upserted version of the store. Only the new distinct values are
+        tokenized; the row grouping is recomputed with a vectorized sort.
+        """
+        index = LocationIndex(self.values, self.value_ids, self.token_postings, self.gram_postings)
+        index.code_value_ids = dict(self.code_value_ids)
+        for field in fields:
+            if field in store.columns:
+                index._add_field(field, store.column(field), len(self.code_value_ids.get(field, ())))
+        index.value_count = len(index.values)
+        return index
+
+    def _postings(self, table: dict, key: str) -> numpy.ndarray:
+        cache_key = (id(table), key)
+        if cache_key not in self._frozen:
+            ids = numpy.array(table.get(key, ()), dtype=numpy.int64)
+            self._frozen[cache_key] = ids[:numpy.searchsorted(ids, self.value_count)]
+        return self._frozen[cache_key]
+
+    def _intersect(self, table: dict, keys) -> numpy.ndarray:
+        postings = sorted((self._postings(table, key) for key in keys), key=len)
+        if not postings:
+            return numpy.empty(0, dtype=numpy.int64)
+        result = postings[0]
+        for other in postings[1:]:
+            result = numpy.intersect1d(result, other, assume_unique=True)
+        return result
+
+    def matching_values(self, text: str, exact: bool = False) -> numpy.ndarray:
+        """
+        Returns the ids of the distinct values matching a text.
+
+        Parameters:
+        - text (str): The text to look for.
+        - exact (bool, optional): If True every token of the text must be a whole token of the value;
+          otherwise the text must appear anywhere in the value. Defaults to False.
+
+        Returns:
+        - numpy.ndarray: The matching value ids.
+        """
+        query = normalize(text)
+        if not query:
+            return numpy.empty(0, dtype=numpy.int64)
+
+        if exact:
+            return self._intersect(self.token_postings, set(TOKEN_PATTERN.findall(query)))
+
+        if len(query) < GRAM_SIZE:
+            # too short for a trigram, check the distinct values directly
+            return numpy.array([value_id for value_id, value in enumerate(self.values[:self.value_count]) if query in value], dtype=numpy.int64)
+
+        candidates = self._intersect(self.gram_postings, grams(query))
+        return numpy.array([value_id for value_id in candidates.tolist() if query in self.values[value_id]], dtype=numpy.int64)
+
+    def search(self, text: str, exact: bool = False, fields: tuple = LOCATION_FIELDS) -> numpy.ndarray:
+        """
+        Returns the rows where any of the given fields matches the text, in row order.
+
+        Parameters:
+        - text (str): The location to look for.
+        - exact (bool, optional): Match whole tokens instead of substrings. Defaults to False.
+        - fields (tuple, optional): The fields to search. Defaults to LOCATION_FIELDS.
+
+        Returns:
+        - numpy.ndarray: The matching row numbers.
+        """
+        value_ids = self.matching_values(text, exact)
+        if len(value_ids) == 0:
+            return numpy.empty(0, dtype=numpy.int64)
+
+        parts = []
+        for field in fields:
+            if field not in self.code_value_ids:
+                continue
+            codes = numpy.flatnonzero(numpy.isin(self.code_value_ids[field], value_ids))
+            order, starts = self.code_rows[field]
+            # starts[code + 1] is where the rows of `code` begin, since null rows come first
+            parts.extend(order[starts[code + 1]:starts[code + 2]] for code in codes.tolist())
+
+        if not parts:
+            return numpy.empty(0, dtype=numpy.int64)
+        return numpy.unique(numpy.concatenate(parts))
@@ -1,32 +1,199 @@
 import requests
+import asyncIngestion
+import threading
+import numpy
+import pytz
+import snapshot
+import metrics
+from refresher import Refresher
+from datasetHandle import DatasetHandle
+from plotCache import PlotCache
+from responseCache import ResponseCache
 from datetime import datetime
-from geometry import *
-from arcGISResponse import *
-import os
+from arcGISResponse import ArcGISResponse
+from analyticsCube import SizeDistribution, count_tables, group_labels, hour_counts, hour_counts_by_group
+from timeIndex import TIME_FIELDS
+from timeSeries import TimeSeries
+from fireQuery import FireQuery
+from queryPushdown import PushdownCache
 
 BASE_URL = "https://services3.arcgis.com/T4QMspbfLg3qTGWY/arcgis/rest/services/WFIGS_Incident_Locations/FeatureServer/0/query?where=1%3D1&outFields=ContainmentDateTime,ControlDateTime,IncidentSize,DiscoveryAcres,FinalAcres,FireCause,FireCauseSpecific,FireDiscoveryDateTime,FireOutDateTime,FireStrategyPointZonePercent,IncidentName,IncidentShortDescription,IncidentTypeKind,IsFireCauseInvestigated,IsFireCodeRequested,CreatedOnDateTime_dt,ModifiedOnDateTime_dt,SourceGlobalID,IncidentComplexityLevel,POOCity,POOCounty,SourceOID,FireStrategyMonitorPercent,InitialLatitude,InitialLongitude&geometry=&geometryType=esriGeometryEnvelope&inSR=4326&spatialRel=esriSpatialRelIntersects&outSR=&f=json"
 
 large_acre_threshold = 1000
 
-response = None
-arcgis_response = None
+# 'offset' pages with resultOffset/resultRecordCount, 'oid' pages with object id ranges
+PAGING_STRATEGY = 'offset'
+
+# page requests in flight at a time while downloading the layer
+FETCH_CONCURRENCY = 8
+
+# seconds between incremental refreshes of the collection
+REFRESH_INTERVAL = 300
+
+# rendered plots are kept in memory, least recently used ones dropped past this many bytes
+PLOT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# encoded /fires and /analysis responses are kept in memory, least recently used ones dropped past this many bytes
+RESPONSE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# larger responses are streamed without being cached
+RESPONSE_CACHE_MAX_ENTRY_BYTES = 16 * 1024 * 1024
+
+# cached responses are kept gzip-compressed and sent so to clients accepting it
+RESPONSE_CACHE_GZIP = True
+
+# local snapshots of the collection, opened on start instead of downloading the layer again
+SNAPSHOT_DIR = "snapshot"
+
+# answer queries by filtering on the server while the layer has neither been downloaded nor snapshotted
+QUERY_PUSHDOWN = False
+
+# lets a single request be profiled by adding profile=1 to its query; any client can then
+# make the server sample its stacks, so only enable it where the API is not public
+REQUEST_PROFILING = False
+
+# most specs one request to analyze_batch may hold
+MAX_BATCH_SPECS = 500
+
+# keys of a spec of analyze_batch, and the analyses it can ask for
+BATCH_SPEC_KEYS = ('location', 'start_date', 'end_date', 'date_field', 'timezone', 'group_by', 'threshold', 'percentiles', 'analyses')
+BATCH_ANALYSES = ('ignition_times', 'affected_areas')
+
+# seconds a worker of the prefork server waits for the loader to write the first snapshot
+SNAPSHOT_WAIT_TIMEOUT = 900
+
+_refresher = None
+_plot_cache = None
+_response_cache = None
+_pushdown = None
+_follower = None
 
 def get_all():
-    global response
-    global arcgis_response
+    """
+    Loads the collection: opens the local snapshot if there is one and revalidates it
+    against the layer in the background, otherwise downloads every incident of the layer,
+    following the server's record cap, and saves a snapshot of it.
+    Called once through the dataset handle, however many requests wait for the data.
+
+    Returns:
+    - ArcGISResponse or None: The collection, or None if it could not be downloaded.
+    """
+    if _follower is not None:
+        # another process loads and refreshes the collection
+        return snapshot.wait(SNAPSHOT_DIR, SNAPSHOT_WAIT_TIMEOUT, _follower.interval)
+
+    dataset = snapshot.load(SNAPSHOT_DIR)
+    if dataset is not None:
+        threading.Thread(target=revalidate, name='snapshot-revalidate', daemon=True).start()
+        return dataset
+
+    try:
+        dataset = download()
+    except (requests.RequestException, ValueError) as e:
+        print(f"-- BAD REQUEST -- {e}")
+        return None
+
+    save_snapshot(dataset)
+    return dataset
+
+_dataset = DatasetHandle(get_all)
+
+metrics.REGISTRY.register(metrics.Gauge('fire_dataset_version', 'Version of the collection served.', function=lambda: _dataset.version))
+metrics.REGISTRY.register(metrics.Gauge('fire_dataset_incidents', 'Incidents in the collection served.',
+                                        function=lambda: None if _dataset.current is None else len(_dataset.current.store)))
+
+def download():
+    """
+    Downloads the whole layer, decoding the pages straight into columns as they arrive.
+    """
+    header, store = asyncIngestion.fetch_store(BASE_URL, PAGING_STRATEGY, FETCH_CONCURRENCY)
+    return ArcGISResponse.from_store(store, header)
+
+def fetch(url: str, strategy: str = PAGING_STRATEGY):
+    """
+    Downloads a layer query with the asynchronous fetcher, from synchronous code.
+    """
+    return asyncIngestion.fetch_all(url, strategy=strategy, concurrency=FETCH_CONCURRENCY)
+
+def save_snapshot(dataset):
+    """
+    Saves a snapshot of the collection for the next start. Failing to write it only costs
+    the next start a full download.
+    """
+    try:
+        snapshot.save(dataset, SNAPSHOT_DIR)
+    except OSError as e:
+        print(f"-- SNAPSHOT NOT SAVED -- {e}")
+
+def revalidate():
+    """
+    Brings a collection opened from a snapshot up to date with the layer.
+    """
+    # waits until the snapshot being opened is published
+    get_dataset()
+    try:
+        _get_refresher().revalidate()
+    except (requests.RequestException, ValueError, KeyError) as e:
+        print(f"-- REVALIDATION FAILED -- {e}")
+
+def get_dataset():
+    """
+    Returns the ArcGISResponse currently served, loading it on first use.
+    Callers should keep the returned reference for the whole computation, since the
+    refresher may swap in a newer one at any time.
+    """
+    return _dataset.get()
+
+def get_version():
+    """
+    Returns the version of the collection currently served, or None before it is loaded.
+    Versions only increase, so caches and ETags can key on them.
+    """
+    return _dataset.version
+
+def publish(dataset, replace: bool = False):
+    """
+    Swaps in a refreshed ArcGISResponse and snapshots it, unless a newer one is already served.
+    With `replace`, e.g. for a full reload, it is served as the next version in any case.
+    """
+    if _dataset.publish(dataset, replace):
+        save_snapshot(dataset)
+
+def refresh():
+    """
+    Pulls the incidents modified since the last refresh and swaps in the updated collection.
+
+    Returns:
+    - int: The number of incidents received.
+    """
+    return _get_refresher().refresh_once()
+
+def start_refresher(interval: float = REFRESH_INTERVAL):
+    """
+    Starts refreshing the collection in the background every `interval` seconds.
+    """
+    refresher = _get_refresher()
+    refresher.interval = interval
+    refresher.start()
+
+def follow_snapshots(interval: float = snapshot.FOLLOW_INTERVAL):
+    """
+    Serves the collection from the snapshots another process writes, as the workers of the
+    prefork server do: the collection is opened from SNAPSHOT_DIR instead of downloaded, and
+    every new snapshot is swapped in within `interval` seconds. Requests already working on
+    the previous version finish on it.
+    """
+    global _follower
+    if _follower is None:
+        _follower = snapshot.Follower(SNAPSHOT_DIR, lambda: _dataset.current, _dataset.publish, interval)
+        _follower.start()
+
+def _get_refresher():
+    global _refresher
+    if _refresher is None:
+        _refresher = Refresher(BASE_URL, lambda: _dataset.current, publish, REFRESH_INTERVAL, PAGING_STRATEGY, fetch, download)
+    return _refresher
 
-    # only fetching the data if we haven't previously done so
-    if response == None:
-        response = requests.get(BASE_URL)
-    
-    if response.status_code == 200:
-        if arcgis_response == None:
-            data = response.json()
-            arcgis_response = ArcGISResponse(**data)
-    else:
-        print("-- BAD REQUEST --")
-        return
-    
 def get_larger_areas():
     """
     Retrieves incidents with an area larger than the specified threshold.
@@ -34,50 +201,135 @@ def get_larger_areas():
     Returns:
     - List of large incidents sorted by size.
     """
-    if arcgis_response is None:
-        get_all()
+    dataset = get_dataset()
 
-    if not hasattr(arcgis_response, 'features') or arcgis_response.features is None:
+    return dataset.store.features(find_larger_areas(dataset))
+
+def find_larger_areas(dataset):
+    """
+    Returns the rows of the incidents larger than the threshold, sorted by size.
+    """
+    if not hasattr(dataset, 'store') or dataset.store is None:
         raise ValueError("The arcgis_response object is invalid or does not contain 'features'.")
 
-    # filtering
-    large_incidents = [
-        f for f in arcgis_response.features 
-        if hasattr(f, 'IncidentSize') and f.IncidentSize is not None 
-        and f.IncidentSize > large_acre_threshold
-    ]
+    # strictly larger than the threshold
+    return find_matching(dataset, FireQuery(min_size=numpy.nextafter(large_acre_threshold, numpy.inf), order_by='size'))
 
-    # sorting by IncidentSize
-    large_incidents.sort(key=lambda x: x.IncidentSize)
+def get_features_matching(query: FireQuery, fields: list = None):
+    """
+    Retrieves the fire incidents satisfying every predicate of a query.
+    
+    Parameters:
+    - query (FireQuery): The predicates, e.g. FireQuery(min_size=1000, location='Ventura', start=..., end=...).
+    - fields (list, optional): The attributes the returned features hold, any of the layer's fields. All of them if not given.
+    
+    Returns:
+    - List of matching features, in the order the query asks for.
+    """
+    dataset, rows = query_dataset(query)
+
+    return dataset.store.features(rows, fields)
+
+def query_dataset(query: FireQuery):
+    """
+    Answers a query from the collection. With QUERY_PUSHDOWN, as long as the collection is
+    not loaded and there is no snapshot to open, the query is evaluated on the server instead
+    and answered from the incidents fetched so far, which cover later overlapping queries.
+    
+    Parameters:
+    - query (FireQuery): The predicates.
+    
+    Returns:
+    - tuple: (the ArcGISResponse answering the query, the rows of it matching the query)
+    """
+    if QUERY_PUSHDOWN and _dataset.current is None and snapshot.current(SNAPSHOT_DIR) is None:
+        try:
+            return _get_pushdown().execute(query)
+        except (requests.RequestException, ValueError) as e:
+            print(f"-- PUSHDOWN FAILED -- {e}")
+
+    dataset = get_dataset()
+    return dataset, find_matching(dataset, query)
+
+def _get_pushdown():
+    global _pushdown
+    if _pushdown is None:
+        _pushdown = PushdownCache(BASE_URL, lambda url: asyncIngestion.fetch_store(url, PAGING_STRATEGY, FETCH_CONCURRENCY))
+    return _pushdown
+
+def find_matching(dataset, query: FireQuery):
+    """
+    Returns the rows of the incidents satisfying a query.
+    """
+    with metrics.stage('filter'):
+        return query.execute(dataset)
 
-    return large_incidents
+def timestamp_ms(moment: datetime) -> int:
+    """
+    Returns a datetime as epoch milliseconds, the unit of the layer's dates.
+    """
+    return int(moment.timestamp() * 1000)
 
-def analyze_affected_areas():
+def analyze_affected_areas(threshold: float = None, group_by: str = None, percentiles: list = None):
     """
     Analyzes the affected areas of fire incidents.
+    The answer is read from the sorted incident sizes kept by the dataset, so any threshold
+    costs a binary search and any percentile an index lookup.
+    
+    Parameters:
+    - threshold (float, optional): Size in acres above which a fire counts as large. Defaults to large_acre_threshold.
+    - group_by (str, optional): 'county' or 'cause' to analyze each group separately.
+    - percentiles (list, optional): Percentiles (0-100) of the sizes to include.
     
     Returns:
-    - Dictionary with total fires and count of large fires.
+    - Dictionary with total fires and count of large fires (and the requested percentiles),
+      per group if group_by is given.
     """
-    if arcgis_response is None:
-        get_all()
+    dataset = get_dataset()
 
-    areas = arcgis_response.get_affected_areas()
+    if threshold is None:
+        threshold = large_acre_threshold
+    distribution = dataset.size_distribution(group_by)
 
-    if not areas:
+    if len(distribution.sizes) == 0:
         return None
 
-    # Count fires larger than 1000 acres
-    large_fires = [area for area in areas if area > large_acre_threshold]
+    return summarize_sizes(dataset, distribution, threshold, percentiles)
 
+def summarize_sizes(dataset, distribution, threshold: float, percentiles: list = None):
+    """
+    Summarizes a size distribution into the number of fires, the number larger than the
+    threshold and the requested percentiles, per group if the distribution is grouped.
+    """
+    def summarize(key):
+        summary = {
+            "total_fires": distribution.count(key),
+            f"fires_larger_than_{threshold:g}_acres": distribution.count_above(threshold, key)
+        }
+        if percentiles:
+            summary["percentiles"] = {f"{percentile:g}": value for percentile, value in distribution.percentiles(percentiles, key).items()}
+        return summary
+
+    if distribution.group_by is None:
+        return summarize(0)
+
+    labels = group_labels(dataset.store, distribution.group_by)
     return {
-        "total_fires": len(areas),
-        f"fires_larger_than_{large_acre_threshold}_acres": len(large_fires)
+        "total_fires": len(distribution.sizes),
+        "groups": {group_key(labels[key]): summarize(key) for key in distribution.groups()}
     }
 
+def group_key(label):
+    """
+    Returns the JSON key of a group label; incidents missing the grouped attribute are listed under 'null'.
+    """
+    return 'null' if label is None else str(label)
+
 def get_features_by_location(location: str):
     """
     Retrieves fire incidents by location.
+    The location is matched case-insensitively as a substring of POOCity, POOCounty,
+    IncidentShortDescription or IncidentName.
     
     Parameters:
     - location (str): The location to filter incidents by.
@@ -85,64 +337,96 @@ def get_features_by_location(location: str):
     Returns:
     - List of features that match the specified location.
     """
-    if arcgis_response is None:
-        get_all()
-
-    if not location:
-        print("You need to specify the location")
-        return []
+    dataset = get_dataset()
 
-    location = location.lower().strip()
+    return dataset.store.features(find_by_location(dataset, location))
 
-    features_returned = [
-        f for f in arcgis_response.features 
-        if (f.IncidentShortDescription and location in f.IncidentShortDescription.lower()) or
-           (f.POOCity and location in f.POOCity.lower()) or
-           (f.POOCounty and location in f.POOCounty.lower())
-    ]
+def find_by_location(dataset, location: str):
+    """
+    Returns the rows of the incidents matching a location, in row order.
+    """
+    if not location or not location.strip():
+        print("You need to specify the location")
+        return numpy.empty(0, dtype=numpy.int64)
 
-    return features_returned
+    return find_matching(dataset, FireQuery(location=location))
 
-def get_features_between_date_range(startDate: datetime, endDate: datetime):
+def get_features_between_date_range(startDate: datetime, endDate: datetime, field: str = 'FireDiscoveryDateTime'):
     """
     Retrieves fire incidents within a specified date range.
     
     Parameters:
     - startDate (datetime): The start date of the range.
     - endDate (datetime): The end date of the range.
+    - field (str, optional): The timestamp to filter on, one of TIME_FIELDS. Defaults to 'FireDiscoveryDateTime'.
     
     Returns:
-    - List of features within the date range.
+    - List of features within the date range, ordered by that timestamp.
+    """
+    dataset = get_dataset()
+
+    return dataset.store.features(find_between_date_range(dataset, startDate, endDate, field))
+
+def find_between_date_range(dataset, startDate: datetime, endDate: datetime, field: str = 'FireDiscoveryDateTime'):
+    """
+    Returns the rows of the incidents whose `field` lies within the date range, ordered by it.
     """
-    if arcgis_response is None:
-        get_all()
+    query = FireQuery(start=timestamp_ms(startDate), end=timestamp_ms(endDate), date_field=field, order_by=field)
 
-    start_timestamp = int(startDate.timestamp() * 1000)
-    end_timestamp = int(endDate.timestamp() * 1000)
+    return find_matching(dataset, query)
+
+def get_features_in_bbox(min_lon: float, min_lat: float, max_lon: float, max_lat: float):
+    """
+    Retrieves fire incidents located inside a bounding box.
+    
+    Parameters:
+    - min_lon (float): Western edge, in degrees.
+    - min_lat (float): Southern edge, in degrees.
+    - max_lon (float): Eastern edge, in degrees.
+    - max_lat (float): Northern edge, in degrees.
     
-    filtered_features = [
-        f for f in arcgis_response.features
-        if f.FireDiscoveryDateTime is not None
-        and start_timestamp <= f.FireDiscoveryDateTime <= end_timestamp
-    ]
+    Returns:
+    - List of features inside the box.
+    """
+    dataset = get_dataset()
 
-    return filtered_features
+    return dataset.store.features(find_in_bbox(dataset, min_lon, min_lat, max_lon, max_lat))
 
-def analyze_ignition_times(location: str = None, timezone: str = 'US/Pacific'):
+def find_in_bbox(dataset, min_lon: float, min_lat: float, max_lon: float, max_lat: float):
     """
-    Analyzes the distribution of fire ignition times.
+    Returns the rows of the incidents inside a bounding box, in row order.
+    """
+    return find_matching(dataset, FireQuery(bbox=(min_lon, min_lat, max_lon, max_lat)))
+
+def get_features_near(lat: float, lon: float, radius_km: float):
+    """
+    Retrieves fire incidents within a radius of a point, closest first.
     
     Parameters:
-    - location (str, optional): The location to filter incidents by.
-    - timezone (str, optional): The timezone for time conversion.
+    - lat (float): Latitude of the point, in degrees.
+    - lon (float): Longitude of the point, in degrees.
+    - radius_km (float): The radius, in kilometres.
     
     Returns:
-    - Dictionary with the hour of most fires, count of most fires, and distribution.
+    - List of (feature, distance in km) pairs ordered by distance.
     """
-    if arcgis_response is None:
-        get_all()
+    dataset = get_dataset()
 
-    hour_count = arcgis_response.get_incident_hours(location, timezone)
+    rows, distances = find_near(dataset, lat, lon, radius_km)
+
+    return list(zip(dataset.store.features(rows), distances.tolist()))
+
+def find_near(dataset, lat: float, lon: float, radius_km: float):
+    """
+    Returns the rows of the incidents within a radius of a point and their distances in km, closest first.
+    """
+    with metrics.stage('filter'):
+        return dataset.spatial_index.near(lat, lon, radius_km)
+
+def summarize_hours(hour_count: dict):
+    """
+    Summarizes an hour histogram into the hour with most fires, its count and the distribution.
+    """
     if not hour_count:
         return None
 
@@ -155,49 +439,322 @@ def analyze_ignition_times(location: str = None, timezone: str = 'US/Pacific'):
         "hour_distribution": hour_count
     }
 
-# Ensure the "plots" directory exists
-if not os.path.exists("plots"):
-    os.makedirs("plots")
+def analyze_ignition_times(location: str = None, timezone: str = 'US/Pacific', group_by: str = None):
+    """
+    Analyzes the distribution of fire ignition times.
+    
+    Parameters:
+    - location (str, optional): The location to filter incidents by.
+    - timezone (str, optional): The timezone for time conversion.
+    - group_by (str, optional): 'county', 'cause' or 'month' to analyze each group separately.
+    
+    Returns:
+    - Dictionary with the hour of most fires, count of most fires, and distribution,
+      or one such dictionary per group if group_by is given.
+    """
+    dataset = get_dataset()
+
+    if group_by is not None:
+        hours_by_group = dataset.get_incident_hours_by_group(location, timezone, group_by)
+        return {group_key(label): summarize_hours(hour_count) for label, hour_count in hours_by_group.items()} or None
+
+    return summarize_hours(dataset.get_incident_hours(location, timezone))
 
-def plot_incident_hours(location: str = None, timezone: str = 'US/Pacific'):
+def analyze_ignition_times_by_timezone(location: str = None, timezones: list = ('US/Pacific',), group_by: str = None):
     """
-    Plots the distribution of incident hours and saves the plot.
+    Analyzes the distribution of fire ignition times in several time zones with a single selection of incidents.
+    
+    Parameters:
+    - location (str, optional): The location to filter incidents by.
+    - timezones (list, optional): The timezones for time conversion.
+    - group_by (str, optional): 'county', 'cause' or 'month' to analyze each group separately.
+    
+    Returns:
+    - Dictionary mapping each timezone to its analysis, or None if no data is available.
+    """
+    if group_by is not None:
+        analyses = {timezone: analyze_ignition_times(location, timezone, group_by) for timezone in timezones}
+        return analyses if any(analyses.values()) else None
+
+    dataset = get_dataset()
+
+    hours_by_timezone = dataset.get_incident_hours_by_timezone(location, timezones)
+    if not any(hours_by_timezone.values()):
+        return None
+
+    return {timezone: summarize_hours(hour_count) for timezone, hour_count in hours_by_timezone.items()}
+
+def batch_spec(spec: dict) -> dict:
+    """
+    Validates one spec of analyze_batch and fills in its defaults.
+
+    Raises:
+    - ValueError: If a value is invalid or a key unknown.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("A spec must be an object")
+    unknown = set(spec) - set(BATCH_SPEC_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown keys: {', '.join(sorted(unknown))}. Use any of: {', '.join(BATCH_SPEC_KEYS)}")
+
+    timezone = spec.get('timezone') or 'US/Pacific'
+    try:
+        pytz.timezone(timezone)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f"Unknown timezone: {timezone}")
+
+    date_field = spec.get('date_field') or 'FireDiscoveryDateTime'
+    if date_field not in TIME_FIELDS:
+        raise ValueError(f"Invalid date_field. Use one of: {', '.join(TIME_FIELDS)}")
+    try:
+        start, end = (timestamp_ms(datetime.strptime(spec[key], "%Y-%m-%d")) if spec.get(key) else None for key in ('start_date', 'end_date'))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
+
+    analyses = spec.get('analyses') or list(BATCH_ANALYSES)
+    if isinstance(analyses, str) or set(analyses) - set(BATCH_ANALYSES):
+        raise ValueError(f"Invalid analyses. Use a list of: {', '.join(BATCH_ANALYSES)}")
+    group_by = spec.get('group_by')
+    if group_by not in (None, 'county', 'cause', 'month') or (group_by == 'month' and 'affected_areas' in analyses):
+        raise ValueError(f"Cannot group by '{group_by}'. Use county or cause, or month for the ignition_times analysis only")
+
+    try:
+        threshold = float(spec['threshold']) if spec.get('threshold') is not None else large_acre_threshold
+        percentiles = [float(percentile) for percentile in spec.get('percentiles') or ()]
+    except (TypeError, ValueError):
+        raise ValueError("The threshold and percentiles must be numbers")
+    if any(not 0 <= percentile <= 100 for percentile in percentiles):
+        raise ValueError("Percentiles must lie within 0 and 100")
+
+    location = spec.get('location')
+    if location is not None and not isinstance(location, str):
+        raise ValueError("The location must be a string")
+
+    return {
+        'selection': (location.strip() if location and location.strip() else None, start, end, date_field),
+        'timezone': timezone,
+        'group_by': group_by,
+        'threshold': threshold,
+        'percentiles': percentiles,
+        'analyses': [analysis for analysis in BATCH_ANALYSES if analysis in analyses],
+    }
+
+def analyze_batch(specs: list):
+    """
+    Evaluates many ignition time and affected area analyses together, as dashboards showing
+    one tile per county, time zone or threshold need them. Specs selecting the same incidents
+    share the selection; the hour counts of all specs in a time zone come from one pass over
+    the union of their incidents, and the affected areas of every spec are read from the
+    sorted sizes of the incidents each selection holds. Specs without a location or dates are answered from the
+    analytics cube and size distributions kept by the dataset.
+
+    Parameters:
+    - specs (list): Dictionaries with the optional keys 'location', 'start_date' and 'end_date'
+      (YYYY-MM-DD) on 'date_field', which select the incidents, 'timezone', 'group_by' (county,
+      cause, or month for ignition times only), 'threshold' (acres), 'percentiles' (0-100) and
+      'analyses' (a list of 'ignition_times' and 'affected_areas', both by default).
+
+    Returns:
+    - Dictionary with the dataset version and one result per spec, in order, holding the
+      analyses asked for in the format of analyze_ignition_times and analyze_affected_areas
+      (None where there is no data).
+
+    Raises:
+    - ValueError: If a spec is invalid, naming its position.
+    """
+    if len(specs) > MAX_BATCH_SPECS:
+        raise ValueError(f"At most {MAX_BATCH_SPECS} specs can be analyzed at once")
+    parsed = []
+    for position, spec in enumerate(specs):
+        try:
+            parsed.append(batch_spec(spec))
+        except ValueError as e:
+            raise ValueError(f"Spec {position}: {e}")
+
+    dataset = get_dataset()
+
+    # the rows of every distinct selection, None for all incidents
+    selections = {}
+    for spec in parsed:
+        location, start, end, date_field = key = spec['selection']
+        if key not in selections:
+            everything = location is None and start is None and end is None
+            selections[key] = None if everything else find_matching(dataset, FireQuery(location=location, start=start, end=end, date_field=date_field))
+
+    # hour tables per (selection, time zone, dimensions): one count_tables call per time zone
+    tables = {}
+    pending = {}
+    for spec in parsed:
+        if 'ignition_times' not in spec['analyses']:
+            continue
+        dimensions = ('hour',) if spec['group_by'] is None else (spec['group_by'], 'hour')
+        key = (spec['selection'], spec['timezone'], dimensions)
+        if key in tables or key in pending.get(spec['timezone'], {}):
+            continue
+        rows = selections[spec['selection']]
+        if rows is None:
+            tables[key] = dataset.analytics_cube(spec['timezone']).table(dimensions)
+        else:
+            pending.setdefault(spec['timezone'], {})[key] = rows
+    for timezone, keyed_rows in pending.items():
+        with metrics.stage('filter'):
+            counted = count_tables(dataset.store, list(keyed_rows.values()), timezone, [key[2] for key in keyed_rows])
+        tables.update(zip(keyed_rows, counted))
+
+    distributions = {}
+    results = []
+    for spec in parsed:
+        result = {}
+        if 'ignition_times' in spec['analyses']:
+            group_by = spec['group_by']
+            table = tables[(spec['selection'], spec['timezone'], ('hour',) if group_by is None else (group_by, 'hour'))]
+            if group_by is None:
+                result['ignition_times'] = summarize_hours(hour_counts(table))
+            else:
+                result['ignition_times'] = {group_key(label): summarize_hours(hour_count)
+                                            for label, hour_count in hour_counts_by_group(dataset.store, table, group_by).items()} or None
+        if 'affected_areas' in spec['analyses']:
+            key = (spec['selection'], spec['group_by'])
+            if key not in distributions:
+                rows = selections[spec['selection']]
+                distributions[key] = dataset.size_distribution(spec['group_by']) if rows is None else SizeDistribution.build(dataset.store, spec['group_by'], rows)
+            distribution = distributions[key]
+            result['affected_areas'] = summarize_sizes(dataset, distribution, spec['threshold'], spec['percentiles']) if len(distribution.sizes) else None
+        results.append(result)
+
+    return {"version": dataset.version, "results": results}
+
+def analyze_time_series(frequency: str = 'month', timezone: str = 'US/Pacific', location: str = None,
+                        start: datetime = None, end: datetime = None, window: int = None):
+    """
+    Analyzes the incidents and affected area per day, week or month of discovery.
+    Without a location or dates the series is read from the one kept by the dataset.
+    
+    Parameters:
+    - frequency (str, optional): 'day', 'week' or 'month'.
+    - timezone (str, optional): The timezone the periods are delimited in.
+    - location (str, optional): The location to filter incidents by.
+    - start, end (datetime, optional): Inclusive bounds of FireDiscoveryDateTime.
+    - window (int, optional): Periods of the rolling correlation between discovery time and size.
+    
+    Returns:
+    - Dictionary with every period's incident count, acreage, growth rates and rolling
+      correlation, or None if no incident falls within the selection.
+    """
+    dataset = get_dataset()
+
+    if location is None and start is None and end is None:
+        series = dataset.time_series(frequency, timezone)
+    else:
+        query = FireQuery(location=location, start=timestamp_ms(start) if start else None, end=timestamp_ms(end) if end else None)
+        series = TimeSeries.build(dataset.store, frequency, timezone, find_matching(dataset, query))
+
+    if len(series) == 0:
+        return None
+    return series.to_dict(window)
+
+def get_plot_cache():
+    """
+    Returns the cache of rendered plots, creating it on first use.
+    """
+    global _plot_cache
+    if _plot_cache is None:
+        _plot_cache = PlotCache(PLOT_CACHE_MAX_BYTES)
+    return _plot_cache
+
+def get_response_cache():
+    """
+    Returns the cache of encoded responses, creating it on first use.
+    """
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
+    return _response_cache
+
+def plot_key(endpoint: str, dataset=None, **params):
+    """
+    Returns the cache key (and ETag) of a plot.
+    
+    Parameters:
+    - endpoint (str): The name of the plot.
+    - dataset (ArcGISResponse, optional): The collection plotted. The one currently served if not provided.
+    - params: The parameters the plot is drawn with.
+    
+    Returns:
+    - str: The content address of the plot.
+    """
+    if dataset is None:
+        dataset = get_dataset()
+    return PlotCache.key(endpoint, params, dataset.version)
+
+def plot_incident_hours(location: str = None, timezone: str = 'US/Pacific', format: str = 'png', dataset=None):
+    """
+    Plots the distribution of incident hours.
     
     Parameters:
     - location (str, optional): The location to filter incidents by.
     - timezone (str, optional): The timezone for time conversion.
+    - format (str, optional): Image format, 'png' or 'svg'.
+    - dataset (ArcGISResponse, optional): The collection to plot. The one currently served if not provided.
     
     Returns:
-    - str: The path to the saved plot image.
+    - bytes: The plot image, or None if there is no data to plot.
     """
-    if arcgis_response is None:
-        get_all()
+    if dataset is None:
+        dataset = get_dataset()
 
-    save_path = os.path.abspath(f"plots/incident_hours_{location if location else 'all'}.png")
-    return arcgis_response.plot_incident_hours(location, timezone, save_path)
+    key = plot_key('incident_hours', dataset, location=location, timezone=timezone, format=format)
+    return get_plot_cache().get_or_render(key, lambda: dataset.plot_incident_hours(location, timezone, format=format))
 
-def plot_affected_areas():
+def plot_affected_areas(format: str = 'png', dataset=None):
     """
-    Plots the distribution of affected areas and saves the plot.
+    Plots the distribution of affected areas.
+    
+    Parameters:
+    - format (str, optional): Image format, 'png' or 'svg'.
+    - dataset (ArcGISResponse, optional): The collection to plot. The one currently served if not provided.
     
     Returns:
-    - str: The path to the saved plot image.
+    - bytes: The plot image, or None if there is no data to plot.
     """
-    if arcgis_response is None:
-        get_all()
+    if dataset is None:
+        dataset = get_dataset()
 
-    save_path = os.path.abspath("plots/affected_areas.png")
-    return arcgis_response.plot_affected_areas(save_path)
+    key = plot_key('affected_areas', dataset, format=format)
+    return get_plot_cache().get_or_render(key, lambda: dataset.plot_affected_areas(format=format))
 
-def plot_correlation():
+def plot_correlation(format: str = 'png', dataset=None):
+    """
+    Plots the correlation between ignition time and affected area.
+    
+    Parameters:
+    - format (str, optional): Image format, 'png' or 'svg'.
+    - dataset (ArcGISResponse, optional): The collection to plot. The one currently served if not provided.
+    
+    Returns:
+    - bytes: The plot image, or None if there is no data to plot.
     """
-    Plots the correlation between ignition time and affected area and saves the plot.
+    if dataset is None:
+        dataset = get_dataset()
+
+    key = plot_key('correlation', dataset, format=format)
+    return get_plot_cache().get_or_render(key, lambda: dataset.plot_correlation(format=format))
+
+def plot_time_series(frequency: str = 'month', timezone: str = 'US/Pacific', format: str = 'png', dataset=None):
+    """
+    Plots the incidents and affected area per day, week or month.
+    
+    Parameters:
+    - frequency (str, optional): 'day', 'week' or 'month'.
+    - timezone (str, optional): The timezone the periods are delimited in.
+    - format (str, optional): Image format, 'png' or 'svg'.
+    - dataset (ArcGISResponse, optional): The collection to plot. The one currently served if not provided.
     
     Returns:
-    - str: The path to the saved plot image.
+    - bytes: The plot image, or None if there is no data to plot.
     """
-    if arcgis_response is None:
-        get_all()
+    if dataset is None:
+        dataset = get_dataset()
 
-    save_path = os.path.abspath("plots/correlation.png")
-    return arcgis_response.plot_correlation(save_path)
+    key = plot_key('time_series', dataset, frequency=frequency, timezone=timezone, format=format)
+    return get_plot_cache().get_or_render(key, lambda: dataset.plot_time_series(frequency, timezone, format=format))
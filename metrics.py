@@ -0,0 +1,207 @@
+"""
+Process-wide counters, gauges and timing histograms, exposed in the Prometheus text format.
+
+The hot paths record into the module-level metrics below: STAGE_SECONDS times the fetch,
+parse, filter, serialize and render stages, CACHE_HITS and CACHE_MISSES count the lookups of
+each cache, and the refresh and request metrics are filled by the refresher and the Flask
+app. `render()` writes every registered metric for a scrape of /metrics.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds of the timing histograms, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A named family of samples, one per combination of label values.
+    """
+    kind = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes the labels {', '.join(self.labels) or 'none'}")
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self) -> list:
+        """
+        Returns the lines of the samples of the metric.
+        """
+        with self._lock:
+            return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in sorted(self._values.items())]
+
+    def render(self) -> str:
+        return '\n'.join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()])
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. If a `function` is given, it is called on every scrape instead
+    and returns the value, or None to leave the sample out.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels))
+
+    def samples(self) -> list:
+        if self.function is not None:
+            value = self.function()
+            return [] if value is None else [f"{self.name} {_number(value)}"]
+        return super().samples()
+
+
+class Histogram(Metric):
+    """
+    Observed durations counted into BUCKETS, with their sum and count.
+    """
+    kind = 'histogram'
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(BUCKETS) + 1), 0.0))
+            counts[bisect.bisect_left(BUCKETS, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the time spent in the block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ((), 0.0))
+        return sum(counts)
+
+    def samples(self) -> list:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float('inf'),), counts):
+                    cumulative += count
+                    bound_label = 'le="' + _number(bound) + '"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, key, bound_label)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        return '\n'.join(metric.render() for metric in self.metrics.values()) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'fire_stage_seconds', 'Time spent per processing stage (fetch, parse, filter, serialize, render).', ('stage',)))
+CACHE_HITS = REGISTRY.register(Counter('fire_cache_hits_total', 'Lookups answered from a cache.', ('cache',)))
+CACHE_MISSES = REGISTRY.register(Counter('fire_cache_misses_total', 'Lookups a cache could not answer.', ('cache',)))
+REFRESH_SECONDS = REGISTRY.register(Gauge('fire_last_refresh_seconds', 'Duration of the last refresh of the collection.'))
+REFRESH_TIMESTAMP = REGISTRY.register(Gauge('fire_last_refresh_timestamp_seconds', 'Unix time the last refresh finished.'))
+REFRESHED_INCIDENTS = REGISTRY.register(Gauge('fire_last_refresh_incidents', 'Incidents received by the last refresh.'))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'fire_http_request_seconds', 'Time until the response of a request starts, streamed bodies excluded.', ('endpoint',)))
+REQUESTS = REGISTRY.register(Counter('fire_http_requests_total', 'Requests served.', ('endpoint', 'status')))
+
+
+def stage(name: str):
+    """
+    Times a block as one of the processing stages: `with metrics.stage('filter'): ...`
+    """
+    return STAGE_SECONDS.time(stage=name)
+
+
+def cache_lookup(cache: str, hit: bool):
+    (CACHE_HITS if hit else CACHE_MISSES).inc(cache=cache)
+
+
+def timed_iter(name: str, iterable):
+    """
+    Yields the items of an iterable and observes the time spent producing them as a stage,
+    once the iteration ends. The time the consumer spends between items is not counted, so
+    a streamed response body measures the serialization, not the network.
+    """
+    iterator = iter(iterable)
+    spent = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                spent += time.perf_counter() - start
+                return
+            spent += time.perf_counter() - start
+            yield item
+    finally:
+        STAGE_SECONDS.observe(spent, stage=name)
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import metrics
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class PlotCache:
+    """
+    In-memory cache of rendered plot images, addressed by a hash of what produced them.
+
+    The key of a plot is built from the endpoint, its parameters and the data version, so a
+    plot is rendered once per data version and then served from memory. Concurrent misses on
+    the same key wait for the one render in progress instead of drawing it again. The least
+    recently used images are dropped once their total size passes `max_bytes`.
+    """
+    # the cache label of the hit and miss counters
+    name = 'plot'
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # key -> image bytes, least recently used first
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self._pending = {}              # key -> Future of the render in progress
+
+    @staticmethod
+    def key(endpoint: str, params: dict, version: int) -> str:
+        """
+        Returns the content address of a plot; it doubles as the ETag of the response.
+        """
+        description = json.dumps([endpoint, sorted(params.items()), version], default=str)
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def size(value) -> int:
+        """
+        Returns the bytes a cached value accounts for.
+        """
+        return len(value)
+
+    def get(self, key: str):
+        """
+        Returns the cached image of a key, or None if it is not cached.
+        """
+        with self._lock:
+            image = self.entries.get(key)
+            if image is not None:
+                self.entries.move_to_end(key)
+            return image
+
+    def get_or_render(self, key: str, render):
+        """
+        Returns the cached image of a key, rendering it first if needed.
+
+        Parameters:
+        - key (str): The content address of the plot.
+        - render (callable): Returns the image bytes, or None if there is nothing to plot.
+
+        Returns:
+        - bytes or None: The image, or None if there is nothing to plot.
+        """
+        with self._lock:
+            image = self.entries.get(key)
+            metrics.cache_lookup(self.name, image is not None)
+            if image is not None:
+                self.entries.move_to_end(key)
+                return image
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            return pending.result()
+
+        try:
+            image = render()
+        except BaseException as e:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            self._pending.pop(key, None)
+            if image is not None:
+                self.total_bytes += self.size(image) - (self.size(self.entries[key]) if key in self.entries else 0)
+                self.entries[key] = image
+                self.entries.move_to_end(key)
+                self._evict()
+        pending.set_result(image)
+        return image
+
+    def _evict(self):
+        # keep at least the most recent image, even if it alone exceeds the budget
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, image = self.entries.popitem(last=False)
+            self.total_bytes -= self.size(image)
@@ -0,0 +1,104 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+import metrics
+
+# number of plots rendered at the same time
+RENDER_WORKERS = 2
+
+# periods drawn at most by a time series plot; longer series are merged into coarser periods
+MAX_PLOT_PERIODS = 1000
+
+# supported output formats and their mimetypes
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix='plot-render')
+    return _executor
+
+
+def render(draw, *args, format: str = 'png') -> bytes:
+    """
+    Draws a plot on a private Figure in the render pool and returns the encoded image.
+
+    Each render owns its Figure and Agg canvas, so no pyplot global state is shared between
+    threads and nothing has to be closed afterwards.
+
+    Parameters:
+    - draw (callable): Receives the Figure followed by `args` and draws on it.
+    - format (str, optional): 'png' or 'svg'. Defaults to 'png'.
+
+    Returns:
+    - bytes: The encoded image.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unsupported plot format '{format}'. Use one of: {', '.join(FORMATS)}")
+
+    def task():
+        # matplotlib is only imported by the first render, so processes that never draw do not load it
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        with metrics.stage('render'):
+            figure = Figure()
+            FigureCanvasAgg(figure)
+            draw(figure, *args)
+            buffer = io.BytesIO()
+            figure.savefig(buffer, format=format)
+            return buffer.getvalue()
+
+    return get_executor().submit(task).result()
+
+
+def draw_incident_hours(figure, hours: list, counts: list, location: str = None):
+    axes = figure.add_subplot()
+    axes.bar(hours, counts, color='skyblue')
+    axes.set_xlabel('Hour of the Day')
+    axes.set_ylabel('Number of Incidents')
+    axes.set_title(f'Incident Frequency by Hour of the Day ({location if location else "All Locations"})')
+    axes.set_xticks(range(24))  # Ensure all hours (0-23) are shown on the x-axis
+    axes.grid(axis='y', linestyle='--', alpha=0.7)
+
+
+def draw_affected_areas(figure, areas):
+    axes = figure.add_subplot()
+    axes.hist(areas, bins=50, color='orange')
+    axes.set_xlabel('Affected Area (acres)')
+    axes.set_ylabel('Frequency')
+    axes.set_title('Distribution of Fire Affected Areas')
+    axes.grid(axis='y', linestyle='--', alpha=0.7)
+
+
+def draw_correlation(figure, time_edges, size_edges, counts):
+    from matplotlib.colors import LogNorm
+
+    axes = figure.add_subplot()
+    # a 2-D histogram instead of one marker per incident, so the cost only depends on the bins
+    mesh = axes.pcolormesh(time_edges, size_edges, numpy.ma.masked_equal(counts.T, 0), norm=LogNorm(), cmap='viridis')
+    figure.colorbar(mesh, ax=axes, label='Incidents')
+    axes.set_yscale('log')
+    axes.set_xlabel('Ignition Time')
+    axes.set_ylabel('Affected Area (acres)')
+    axes.set_title('Correlation Between Ignition Time and Final Area')
+    axes.grid(linestyle='--', alpha=0.7)
+    figure.autofmt_xdate()
+
+
+def draw_time_series(figure, starts, counts, acres, frequency: str):
+    count_axes, acres_axes = figure.subplots(2, 1, sharex=True)
+    count_axes.step(starts, counts, where='post', color='steelblue')
+    count_axes.set_ylabel('Incidents')
+    count_axes.set_title(f'Incidents and Affected Area per {frequency.capitalize()}')
+    count_axes.grid(linestyle='--', alpha=0.7)
+    acres_axes.step(starts, acres, where='post', color='orange')
+    acres_axes.set_ylabel('Affected Area (acres)')
+    acres_axes.set_xlabel('Discovery Date')
+    acres_axes.grid(linestyle='--', alpha=0.7)
+    figure.autofmt_xdate()
@@ -0,0 +1,187 @@
+"""
+A prefork server for production use: one loader process and a pool of worker processes.
+
+The loader is the only process talking to the ArcGIS layer. It downloads the collection (or
+opens the last snapshot), keeps it current with the refresher and writes every version as a
+snapshot under main.SNAPSHOT_DIR. The workers never download anything: they open the current
+snapshot, whose memory-mapped arrays every worker shares through the page cache, and swap in
+each new one as the loader makes it current. A swap only replaces the dataset reference, so
+requests in flight finish on the version they started with.
+
+The supervising process binds the listening socket before forking, so the workers accept
+connections on the same socket and the kernel spreads them. Processes that exit are started
+again; SIGTERM or SIGINT stops the workers, which finish their requests first, then the loader.
+
+Only available where os.fork is (Linux, macOS):
+    python preforkServer.py --port 8000 --workers 4
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+# seconds between restarts of a process that keeps exiting
+RESTART_DELAY = 1.0
+
+# seconds before a process still running after SIGTERM is killed
+STOP_TIMEOUT = 30
+
+# connections waiting to be accepted by a worker
+BACKLOG = 1024
+
+# seconds the loader waits before trying a failed first load again
+LOAD_RETRY_INTERVAL = 30
+
+
+def run_loader():
+    """
+    Loads the collection, snapshotting it, and keeps it current until SIGTERM.
+    """
+    import main
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    while main.get_dataset() is None:
+        print("-- LOADER RETRYING --")
+        if stop.wait(LOAD_RETRY_INTERVAL):
+            return
+    main.start_refresher()
+    stop.wait()
+
+
+def run_worker(listener: socket.socket):
+    """
+    Serves requests accepted on a listening socket from the snapshots written by the loader, until SIGTERM.
+    """
+    from werkzeug.serving import make_server
+    import main
+    from flask_app import create_app
+
+    main.follow_snapshots()
+    server = make_server('', 0, create_app(), threaded=True, fd=listener.fileno())
+    # requests in flight are awaited on shutdown instead of being cut off
+    server.daemon_threads = False
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    main.get_dataset()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class PreforkServer:
+    """
+    Starts the loader and the workers and keeps them running.
+    """
+    def __init__(self, host: str = '0.0.0.0', port: int = 8000, workers: int = None):
+        """
+        Parameters:
+        - host (str, optional): The address to listen on. Defaults to '0.0.0.0'.
+        - port (int, optional): The port to listen on. Defaults to 8000.
+        - workers (int, optional): Worker processes. Defaults to the number of CPUs.
+        """
+        if not hasattr(os, 'fork'):
+            raise ValueError("The prefork server needs os.fork; use flask_app.py on this platform")
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.listener = None
+        self.children = {}
+        self.stopping = False
+
+    def _spawn(self, role: str) -> int:
+        pid = os.fork()
+        if pid == 0:
+            # the child restores the default handlers and never returns into the supervisor
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            status = 0
+            try:
+                if role == 'loader':
+                    self.listener.close()
+                    run_loader()
+                else:
+                    run_worker(self.listener)
+            except BaseException as e:
+                print(f"-- {role.upper()} FAILED -- {e}", file=sys.stderr)
+                status = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+        self.children[pid] = (role, time.monotonic())
+        return pid
+
+    def _stop(self, *_):
+        self.stopping = True
+
+    def serve(self):
+        """
+        Runs until SIGTERM or SIGINT, then stops every child process.
+        """
+        self.listener = socket.create_server((self.host, self.port), backlog=BACKLOG)
+        self.listener.set_inheritable(True)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self._spawn('loader')
+        for _ in range(self.workers):
+            self._spawn('worker')
+        print(f"-- SERVING ON {self.host}:{self.port} WITH {self.workers} WORKERS --")
+
+        while not self.stopping:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid == 0:
+                time.sleep(0.2)
+                continue
+            role, started = self.children.pop(pid)
+            if not self.stopping:
+                print(f"-- {role.upper()} {pid} EXITED, RESTARTING --")
+                if time.monotonic() - started < RESTART_DELAY:
+                    time.sleep(RESTART_DELAY)
+                self._spawn(role)
+
+        self.shutdown()
+
+    def shutdown(self):
+        """
+        Stops the workers, waiting for their requests in flight, then the loader.
+        """
+        for role in ('worker', 'loader'):
+            pids = [pid for pid, (child_role, _) in self.children.items() if child_role == role]
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            deadline = time.monotonic() + STOP_TIMEOUT
+            for pid in pids:
+                while time.monotonic() < deadline:
+                    try:
+                        done, _ = os.waitpid(pid, os.WNOHANG)
+                    except ChildProcessError:
+                        break
+                    if done:
+                        break
+                    time.sleep(0.05)
+                else:
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                self.children.pop(pid, None)
+        if self.listener is not None:
+            self.listener.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the API with a loader process and a pool of workers.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes. Defaults to the number of CPUs.')
+    args = parser.parse_args()
+    PreforkServer(args.host, args.port, args.workers).serve()
@@ -0,0 +1,183 @@
+"""
+Server-side evaluation of incident queries.
+
+Before the layer has been downloaded, a FireQuery can be compiled into the `where` and `time`
+parameters of the layer's query endpoint, so the server only sends the incidents that can
+match. The compiled filter never excludes a match: it may let through a few more incidents
+(timestamps are compared to the second, a location's spaces match any text, bounding boxes
+are not sent), which the local evaluation of the query then drops. The fetched incidents are merged
+into a partial collection that remembers the queries it holds every match of, and a later
+query implied by one of those is answered from it without a request.
+"""
+import threading
+from datetime import datetime, timezone
+
+import ingestion
+import metrics
+from arcGISResponse import ArcGISResponse
+from analyticsCube import SIZE_FIELD
+from fireQuery import SizeRange, DateRange, Location, BoundingBox, Category
+from locationIndex import LOCATION_FIELDS, normalize
+
+# the field the layer's `time` parameter filters on
+LAYER_TIME_FIELD = 'FireDiscoveryDateTime'
+
+
+def quote(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def timestamp_literal(ms: int, round_up: bool = False) -> str:
+    """
+    Returns a where clause TIMESTAMP literal of epoch milliseconds, rounded to the second
+    towards the outside of the range it bounds.
+    """
+    seconds = -(-ms // 1000) if round_up else ms // 1000
+    return f"TIMESTAMP '{datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}'"
+
+
+def compile_predicate(predicate) -> tuple:
+    """
+    Returns the query parameters of one predicate and its where clause, either possibly None.
+
+    Returns:
+    - tuple: (dict of parameters other than `where`, where clause)
+    """
+    if isinstance(predicate, SizeRange):
+        bounds = []
+        if predicate.min_size is not None:
+            bounds.append(f"{SIZE_FIELD} >= {predicate.min_size!r}")
+        if predicate.max_size is not None:
+            bounds.append(f"{SIZE_FIELD} <= {predicate.max_size!r}")
+        return {}, ' AND '.join(bounds)
+
+    if isinstance(predicate, DateRange):
+        if predicate.field == LAYER_TIME_FIELD:
+            start = 'null' if predicate.start is None else predicate.start
+            end = 'null' if predicate.end is None else predicate.end
+            return {'time': f"{start},{end}"}, None
+        bounds = []
+        if predicate.start is not None:
+            bounds.append(f"{predicate.field} >= {timestamp_literal(predicate.start)}")
+        if predicate.end is not None:
+            bounds.append(f"{predicate.field} <= {timestamp_literal(predicate.end, round_up=True)}")
+        return {}, ' AND '.join(bounds)
+
+    if isinstance(predicate, Location):
+        # whitespace is collapsed by the local matching, so any run of characters may stand in for it
+        pattern = '%' + '%'.join(normalize(predicate.location).upper().split()) + '%'
+        return {}, '(' + ' OR '.join(f"UPPER({field}) LIKE {quote(pattern)}" for field in LOCATION_FIELDS) + ')'
+
+    if isinstance(predicate, BoundingBox):
+        # locally, incidents without a geometry are placed at InitialLongitude/InitialLatitude,
+        # which an envelope filter would drop and a where clause cannot be OR-ed with; the box
+        # is only checked locally
+        return {}, None
+
+    if isinstance(predicate, Category):
+        return {}, f"{predicate.field} IN ({', '.join(quote(value) for value in predicate.values)})"
+
+    raise ValueError(f"Cannot evaluate {type(predicate).__name__} on the server")
+
+
+def compile_query(query, base_url: str) -> str:
+    """
+    Returns the url of the query endpoint requesting the incidents that may satisfy a FireQuery.
+
+    Parameters:
+    - query (FireQuery): The predicates.
+    - base_url (str): The query url of the whole layer; its `outFields` are kept, so the
+      incidents fetched have the same attributes as a full download.
+
+    Returns:
+    - str: The url, `where` combining the base url's clause with the compiled predicates.
+    """
+    params = {}
+    clauses = [ingestion.query_param(base_url, 'where', '1=1')]
+    for predicate in query.predicates:
+        predicate_params, clause = compile_predicate(predicate)
+        params.update(predicate_params)
+        if clause:
+            clauses.append(clause)
+    where = clauses[0] if len(clauses) == 1 else ' AND '.join(f"({clause})" for clause in clauses)
+    return ingestion.with_params(base_url, where=where, **params)
+
+
+def predicate_implies(predicate, other) -> bool:
+    """
+    Returns whether every incident satisfying `predicate` also satisfies `other`.
+    """
+    if type(predicate) is not type(other):
+        return False
+    if isinstance(predicate, SizeRange):
+        return ((other.min_size is None or (predicate.min_size is not None and predicate.min_size >= other.min_size))
+                and (other.max_size is None or (predicate.max_size is not None and predicate.max_size <= other.max_size)))
+    if isinstance(predicate, DateRange):
+        return (predicate.field == other.field
+                and (other.start is None or (predicate.start is not None and predicate.start >= other.start))
+                and (other.end is None or (predicate.end is not None and predicate.end <= other.end)))
+    if isinstance(predicate, Location):
+        # substring matching: a text containing the longer location contains the shorter one
+        return normalize(other.location) in normalize(predicate.location)
+    if isinstance(predicate, BoundingBox):
+        (min_lon, min_lat, max_lon, max_lat), (other_min_lon, other_min_lat, other_max_lon, other_max_lat) = predicate.bbox, other.bbox
+        return min_lon >= other_min_lon and min_lat >= other_min_lat and max_lon <= other_max_lon and max_lat <= other_max_lat
+    if isinstance(predicate, Category):
+        return predicate.field == other.field and set(predicate.values) <= set(other.values)
+    return False
+
+
+def query_implies(query, other) -> bool:
+    """
+    Returns whether every incident satisfying `query` also satisfies `other`, i.e. every
+    predicate of `other` is implied by one of `query`.
+    """
+    return all(any(predicate_implies(predicate, other_predicate) for predicate in query.predicates) for other_predicate in other.predicates)
+
+
+class PushdownCache:
+    """
+    The incidents fetched for the queries evaluated on the server so far.
+
+    Each query not implied by one already fetched is compiled with compile_query and its
+    incidents are merged into the collection, replacing the ones fetched before. Fetches are
+    serialized so that concurrent overlapping queries only reach the server once.
+    """
+    def __init__(self, base_url: str, fetch_store):
+        """
+        Parameters:
+        - base_url (str): The query url of the whole layer.
+        - fetch_store (callable): Downloads a query url, returning (header, FeatureStore),
+          like asyncIngestion.fetch_store.
+        """
+        self.base_url = base_url
+        self.fetch_store = fetch_store
+        self.dataset = None
+        self.fetched = []
+        self._lock = threading.Lock()
+
+    def covers(self, query) -> bool:
+        """
+        Returns whether the collection holds every incident satisfying the query.
+        """
+        return any(query_implies(query, fetched) for fetched in self.fetched)
+
+    def execute(self, query) -> tuple:
+        """
+        Answers a query from the collection, fetching its incidents from the server first if needed.
+
+        Returns:
+        - tuple: (the ArcGISResponse of the collection, the rows of it satisfying the query)
+
+        Raises:
+        - requests.RequestException, ValueError: If the server query fails.
+        """
+        with self._lock:
+            covered = self.covers(query)
+            metrics.cache_lookup('pushdown', covered)
+            if not covered:
+                header, store = self.fetch_store(compile_query(query, self.base_url))
+                self.dataset = ArcGISResponse.from_store(store, header) if self.dataset is None else self.dataset.merge(store)
+                self.fetched.append(query)
+            dataset = self.dataset
+        return dataset, query.execute(dataset)
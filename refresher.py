@@ -0,0 +1,136 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+import asyncIngestion
+import ingestion
+import metrics
+from arcGISResponse import ArcGISResponse
+from featureStore import FeatureStore
+
+DEFAULT_INTERVAL = 300
+
+
+def delta_url(base_url: str, since: int) -> str:
+    """
+    Narrows a layer query to the features modified at or after the given moment.
+
+    ArcGIS timestamp literals only have second precision, so the bound is rounded down;
+    the few features re-read at the boundary are simply upserted again.
+
+    Parameters:
+    - base_url (str): The full layer query url.
+    - since (int): High water mark, in epoch milliseconds (UTC).
+
+    Returns:
+    - str: The query url of the delta.
+    """
+    where = ingestion.query_param(base_url, 'where', '1=1')
+    moment = datetime.fromtimestamp(since // 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    return ingestion.with_params(base_url, where=f"({where}) AND ModifiedOnDateTime_dt >= TIMESTAMP '{moment}'")
+
+
+class Refresher:
+    """
+    Keeps an ArcGISResponse current by periodically pulling only the incidents modified
+    since its high water mark and publishing an upserted copy.
+
+    Deleted incidents are not visible through ModifiedOnDateTime_dt, so they stay in the
+    collection until the next full download.
+    """
+    def __init__(self, base_url: str, get_current, publish, interval: float = DEFAULT_INTERVAL, strategy: str = 'offset',
+                 fetch=asyncIngestion.fetch_all, load=None):
+        """
+        Parameters:
+        - base_url (str): The full layer query url.
+        - get_current (callable): Returns the ArcGISResponse currently served, or None if nothing is loaded yet.
+        - publish (callable): Receives the refreshed ArcGISResponse and swaps it in; a full reload
+          is passed with replace=True, to be published as the next version whatever its own.
+        - interval (float, optional): Seconds between refreshes. Defaults to DEFAULT_INTERVAL.
+        - strategy (str, optional): Paging strategy passed to `fetch`. Defaults to 'offset'.
+        - fetch (callable, optional): Downloads a query as fetch(url, strategy=...). Defaults to asyncIngestion.fetch_all.
+        - load (callable, optional): Downloads the whole layer as a new ArcGISResponse. Built from `fetch` if not provided.
+        """
+        self.base_url = base_url
+        self.get_current = get_current
+        self.publish = publish
+        self.interval = interval
+        self.strategy = strategy
+        self.fetch = fetch
+        self.load = load or (lambda: ArcGISResponse(**self.fetch(self.base_url, strategy=self.strategy)))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh_once(self) -> int:
+        """
+        Fetches the incidents modified since the current high water mark and publishes the
+        collection with the ones that are new or changed. The delta always holds the incidents
+        modified at the second of the high water mark again, so a refresh that brings nothing
+        new publishes nothing, and the version (and every cache keyed on it) stays the same.
+
+        Returns:
+        - int: The number of incidents received.
+        """
+        current = self.get_current()
+        if current is None or current.high_water_mark is None:
+            # nothing loaded yet, the first request does a full download
+            return 0
+
+        start = time.perf_counter()
+        data = self.fetch(delta_url(self.base_url, current.high_water_mark), strategy=self.strategy)
+        features = data.get('features', [])
+        if features:
+            delta = FeatureStore.from_features(current.fields, features)
+            changed = current.store.changed_rows(delta)
+            if len(changed):
+                self.publish(current.merge(delta.take(changed)))
+        metrics.REFRESH_SECONDS.set(time.perf_counter() - start)
+        metrics.REFRESH_TIMESTAMP.set(time.time())
+        metrics.REFRESHED_INCIDENTS.set(len(features))
+        return len(features)
+
+    def revalidate(self) -> bool:
+        """
+        Brings a collection opened from a snapshot up to date with the upstream layer.
+
+        The incidents modified since the snapshot are pulled as usual; if the number of
+        incidents still differs from the layer's (deletions are not visible in a delta), the
+        whole layer is downloaded again and published instead.
+
+        Returns:
+        - bool: True if a full download was needed.
+        """
+        self.refresh_once()
+        current = self.get_current()
+        if current is None:
+            return False
+
+        with ingestion.create_session() as session:
+            record_count = ingestion.get_record_count(session, self.base_url)
+        if record_count == len(current.store):
+            return False
+
+        # numbered by the publisher, since a refresh may publish while the layer downloads
+        self.publish(self.load(), replace=True)
+        return True
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh_once()
+            except (requests.RequestException, ValueError) as e:
+                print(f"-- REFRESH FAILED -- {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='arcgis-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
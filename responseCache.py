@@ -0,0 +1,89 @@
+"""
+Cache of the encoded responses of the /fires and /analysis routes.
+
+A response only depends on its route, its query parameters and the version of the collection,
+so it is kept under a key of the three, with the eviction and single-flight rendering of
+PlotCache. Bodies are stored gzip-compressed when that makes them smaller and sent as they are
+to clients accepting gzip. The key doubles as the ETag, so a client polling with If-None-Match
+gets a 304 without the response being computed or even looked up.
+"""
+import gzip
+
+from plotCache import PlotCache
+
+# bodies smaller than this are stored uncompressed
+GZIP_MIN_BYTES = 1024
+
+GZIP_LEVEL = 6
+
+# headers set again whenever a cached response is sent
+DROPPED_HEADERS = {'content-length', 'content-encoding', 'etag', 'vary', 'cache-control'}
+
+# query parameters that do not change a response
+IGNORED_PARAMS = ('profile',)
+
+
+class CachedResponse:
+    """
+    The status, headers and body of an encoded response.
+    """
+    __slots__ = ('status', 'headers', 'body', 'compressed')
+
+    def __init__(self, status: int, headers: list, body: bytes, compressed: bool = False):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.compressed = compressed
+
+    @classmethod
+    def encode(cls, status: int, headers: list, body: bytes, compress: bool = True) -> 'CachedResponse':
+        """
+        Builds the entry of a response, compressing its body if that pays off.
+
+        Parameters:
+        - status (int): The status code.
+        - headers (list): (name, value) pairs; the ones in DROPPED_HEADERS are left out.
+        - body (bytes): The encoded body.
+        - compress (bool, optional): Whether to try gzip. Defaults to True.
+        """
+        headers = [(name, value) for name, value in headers if name.lower() not in DROPPED_HEADERS]
+        if compress and len(body) >= GZIP_MIN_BYTES:
+            compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            if len(compressed) < len(body):
+                return cls(status, headers, compressed, True)
+        return cls(status, headers, body)
+
+    def payload(self, accept_gzip: bool) -> tuple:
+        """
+        Returns the body to send and its Content-Encoding (None for identity).
+        """
+        if not self.compressed:
+            return self.body, None
+        if accept_gzip:
+            return self.body, 'gzip'
+        return gzip.decompress(self.body), None
+
+
+class ResponseCache(PlotCache):
+    """
+    A PlotCache of CachedResponse entries, bounded by the bytes of their bodies and headers.
+    """
+    name = 'response'
+
+    @staticmethod
+    def size(entry: CachedResponse) -> int:
+        return len(entry.body) + sum(len(name) + len(value) for name, value in entry.headers)
+
+    @staticmethod
+    def request_key(path: str, args, version: int) -> str:
+        """
+        Returns the key of a request: its path, its query parameters by name (the order of
+        repeated ones kept) and the data version.
+
+        Parameters:
+        - path (str): The path of the request.
+        - args (MultiDict): The query parameters.
+        - version (int): The version of the collection answering it.
+        """
+        params = {name: args.getlist(name) for name in args if name not in IGNORED_PARAMS}
+        return PlotCache.key(path, params, version)
@@ -0,0 +1,141 @@
+import base64
+import json
+
+import numpy
+
+# rows converted to Python values at a time while streaming
+CHUNK_SIZE = 1000
+
+MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'geojson': 'application/geo+json',
+}
+
+
+def resolve_fields(store, fields: str = None) -> list:
+    """
+    Validates a comma separated field projection against the store.
+
+    Parameters:
+    - store (FeatureStore): The store the rows come from.
+    - fields (str, optional): Comma separated attribute names, 'geometry' included. None selects everything.
+
+    Returns:
+    - list: The selected attribute names ('geometry' last if selected).
+    """
+    if not fields:
+        return list(store.columns) + ['geometry']
+
+    selected = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in selected if name != 'geometry' and name not in store.columns]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return [name for name in selected if name != 'geometry'] + (['geometry'] if 'geometry' in selected else [])
+
+
+def column_values(column, rows: numpy.ndarray) -> list:
+    """
+    Returns the Python values of a column at the given rows, None for nulls.
+    """
+    valid = column.valid[rows].tolist()
+    if column.kind == 'string':
+        categories = column.categories
+        return [categories[code] if ok else None for code, ok in zip(column.values[rows].tolist(), valid)]
+    return [value if ok else None for value, ok in zip(column.values[rows].tolist(), valid)]
+
+
+def iter_records(store, rows: numpy.ndarray, fields: list, extra: dict = None):
+    """
+    Yields the selected attributes of each row as a dictionary, in the shape of a serialized Feature.
+
+    Columns are read a chunk of rows at a time, so memory stays bounded by CHUNK_SIZE rows
+    however many rows are streamed.
+
+    Parameters:
+    - store (FeatureStore): The store the rows come from.
+    - rows (numpy.ndarray): The row numbers to serialize, in output order.
+    - fields (list): The attribute names to include, as returned by resolve_fields.
+    - extra (dict, optional): Additional values per row (name -> sequence aligned with `rows`).
+    """
+    attribute_fields = [name for name in fields if name != 'geometry']
+    with_geometry = 'geometry' in fields
+    extra = extra or {}
+
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        columns = [column_values(store.column(name), chunk) for name in attribute_fields]
+        extra_columns = [(name, list(values[start:start + CHUNK_SIZE])) for name, values in extra.items()]
+        if with_geometry:
+            xs = [None if numpy.isnan(x) else x for x in store.x[chunk].tolist()]
+            ys = [None if numpy.isnan(y) else y for y in store.y[chunk].tolist()]
+
+        for position in range(len(chunk)):
+            record = {name: values[position] for name, values in zip(attribute_fields, columns)}
+            if with_geometry:
+                record['geometry'] = {'x': xs[position], 'y': ys[position]}
+            for name, values in extra_columns:
+                record[name] = values[position]
+            yield record
+
+
+def stream_json(records):
+    """
+    Streams the records as a JSON array.
+    """
+    yield '['
+    for position, record in enumerate(records):
+        yield (',' if position else '') + json.dumps(record, sort_keys=True)
+    yield ']'
+
+
+def stream_ndjson(records):
+    """
+    Streams the records as newline delimited JSON, one record per line.
+    """
+    for record in records:
+        yield json.dumps(record, sort_keys=True) + '\n'
+
+
+def stream_geojson(records):
+    """
+    Streams the records as a GeoJSON FeatureCollection of points.
+    """
+    yield '{"type": "FeatureCollection", "features": ['
+    for position, record in enumerate(records):
+        geometry = record.pop('geometry', None)
+        point = None
+        if geometry and geometry['x'] is not None and geometry['y'] is not None:
+            point = {'type': 'Point', 'coordinates': [geometry['x'], geometry['y']]}
+        feature = {'type': 'Feature', 'geometry': point, 'properties': record}
+        yield (',' if position else '') + json.dumps(feature, sort_keys=True)
+    yield ']}'
+
+
+STREAMS = {'json': stream_json, 'ndjson': stream_ndjson, 'geojson': stream_geojson}
+
+
+def encode_cursor(version: int, offset: int) -> str:
+    """
+    Encodes the position of the next page, tied to the data version it was computed on.
+    """
+    return base64.urlsafe_b64encode(f"{version}:{offset}".encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor: str, version: int) -> int:
+    """
+    Decodes a cursor into a row offset.
+
+    Raises:
+    - ValueError: If the cursor is malformed or was issued for another data version.
+    """
+    try:
+        cursor_version, offset = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split(':')
+        cursor_version, offset = int(cursor_version), int(offset)
+    except (ValueError, UnicodeError):
+        raise ValueError("Malformed cursor.")
+    if cursor_version != version:
+        raise ValueError("The cursor belongs to an older version of the data; start again without it.")
+    if offset < 0:
+        raise ValueError("Malformed cursor.")
+    return offset
@@ -0,0 +1,377 @@
+"""
+On-disk snapshots of an ingested layer.
+
+A snapshot is a directory of plain NumPy arrays (one .npy file per column array and string
+dictionary, plus the geometry and the prebuilt time and spatial indexes) and a meta.json
+holding the response header and the high water mark. Opening a snapshot memory-maps the
+arrays read-only, so a new process is ready without downloading or parsing anything, and
+every process on the host that opens the same snapshot shares its pages through the page
+cache instead of holding a private copy.
+
+A refresh only changes a few incidents, so a version merged from the previous one is saved
+as a delta snapshot: a directory holding just the incidents merged, which names the full
+snapshot it builds on and the deltas before it. Opening it opens the full snapshot and
+merges the deltas in order. Once the deltas pass MAX_DELTAS or MAX_DELTA_FRACTION of the
+full snapshot's rows, the next version is saved in full again.
+
+Snapshots are written to a fresh directory next to the previous ones and published by
+atomically replacing the CURRENT file that names the active one, so readers never open a
+partially written snapshot.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy
+
+from arcGISResponse import ArcGISResponse
+from featureStore import Column, FeatureStore
+from spatialIndex import SpatialIndex
+from timeIndex import TimeIndex
+
+FORMAT_VERSION = 3
+
+# older snapshots kept besides the current one and the snapshots it builds on
+KEEP_PREVIOUS = 1
+
+# seconds between two checks for a new current snapshot
+FOLLOW_INTERVAL = 1.0
+
+# deltas saved on top of a full snapshot before the next version is saved in full
+MAX_DELTAS = 24
+
+# incidents in the deltas, relative to the full snapshot's, past which the next version is saved in full
+MAX_DELTA_FRACTION = 0.05
+
+# separates the strings of a dictionary in its .npy file
+STRING_SEPARATOR = '\x00'
+
+
+def _write_array(directory: str, name: str, array: numpy.ndarray):
+    numpy.save(os.path.join(directory, f"{name}.npy"), numpy.ascontiguousarray(array), allow_pickle=False)
+
+
+def _read_array(directory: str, name: str) -> numpy.ndarray:
+    return numpy.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r', allow_pickle=False)
+
+
+def _write_strings(directory: str, name: str, strings: list):
+    # one UTF-8 buffer of the separated strings, and the end of each in it for the strings holding the separator
+    encoded = [string.encode('utf-8') for string in strings]
+    _write_array(directory, f"{name}.strings", numpy.frombuffer(STRING_SEPARATOR.encode().join(encoded), dtype=numpy.uint8))
+    _write_array(directory, f"{name}.ends", numpy.cumsum([len(string) + 1 for string in encoded], dtype=numpy.int64))
+
+
+def _read_strings(directory: str, name: str) -> list:
+    ends = _read_array(directory, f"{name}.ends")
+    if len(ends) == 0:
+        return []
+    buffer = _read_array(directory, f"{name}.strings").tobytes()
+    strings = buffer.decode('utf-8').split(STRING_SEPARATOR)
+    if len(strings) == len(ends):
+        return strings
+    starts = numpy.concatenate(([0], ends[:-1])).tolist()
+    return [buffer[start:end - 1].decode('utf-8') for start, end in zip(starts, ends.tolist())]
+
+
+def _write_store(directory: str, store: FeatureStore) -> dict:
+    """
+    Writes the columns and geometry of a store and returns the description of its columns for meta.json.
+    """
+    columns = {}
+    for index, (field, column) in enumerate(store.columns.items()):
+        _write_array(directory, f"column{index}.values", column.values)
+        _write_array(directory, f"column{index}.valid", column.valid)
+        if column.categories is not None:
+            _write_strings(directory, f"column{index}.categories", column.categories)
+        columns[field] = {'file': f"column{index}", 'kind': column.kind}
+    _write_array(directory, 'x', store.x)
+    _write_array(directory, 'y', store.y)
+    return columns
+
+
+def _read_store(directory: str, columns: dict) -> FeatureStore:
+    store_columns = {}
+    for field, description in columns.items():
+        store_columns[field] = Column(
+            description['kind'],
+            _read_array(directory, f"{description['file']}.values"),
+            _read_array(directory, f"{description['file']}.valid"),
+            _read_strings(directory, f"{description['file']}.categories") if description['kind'] == 'string' else None,
+        )
+    return FeatureStore(store_columns, _read_array(directory, 'x'), _read_array(directory, 'y'))
+
+
+def _read_meta(directory: str) -> dict:
+    """
+    Returns the meta.json of a snapshot directory, or None if it is missing or of another format.
+    """
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('format') == FORMAT_VERSION else None
+
+
+def _extends(meta: dict, dataset: ArcGISResponse) -> bool:
+    # whether the dataset is the version merged right after the one of a snapshot, in few enough changes to save as a delta
+    return (meta is not None and dataset.delta is not None
+            and meta['epoch'] == dataset.epoch and meta['version'] == dataset.version - 1
+            and len(meta['chain']) <= MAX_DELTAS
+            and meta['delta_rows'] + len(dataset.delta) <= MAX_DELTA_FRACTION * meta['base_rows'])
+
+
+def save(dataset: ArcGISResponse, root: str) -> str:
+    """
+    Writes a snapshot of a dataset and makes it the current one. A dataset merged from the
+    version of the current snapshot is written as a delta of it.
+
+    Parameters:
+    - dataset (ArcGISResponse): The dataset to save.
+    - root (str): The directory holding the snapshots.
+
+    Returns:
+    - str: The directory of the new snapshot.
+    """
+    os.makedirs(root, exist_ok=True)
+    previous = current(root)
+    previous_meta = _read_meta(previous) if previous is not None else None
+
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    directory = os.path.join(root, name)
+    os.makedirs(directory)
+
+    meta = {
+        'format': FORMAT_VERSION,
+        'created': time.time(),
+        'header': dataset.header(),
+        'version': dataset.version,
+        'epoch': dataset.epoch,
+        'high_water_mark': dataset.high_water_mark,
+        'rows': len(dataset.store),
+    }
+    if _extends(previous_meta, dataset):
+        meta.update({
+            'columns': _write_store(directory, dataset.delta),
+            'chain': previous_meta['chain'] + [name],
+            'base_rows': previous_meta['base_rows'],
+            'delta_rows': previous_meta['delta_rows'] + len(dataset.delta),
+        })
+    else:
+        meta.update({
+            'columns': _write_store(directory, dataset.store),
+            'chain': [name],
+            'base_rows': len(dataset.store),
+            'delta_rows': 0,
+            'time_indexes': [field for field in dataset.time_indexes],
+        })
+        for index, time_index in enumerate(dataset.time_indexes.values()):
+            _write_array(directory, f"time{index}.timestamps", time_index.timestamps)
+            _write_array(directory, f"time{index}.rows", time_index.rows)
+        spatial = dataset.spatial_index
+        for part, array in (('lon', spatial.lon), ('lat', spatial.lat), ('cells', spatial.cells), ('rows', spatial.rows)):
+            _write_array(directory, f"spatial.{part}", array)
+
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    pointer = os.path.join(root, f"CURRENT.{uuid.uuid4().hex}")
+    with open(pointer, 'w') as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(root, 'CURRENT'))
+
+    _remove_old(root, meta['chain'])
+    return directory
+
+
+def _remove_old(root: str, chain: list):
+    # processes that still map an old snapshot keep their pages after the files are removed
+    # by creation, since several snapshots may be written within the second their names start with
+    others = [entry.name for entry in sorted((entry for entry in os.scandir(root) if entry.is_dir() and entry.name not in chain),
+                                             key=lambda entry: entry.stat().st_mtime_ns)]
+    keep = set(chain)
+    for name in others[-KEEP_PREVIOUS:] if KEEP_PREVIOUS else []:
+        meta = _read_meta(os.path.join(root, name))
+        keep.update(meta['chain'] if meta is not None else [name])
+    for name in others:
+        if name not in keep:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def current(root: str):
+    """
+    Returns the directory of the current snapshot, or None if there is none.
+    """
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            directory = os.path.join(root, f.read().strip())
+    except FileNotFoundError:
+        return None
+    return directory if os.path.isdir(directory) else None
+
+
+def _open_full(directory: str, meta: dict) -> ArcGISResponse:
+    store = _read_store(directory, meta['columns'])
+    time_indexes = {
+        field: TimeIndex(_read_array(directory, f"time{index}.timestamps"), _read_array(directory, f"time{index}.rows"))
+        for index, field in enumerate(meta['time_indexes'])
+    }
+    spatial_index = SpatialIndex(*(_read_array(directory, f"spatial.{name}") for name in ('lon', 'lat', 'cells', 'rows')))
+    return ArcGISResponse.from_store(store, meta['header'], meta['version'], meta['high_water_mark'], time_indexes, spatial_index, meta['epoch'])
+
+
+def _apply(root: str, dataset: ArcGISResponse, names: list) -> ArcGISResponse:
+    # merges the incidents of delta snapshots into a dataset, in order
+    for name in names:
+        directory = os.path.join(root, name)
+        meta = _read_meta(directory)
+        if meta is None:
+            raise ValueError(f"Unusable delta snapshot {name}")
+        dataset = dataset.merge(_read_store(directory, meta['columns']))
+        dataset.version, dataset.high_water_mark = meta['version'], meta['high_water_mark']
+    return dataset
+
+
+def load(root: str):
+    """
+    Opens the current snapshot, memory-mapping its arrays read-only, and merges its deltas.
+
+    Parameters:
+    - root (str): The directory holding the snapshots.
+
+    Returns:
+    - ArcGISResponse or None: The dataset, or None if there is no usable snapshot.
+    """
+    directory = current(root)
+    if directory is None:
+        return None
+    return _load_chain(root, _read_meta(directory))
+
+
+def _load_chain(root: str, meta: dict):
+    if meta is None:
+        return None
+    try:
+        base = os.path.join(root, meta['chain'][0])
+        base_meta = _read_meta(base)
+        if base_meta is None:
+            raise ValueError(f"Unusable snapshot {meta['chain'][0]}")
+        return _apply(root, _open_full(base, base_meta), meta['chain'][1:])
+    except (OSError, ValueError, KeyError) as e:
+        print(f"-- SNAPSHOT UNUSABLE -- {e}")
+        return None
+
+
+def wait(root: str, timeout: float, interval: float = FOLLOW_INTERVAL):
+    """
+    Opens the current snapshot, waiting up to `timeout` seconds for another process to write one.
+
+    Returns:
+    - ArcGISResponse or None: The dataset, or None if no usable snapshot appeared in time.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        dataset = load(root) if current(root) is not None else None
+        if dataset is not None or time.monotonic() >= deadline:
+            return dataset
+        time.sleep(interval)
+
+
+class Follower:
+    """
+    Opens every snapshot another process makes current and hands it to `publish`.
+
+    The arrays of a snapshot are memory-mapped, so however many processes follow the same
+    root they share one copy of the collection in the page cache. A process keeps the pages
+    of the snapshots it still uses after the writer removes their files. A delta snapshot
+    extending the one opened last is merged into the collection it gave, so following a
+    refresh costs as much as the incidents it changed; the arrays merged are private to
+    the process until the next full snapshot.
+
+    A writer that starts over without a usable snapshot numbers its versions from 0 again,
+    in a new epoch. The first snapshot of a new epoch is published with replace=True, as the
+    version after the one served, and the later ones of that epoch keep the same offset, so
+    a follower never rejects them as older than what it serves.
+    """
+    def __init__(self, root: str, get_current, publish, interval: float = FOLLOW_INTERVAL):
+        """
+        Parameters:
+        - root (str): The directory holding the snapshots.
+        - get_current (callable): Returns the ArcGISResponse currently served, or None.
+        - publish (callable): Receives every newly opened ArcGISResponse, and replace=True for
+          the first one of a new epoch, like DatasetHandle.publish.
+        - interval (float, optional): Seconds between checks. Defaults to FOLLOW_INTERVAL.
+        """
+        self.root = root
+        self.get_current = get_current
+        self.publish = publish
+        self.interval = interval
+        self.directory = None
+        self.epoch = None
+        self.offset = 0
+        # the chain of the snapshot opened last and the dataset opened from it
+        self.chain = None
+        self.dataset = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _open(self, meta: dict):
+        chain = meta['chain']
+        if self.chain is not None and chain[:len(self.chain)] == self.chain:
+            try:
+                return _apply(self.root, self.dataset, chain[len(self.chain):])
+            except (OSError, ValueError, KeyError) as e:
+                print(f"-- SNAPSHOT UNUSABLE -- {e}")
+                return None
+        return _load_chain(self.root, meta)
+
+    def follow_once(self) -> bool:
+        """
+        Opens and publishes the current snapshot if it changed since the last check.
+
+        Returns:
+        - bool: True if a new snapshot was published.
+        """
+        directory = current(self.root)
+        if directory is None or directory == self.directory:
+            return False
+        meta = _read_meta(directory)
+        dataset = self._open(meta) if meta is not None else None
+        if dataset is None:
+            return False
+        self.directory = directory
+        self.chain, self.dataset = meta['chain'], dataset
+
+        if dataset.epoch == self.epoch:
+            dataset.version += self.offset
+            return bool(self.publish(dataset))
+        self.epoch = dataset.epoch
+        self.offset = 0
+        served = self.get_current()
+        if served is None or served.epoch == dataset.epoch:
+            return bool(self.publish(dataset))
+        print("-- SNAPSHOT EPOCH CHANGED --")
+        written = dataset.version
+        published = self.publish(dataset, replace=True)
+        self.offset = dataset.version - written
+        return bool(published)
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self.follow_once()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='snapshot-follower', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,160 @@
+import math
+
+import numpy
+
+EARTH_RADIUS_KM = 6371.0088
+
+# grid cell size, in degrees
+CELL_SIZE = 0.5
+
+# spatial references whose coordinates are Web Mercator metres instead of degrees
+WEB_MERCATOR_WKIDS = (102100, 102113, 3857, 900913)
+
+
+def lon_lat(store, wkid: int = 4326) -> tuple:
+    """
+    Returns the longitude and latitude of every row, in degrees.
+
+    The point geometry is used when present, converted from Web Mercator if the layer is served
+    in it; InitialLongitude/InitialLatitude fill in the rows without geometry. Rows with neither
+    are NaN.
+    """
+    x, y = store.x, store.y
+    if wkid in WEB_MERCATOR_WKIDS:
+        x = numpy.degrees(x / 6378137.0)
+        y = numpy.degrees(2 * numpy.arctan(numpy.exp(y / 6378137.0)) - math.pi / 2)
+
+    lon, lat = x.copy(), y.copy()
+    if 'InitialLongitude' in store.columns and 'InitialLatitude' in store.columns:
+        missing = (numpy.isnan(lon) | numpy.isnan(lat)) & store.not_null('InitialLongitude') & store.not_null('InitialLatitude')
+        lon[missing] = store.values('InitialLongitude')[missing]
+        lat[missing] = store.values('InitialLatitude')[missing]
+    return lon, lat
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in kilometres; the arguments may be NumPy arrays.
+    """
+    lat1, lon1, lat2, lon2 = map(numpy.radians, (lat1, lon1, lat2, lon2))
+    a = numpy.sin((lat2 - lat1) / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """
+    Uniform grid index over the incident locations.
+
+    Each located row is assigned the cell of a CELL_SIZE degree grid, numbered row by row,
+    and the rows are kept sorted by cell. The cells of one grid row that fall inside a bounding
+    box are then a single contiguous slice, so a box query costs one binary search per grid row
+    plus an exact check of the candidates near its edges. Boxes do not wrap across the antimeridian.
+    """
+    COLUMNS = int(360 / CELL_SIZE)
+
+    def __init__(self, lon: numpy.ndarray, lat: numpy.ndarray, cells: numpy.ndarray, rows: numpy.ndarray):
+        self.lon = lon
+        self.lat = lat
+        self.cells = cells
+        self.rows = rows
+
+    @staticmethod
+    def cell_of(lon, lat):
+        column = numpy.clip(numpy.floor((lon + 180.0) / CELL_SIZE), 0, SpatialIndex.COLUMNS - 1).astype(numpy.int64)
+        row = numpy.clip(numpy.floor((lat + 90.0) / CELL_SIZE), 0, int(180 / CELL_SIZE) - 1).astype(numpy.int64)
+        return row * SpatialIndex.COLUMNS + column
+
+    @classmethod
+    def build(cls, store, wkid: int = 4326) -> 'SpatialIndex':
+        """
+        Builds the index over the locations of a FeatureStore.
+        """
+        lon, lat = lon_lat(store, wkid)
+        rows = numpy.flatnonzero(~(numpy.isnan(lon) | numpy.isnan(lat)))
+        cells = cls.cell_of(lon[rows], lat[rows])
+        order = numpy.argsort(cells, kind='stable')
+        return cls(lon, lat, cells[order], rows[order])
+
+    def updated(self, store, changed_rows: numpy.ndarray, wkid: int = 4326) -> 'SpatialIndex':
+        """
+        Returns an index reflecting new locations at `changed_rows`, merging them into the sorted cells.
+        """
+        lon, lat = lon_lat(store, wkid)
+        keep = ~numpy.isin(self.rows, changed_rows)
+        cells, rows = self.cells[keep], self.rows[keep]
+
+        changed_rows = numpy.unique(changed_rows)
+        changed_rows = changed_rows[~(numpy.isnan(lon[changed_rows]) | numpy.isnan(lat[changed_rows]))]
+        new_cells = self.cell_of(lon[changed_rows], lat[changed_rows])
+        order = numpy.argsort(new_cells, kind='stable')
+
+        positions = numpy.searchsorted(cells, new_cells[order], side='right')
+        return SpatialIndex(lon, lat, numpy.insert(cells, positions, new_cells[order]), numpy.insert(rows, positions, changed_rows[order]))
+
+    def _cell_ranges(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> tuple:
+        first = self.cell_of(numpy.float64(min_lon), numpy.float64(min_lat))
+        last = self.cell_of(numpy.float64(max_lon), numpy.float64(max_lat))
+        first_column, last_column = first % self.COLUMNS, last % self.COLUMNS
+
+        grid_rows = numpy.arange(first // self.COLUMNS, last // self.COLUMNS + 1)
+        starts = numpy.searchsorted(self.cells, grid_rows * self.COLUMNS + first_column, side='left')
+        ends = numpy.searchsorted(self.cells, grid_rows * self.COLUMNS + last_column, side='right')
+        return starts, ends
+
+    def _candidates(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> numpy.ndarray:
+        starts, ends = self._cell_ranges(min_lon, min_lat, max_lon, max_lat)
+        parts = [self.rows[start:end] for start, end in zip(starts.tolist(), ends.tolist()) if end > start]
+        return numpy.concatenate(parts) if parts else numpy.empty(0, dtype=numpy.int64)
+
+    def estimate_bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> int:
+        """
+        Returns the number of rows in the cells a bounding box overlaps, an upper bound of
+        within_bbox's result found with binary searches only.
+        """
+        starts, ends = self._cell_ranges(min_lon, min_lat, max_lon, max_lat)
+        return int((ends - starts).sum())
+
+    def within_bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> numpy.ndarray:
+        """
+        Returns the rows located inside a bounding box (edges included), in row order.
+
+        Parameters:
+        - min_lon, min_lat, max_lon, max_lat (float): The box, in degrees.
+
+        Returns:
+        - numpy.ndarray: The matching row numbers.
+        """
+        if min_lon > max_lon or min_lat > max_lat:
+            raise ValueError("The minimum corner of the box must be south-west of the maximum corner.")
+
+        candidates = self._candidates(min_lon, min_lat, max_lon, max_lat)
+        lon, lat = self.lon[candidates], self.lat[candidates]
+        inside = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+        return numpy.sort(candidates[inside])
+
+    def near(self, lat: float, lon: float, radius_km: float) -> tuple:
+        """
+        Returns the rows located within a radius of a point, closest first.
+
+        Parameters:
+        - lat (float): Latitude of the point, in degrees.
+        - lon (float): Longitude of the point, in degrees.
+        - radius_km (float): The radius, in kilometres.
+
+        Returns:
+        - tuple: (row numbers, distances in km), both ordered by distance.
+        """
+        if radius_km < 0:
+            raise ValueError("The radius must not be negative.")
+
+        lat_span = math.degrees(radius_km / EARTH_RADIUS_KM)
+        cos_lat = math.cos(math.radians(min(abs(lat) + lat_span, 90.0)))
+        lon_span = 180.0 if cos_lat < 1e-9 else min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180.0)
+
+        candidates = self._candidates(max(lon - lon_span, -180.0), max(lat - lat_span, -90.0),
+                                      min(lon + lon_span, 180.0), min(lat + lat_span, 90.0))
+        distances = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+        inside = distances <= radius_km
+        candidates, distances = candidates[inside], distances[inside]
+        order = numpy.argsort(distances, kind='stable')
+        return candidates[order], distances[order]
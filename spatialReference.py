@@ -1,4 +1,4 @@
 class SpatialReference:
-    def __init__(self, wkid, latestWkid):
+    def __init__(self, wkid=None, latestWkid=None, **extra):
         self.wkid = wkid
         self.latestWkid = latestWkid
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+A sampling profiler for one thread.
+
+A helper thread reads the stack of the profiled thread every `interval` seconds through
+sys._current_frames and counts each distinct stack. The result is written in the folded
+format read by flamegraph.pl, speedscope and most other flame graph tools: one line per
+stack, frames from the outermost to the innermost separated by ';', then the sample count.
+The profiled thread is never interrupted, so its timing is only disturbed by the sampler
+competing for the interpreter.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# seconds between two samples
+DEFAULT_INTERVAL = 0.001
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class StackSampler:
+    """
+    Samples the stack of a thread between start() and stop(), or within a with block.
+    """
+    def __init__(self, thread_id: int = None, interval: float = DEFAULT_INTERVAL):
+        """
+        Parameters:
+        - thread_id (int, optional): The thread to sample. Defaults to the calling thread.
+        - interval (float, optional): Seconds between samples. Defaults to DEFAULT_INTERVAL.
+        """
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._stopped = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+            self.samples += 1
+
+    def start(self) -> 'StackSampler':
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> 'StackSampler':
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.duration = time.perf_counter() - self._started
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def folded(self) -> str:
+        """
+        Returns the sampled stacks in the folded format, most frequent first.
+        """
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
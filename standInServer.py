@@ -0,0 +1,271 @@
+"""
+A local stand-in for the ArcGIS FeatureServer query endpoint.
+
+Serves the features of a saved query response (for example the output of
+`curl "<BASE_URL>" > layer.json`) and mimics the parts of the REST API the
+ingestion code relies on: a record cap with exceededTransferLimit,
+returnCountOnly, returnIdsOnly, resultOffset/resultRecordCount, outFields, simple
+where clauses, the `time` extent of the layer's time field and envelope `geometry` filters.
+
+Usage:
+    python standInServer.py layer.json --port 8001 --max-record-count 1000
+"""
+import argparse
+import json
+import re
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+OBJECT_ID_FIELD = 'OBJECTID'
+
+# the field the `time` parameter filters on
+TIME_FIELD = 'FireDiscoveryDateTime'
+
+TOKEN_PATTERN = re.compile(r"\s*('(?:[^']|'')*'|>=|<=|<>|!=|=|<|>|\(|\)|,|-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|\w+)")
+
+
+def tokenize(where: str) -> list:
+    tokens = []
+    position = 0
+    where = where.strip()
+    while position < len(where):
+        match = TOKEN_PATTERN.match(where, position)
+        if not match:
+            raise ValueError(f"Unsupported where clause: {where}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+class WhereParser:
+    """
+    Recursive descent parser for the subset of the ArcGIS where syntax used by the ingestion code.
+
+    Supported: 1=1, parentheses, AND/OR, comparisons of a field or UPPER(field) with a number,
+    a quoted string or a TIMESTAMP 'YYYY-MM-DD HH:MM:SS' literal (compared as epoch ms),
+    LIKE patterns with % and _ wildcards and IN lists.
+    The result is a predicate taking the attributes of a feature.
+    """
+    OPERATORS = {
+        '=': lambda a, b: a == b,
+        '<>': lambda a, b: a != b,
+        '!=': lambda a, b: a != b,
+        '<': lambda a, b: a < b,
+        '<=': lambda a, b: a <= b,
+        '>': lambda a, b: a > b,
+        '>=': lambda a, b: a >= b,
+    }
+
+    def __init__(self, where: str):
+        self.tokens = tokenize(where or '1=1')
+        self.position = 0
+
+    def parse(self):
+        predicate = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unexpected token: {self.tokens[self.position]}")
+        return predicate
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("Unexpected end of where clause")
+        self.position += 1
+        return token
+
+    def parse_or(self):
+        predicates = [self.parse_and()]
+        while (self.peek() or '').upper() == 'OR':
+            self.take()
+            predicates.append(self.parse_and())
+        return predicates[0] if len(predicates) == 1 else (lambda attributes: any(p(attributes) for p in predicates))
+
+    def parse_and(self):
+        predicates = [self.parse_term()]
+        while (self.peek() or '').upper() == 'AND':
+            self.take()
+            predicates.append(self.parse_term())
+        return predicates[0] if len(predicates) == 1 else (lambda attributes: all(p(attributes) for p in predicates))
+
+    def parse_term(self):
+        if self.peek() == '(':
+            self.take()
+            predicate = self.parse_or()
+            if self.take() != ')':
+                raise ValueError("Missing closing parenthesis")
+            return predicate
+        return self.parse_comparison()
+
+    def parse_value(self):
+        token = self.take()
+        if token.upper() in ('TIMESTAMP', 'DATE') and (self.peek() or '').startswith("'"):
+            literal = self.take().strip("'")
+            moment = datetime.strptime(literal, '%Y-%m-%d %H:%M:%S' if ' ' in literal else '%Y-%m-%d')
+            value = int(moment.replace(tzinfo=timezone.utc).timestamp() * 1000)
+            return lambda attributes: value
+        if token.upper() == 'UPPER' and self.peek() == '(':
+            self.take()
+            inner = self.parse_value()
+            if self.take() != ')':
+                raise ValueError("Missing closing parenthesis")
+            return lambda attributes: inner(attributes).upper() if isinstance(inner(attributes), str) else inner(attributes)
+        if token.startswith("'"):
+            text = token[1:-1].replace("''", "'")
+            return lambda attributes: text
+        try:
+            value = float(token)
+            return lambda attributes: value
+        except ValueError:
+            return lambda attributes: attributes.get(token)
+
+    def parse_comparison(self):
+        left = self.parse_value()
+        keyword = (self.peek() or '').upper()
+        if keyword == 'LIKE':
+            self.take()
+            pattern = self.parse_value()({})
+            expression = re.compile(''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern), re.DOTALL)
+            return lambda attributes: isinstance(left(attributes), str) and expression.fullmatch(left(attributes)) is not None
+        if keyword == 'IN':
+            self.take()
+            if self.take() != '(':
+                raise ValueError("Expected a list after IN")
+            values = [self.parse_value()({})]
+            while self.peek() == ',':
+                self.take()
+                values.append(self.parse_value()({}))
+            if self.take() != ')':
+                raise ValueError("Missing closing parenthesis")
+            return lambda attributes: left(attributes) in values
+
+        operator = self.OPERATORS.get(self.take())
+        if operator is None:
+            raise ValueError("Expected a comparison operator")
+        right = self.parse_value()
+
+        def predicate(attributes):
+            a, b = left(attributes), right(attributes)
+            return a is not None and b is not None and operator(a, b)
+        return predicate
+
+
+class StandInLayer:
+    """
+    Holds the features served by the stand-in, each tagged with a sequential object id.
+    """
+    def __init__(self, payload: dict, max_record_count: int = 1000):
+        self.payload = payload
+        self.max_record_count = max_record_count
+        self.features = []
+        for object_id, feature in enumerate(payload.get('features', []), start=1):
+            attributes = dict(feature['attributes'])
+            attributes.setdefault(OBJECT_ID_FIELD, object_id)
+            self.features.append({'attributes': attributes, 'geometry': feature.get('geometry')})
+
+    @staticmethod
+    def in_time(feature: dict, extent: str) -> bool:
+        # 'start,end' in epoch ms, either one 'null' for an open end; a single instant is also accepted
+        if not extent:
+            return True
+        bounds = [None if bound.strip() == 'null' else float(bound) for bound in extent.split(',')]
+        start, end = (bounds[0], bounds[0]) if len(bounds) == 1 else bounds
+        value = feature['attributes'].get(TIME_FIELD)
+        return value is not None and (start is None or value >= start) and (end is None or value <= end)
+
+    @staticmethod
+    def in_envelope(feature: dict, envelope: str) -> bool:
+        # 'xmin,ymin,xmax,ymax' in the spatial reference of the features
+        if not envelope:
+            return True
+        xmin, ymin, xmax, ymax = (float(value) for value in envelope.split(','))
+        geometry = feature.get('geometry') or {}
+        x, y = geometry.get('x'), geometry.get('y')
+        return x is not None and y is not None and xmin <= x <= xmax and ymin <= y <= ymax
+
+    def query(self, params: dict) -> dict:
+        where, extent, envelope = params.get('where', '1=1'), params.get('time'), params.get('geometry')
+        if where.replace(' ', '') == '1=1' and not extent and not envelope:
+            # the whole layer, without evaluating anything per feature
+            matches = self.features
+        else:
+            predicate = WhereParser(where).parse()
+            matches = [f for f in self.features if predicate(f['attributes']) and self.in_time(f, extent) and self.in_envelope(f, envelope)]
+
+        if params.get('returnCountOnly') == 'true':
+            return {'count': len(matches)}
+        if params.get('returnIdsOnly') == 'true':
+            return {'objectIdFieldName': OBJECT_ID_FIELD, 'objectIds': [f['attributes'][OBJECT_ID_FIELD] for f in matches]}
+
+        offset = int(params.get('resultOffset', 0))
+        record_count = min(int(params.get('resultRecordCount', self.max_record_count)), self.max_record_count)
+        page = matches[offset:offset + record_count]
+
+        out_fields = params.get('outFields', '*')
+        if out_fields != '*':
+            names = out_fields.split(',')
+            page = [{'attributes': {name: f['attributes'].get(name) for name in names}, 'geometry': f['geometry']} for f in page]
+
+        result = {key: value for key, value in self.payload.items() if key != 'features'}
+        result['objectIdFieldName'] = OBJECT_ID_FIELD
+        result['exceededTransferLimit'] = offset + record_count < len(matches)
+        result['features'] = page
+        return result
+
+
+def make_handler(layer: StandInLayer):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            params = dict(parse_qsl(urlsplit(self.path).query, keep_blank_values=True))
+            try:
+                body = layer.query(params)
+            except ValueError as e:
+                body = {'error': {'code': 400, 'message': str(e)}}
+            encoded = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+
+def serve(payload: dict, host: str = '127.0.0.1', port: int = 0, max_record_count: int = 1000):
+    """
+    Starts the stand-in server on a background thread.
+
+    Parameters:
+    - payload (dict): An ArcGIS query response whose features are served.
+    - host (str, optional): Interface to bind. Defaults to '127.0.0.1'.
+    - port (int, optional): Port to bind, 0 picks a free one. Defaults to 0.
+    - max_record_count (int, optional): Record cap per page. Defaults to 1000.
+
+    Returns:
+    - tuple: (server, query url). Call server.shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(StandInLayer(payload, max_record_count)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/query?where=1%3D1&f=json"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a saved ArcGIS query response with paging.')
+    parser.add_argument('payload', help='Path to a saved ArcGIS query response (JSON).')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--max-record-count', type=int, default=1000)
+    args = parser.parse_args()
+
+    with open(args.payload) as f:
+        payload = json.load(f)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(StandInLayer(payload, args.max_record_count)))
+    print(f"Serving {len(payload.get('features', []))} features on http://{args.host}:{args.port}/query")
+    server.serve_forever()
@@ -0,0 +1,267 @@
+"""
+Synthetic WFIGS incident layers for benchmarks and local testing.
+
+Generates query responses in the ArcGIS JSON format with the fields of BASE_URL. Counties
+follow a Zipf-like distribution, discoveries peak in the summer months and in the afternoon,
+sizes are log-normal with a long tail, and every attribute has a null rate close to the one
+of the live layer. The same count and seed always give the same incidents.
+
+Usage:
+    python syntheticData.py 100000 --seed 0 --output layer.json
+"""
+import argparse
+import json
+import sys
+import uuid
+from datetime import datetime, timezone
+
+import numpy
+
+# the attributes of an incident and their esri field types, in BASE_URL's outFields order
+FIELD_TYPES = {
+    'ContainmentDateTime': 'esriFieldTypeDate',
+    'ControlDateTime': 'esriFieldTypeDate',
+    'IncidentSize': 'esriFieldTypeDouble',
+    'DiscoveryAcres': 'esriFieldTypeDouble',
+    'FinalAcres': 'esriFieldTypeDouble',
+    'FireCause': 'esriFieldTypeString',
+    'FireCauseSpecific': 'esriFieldTypeString',
+    'FireDiscoveryDateTime': 'esriFieldTypeDate',
+    'FireOutDateTime': 'esriFieldTypeDate',
+    'FireStrategyPointZonePercent': 'esriFieldTypeDouble',
+    'IncidentName': 'esriFieldTypeString',
+    'IncidentShortDescription': 'esriFieldTypeString',
+    'IncidentTypeKind': 'esriFieldTypeString',
+    'IsFireCauseInvestigated': 'esriFieldTypeString',
+    'IsFireCodeRequested': 'esriFieldTypeString',
+    'CreatedOnDateTime_dt': 'esriFieldTypeDate',
+    'ModifiedOnDateTime_dt': 'esriFieldTypeDate',
+    'SourceGlobalID': 'esriFieldTypeString',
+    'IncidentComplexityLevel': 'esriFieldTypeString',
+    'POOCity': 'esriFieldTypeString',
+    'POOCounty': 'esriFieldTypeString',
+    'SourceOID': 'esriFieldTypeInteger',
+    'FireStrategyMonitorPercent': 'esriFieldTypeDouble',
+    'InitialLatitude': 'esriFieldTypeDouble',
+    'InitialLongitude': 'esriFieldTypeDouble',
+}
+
+# share of null values per attribute; the others are never null
+NULL_RATES = {
+    'ContainmentDateTime': 0.45,
+    'ControlDateTime': 0.55,
+    'IncidentSize': 0.15,
+    'DiscoveryAcres': 0.4,
+    'FinalAcres': 0.6,
+    'FireCause': 0.05,
+    'FireCauseSpecific': 0.8,
+    'FireOutDateTime': 0.5,
+    'FireStrategyPointZonePercent': 0.9,
+    'IncidentShortDescription': 0.7,
+    'IsFireCauseInvestigated': 0.6,
+    'IsFireCodeRequested': 0.3,
+    'IncidentComplexityLevel': 0.85,
+    'POOCity': 0.25,
+    'FireStrategyMonitorPercent': 0.9,
+    'geometry': 0.02,
+}
+
+# (county, city, latitude, longitude), most fire-prone first
+COUNTIES = [
+    ('Riverside', 'Riverside', 33.74, -116.0), ('San Bernardino', 'Victorville', 34.84, -116.18),
+    ('Los Angeles', 'Los Angeles', 34.32, -118.22), ('Maricopa', 'Phoenix', 33.35, -112.49),
+    ('San Diego', 'Escondido', 33.03, -116.74), ('Kern', 'Bakersfield', 35.34, -118.73),
+    ('Shasta', 'Redding', 40.76, -122.04), ('Ventura', 'Ventura', 34.36, -119.13),
+    ('Fresno', 'Fresno', 36.76, -119.65), ('Ada', 'Boise', 43.45, -116.24),
+    ('Deschutes', 'Bend', 43.91, -121.23), ('Coconino', 'Flagstaff', 35.84, -111.77),
+    ('Butte', 'Chico', 39.67, -121.6), ('Tulare', 'Visalia', 36.22, -118.8),
+    ('Santa Barbara', 'Santa Barbara', 34.67, -120.02), ('Jackson', 'Medford', 42.43, -122.73),
+    ('Lake', 'Clearlake', 39.1, -122.75), ('Mendocino', 'Ukiah', 39.44, -123.39),
+    ('El Dorado', 'Placerville', 38.78, -120.52), ('Mohave', 'Kingman', 35.7, -113.75),
+    ('Larimer', 'Fort Collins', 40.66, -105.46), ('Spokane', 'Spokane', 47.62, -117.4),
+    ('Yavapai', 'Prescott', 34.6, -112.55), ('Clark', 'Las Vegas', 36.21, -115.01),
+    ('Siskiyou', 'Yreka', 41.59, -122.54), ('Pima', 'Tucson', 32.1, -111.79),
+    ('Lincoln', 'Newport', 44.64, -123.9), ('Chelan', 'Wenatchee', 47.86, -120.62),
+    ('Missoula', 'Missoula', 47.04, -113.92), ('Okanogan', 'Omak', 48.55, -119.74),
+]
+
+CAUSES = (['Human', 'Natural', 'Undetermined', 'Unknown'], [0.58, 0.22, 0.14, 0.06])
+SPECIFIC_CAUSES = ['Debris Burning', 'Equipment Use', 'Lightning', 'Vehicle', 'Campfire', 'Arson', 'Power Line']
+TYPE_KINDS = (['FI', 'CX', 'RX'], [0.93, 0.05, 0.02])
+COMPLEXITY_LEVELS = ['Type 1 Incident', 'Type 2 Incident', 'Type 3 Incident', 'Type 4 Incident', 'Type 5 Incident']
+NAME_WORDS = ['Creek', 'Canyon', 'Ridge', 'Oak', 'Pine', 'Valley', 'Mesa', 'Butte', 'Hill', 'Road', 'Lake', 'Peak', 'Cedar', 'River']
+DESCRIPTIONS = ['near {city}', 'north of {city}', 'south of {city}', 'off the highway east of {city}', 'Mile marker {number}']
+
+# share of discoveries per month and per local hour
+MONTH_WEIGHTS = [0.02, 0.02, 0.04, 0.06, 0.08, 0.12, 0.17, 0.18, 0.13, 0.09, 0.05, 0.04]
+HOUR_WEIGHTS = [1, 0.8, 0.6, 0.5, 0.4, 0.4, 0.5, 0.7, 1.0, 1.6, 2.4, 3.4, 4.4, 5.4, 6.2, 6.6, 6.4, 5.6, 4.6, 3.4, 2.5, 1.9, 1.5, 1.2]
+
+# discoveries are spread over these years; local time is taken as UTC-8
+FIRST_YEAR = 2014
+LAST_YEAR = 2024
+UTC_OFFSET_MS = 8 * 3600 * 1000
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# incidents generated at a time
+CHUNK_SIZE = 50000
+
+
+def fields() -> list:
+    """
+    Returns the `fields` member of a query response, one entry per FIELD_TYPES attribute.
+    """
+    return [{'name': name, 'type': field_type, 'alias': name, 'sqlType': 'sqlTypeOther', 'domain': None, 'defaultValue': None,
+             **({'length': 255} if field_type == 'esriFieldTypeString' else {})}
+            for name, field_type in FIELD_TYPES.items()]
+
+
+def header() -> dict:
+    """
+    Returns the members of a query response other than its features.
+    """
+    return {
+        'objectIdFieldName': 'OBJECTID',
+        'uniqueIdField': {'name': 'OBJECTID', 'isSystemMaintained': True},
+        'globalIdFieldName': '',
+        'geometryType': 'esriGeometryPoint',
+        'spatialReference': {'wkid': 4326, 'latestWkid': 4326},
+        'fields': fields(),
+        'exceededTransferLimit': False,
+    }
+
+
+def _weights(count: int, exponent: float = 1.1) -> numpy.ndarray:
+    weights = 1.0 / numpy.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _normalized(weights: list) -> numpy.ndarray:
+    weights = numpy.asarray(weights, dtype=numpy.float64)
+    return weights / weights.sum()
+
+
+def _with_nulls(rng, name: str, values: list) -> list:
+    """
+    Replaces a share NULL_RATES[name] of the values by None.
+    """
+    rate = NULL_RATES.get(name, 0)
+    if rate == 0:
+        return values
+    nulls = rng.random(len(values)) < rate
+    return [None if null else value for value, null in zip(values, nulls.tolist())]
+
+
+def _discovery_times(rng, count: int) -> numpy.ndarray:
+    years = rng.integers(FIRST_YEAR, LAST_YEAR + 1, count)
+    months = rng.choice(12, count, p=_normalized(MONTH_WEIGHTS))
+    days = rng.integers(0, 28, count)
+    hours = rng.choice(24, count, p=_normalized(HOUR_WEIGHTS))
+    month_starts = ((years - 1970) * 12 + months).astype('datetime64[M]').astype('datetime64[ms]').astype(numpy.int64)
+    return month_starts + days * DAY_MS + hours * HOUR_MS + rng.integers(0, HOUR_MS, count) + UTC_OFFSET_MS
+
+
+def chunk(count: int, seed: int = 0, first_oid: int = 0) -> list:
+    """
+    Generates raw features ({'attributes': ..., 'geometry': ...}).
+
+    Parameters:
+    - count (int): The number of incidents.
+    - seed (int, optional): Seed of the random generator. Defaults to 0.
+    - first_oid (int, optional): SourceOID of the first incident. Defaults to 0.
+
+    Returns:
+    - list: The features.
+    """
+    rng = numpy.random.default_rng([seed, first_oid])
+    now = int(datetime(LAST_YEAR + 1, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+    county = rng.choice(len(COUNTIES), count, p=_weights(len(COUNTIES)))
+    county_names = [COUNTIES[i][0] for i in county.tolist()]
+    cities = [COUNTIES[i][1] for i in county.tolist()]
+    latitude = numpy.array([COUNTIES[i][2] for i in county.tolist()]) + rng.normal(0, 0.3, count)
+    longitude = numpy.array([COUNTIES[i][3] for i in county.tolist()]) + rng.normal(0, 0.3, count)
+
+    discovered = _discovery_times(rng, count)
+    contained = discovered + (rng.exponential(2, count) * DAY_MS).astype(numpy.int64)
+    controlled = contained + (rng.exponential(3, count) * DAY_MS).astype(numpy.int64)
+    out = controlled + (rng.exponential(10, count) * DAY_MS).astype(numpy.int64)
+    created = discovered + rng.integers(5 * 60 * 1000, 6 * HOUR_MS, count)
+    modified = numpy.minimum(created + (rng.exponential(30, count) * DAY_MS).astype(numpy.int64), now)
+
+    size = numpy.round(rng.lognormal(0, 2.5, count), 2)
+    discovery_acres = numpy.round(numpy.minimum(size, rng.exponential(0.5, count)), 2)
+    causes = rng.choice(CAUSES[0], count, p=CAUSES[1]).tolist()
+    number = rng.integers(1, 100, count).tolist()
+
+    attributes = {
+        'ContainmentDateTime': contained.tolist(),
+        'ControlDateTime': controlled.tolist(),
+        'IncidentSize': size.tolist(),
+        'DiscoveryAcres': discovery_acres.tolist(),
+        'FinalAcres': size.tolist(),
+        'FireCause': causes,
+        'FireCauseSpecific': rng.choice(SPECIFIC_CAUSES, count).tolist(),
+        'FireDiscoveryDateTime': discovered.tolist(),
+        'FireOutDateTime': out.tolist(),
+        'FireStrategyPointZonePercent': numpy.round(rng.uniform(0, 100, count), 0).tolist(),
+        'IncidentName': [f"{word} {n}" for word, n in zip(rng.choice(NAME_WORDS, count).tolist(), number)],
+        'IncidentShortDescription': [template.format(city=city, number=n)
+                                     for template, city, n in zip(rng.choice(DESCRIPTIONS, count).tolist(), cities, number)],
+        'IncidentTypeKind': rng.choice(TYPE_KINDS[0], count, p=TYPE_KINDS[1]).tolist(),
+        'IsFireCauseInvestigated': rng.choice(['Yes', 'No'], count).tolist(),
+        'IsFireCodeRequested': rng.choice(['Yes', 'No'], count, p=[0.1, 0.9]).tolist(),
+        'CreatedOnDateTime_dt': created.tolist(),
+        'ModifiedOnDateTime_dt': modified.tolist(),
+        'SourceGlobalID': ['{' + str(uuid.UUID(bytes=bytes(value))).upper() + '}' for value in rng.integers(0, 256, (count, 16), dtype=numpy.uint8)],
+        'IncidentComplexityLevel': rng.choice(COMPLEXITY_LEVELS, count, p=[0.02, 0.05, 0.13, 0.3, 0.5]).tolist(),
+        'POOCity': cities,
+        'POOCounty': county_names,
+        'SourceOID': list(range(first_oid, first_oid + count)),
+        'FireStrategyMonitorPercent': numpy.round(rng.uniform(0, 100, count), 0).tolist(),
+        'InitialLatitude': numpy.round(latitude, 5).tolist(),
+        'InitialLongitude': numpy.round(longitude, 5).tolist(),
+    }
+    columns = [_with_nulls(rng, name, values) for name, values in attributes.items()]
+    geometries = _with_nulls(rng, 'geometry', [{'x': x, 'y': y} for x, y in zip(attributes['InitialLongitude'], attributes['InitialLatitude'])])
+    names = list(attributes)
+    return [{'attributes': dict(zip(names, values)), 'geometry': geometry} for *values, geometry in zip(*columns, geometries)]
+
+
+def generate(count: int, seed: int = 0) -> dict:
+    """
+    Returns a query response holding `count` synthetic incidents.
+    """
+    features = []
+    for start in range(0, count, CHUNK_SIZE):
+        features.extend(chunk(min(CHUNK_SIZE, count - start), seed, start))
+    return {**header(), 'features': features}
+
+
+def write(stream, count: int, seed: int = 0):
+    """
+    Writes a query response holding `count` synthetic incidents to a text stream, a chunk
+    at a time, so millions of incidents never have to be held in memory at once.
+    Gives the same incidents as generate.
+    """
+    stream.write(json.dumps(header())[:-1] + ', "features": [')
+    for start in range(0, count, CHUNK_SIZE):
+        if start:
+            stream.write(', ')
+        stream.write(json.dumps(chunk(min(CHUNK_SIZE, count - start), seed, start))[1:-1])
+    stream.write(']}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic WFIGS query response.')
+    parser.add_argument('count', type=int, help='Number of incidents, e.g. 10000 to 5000000.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Output file. Standard output if not given.')
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            write(f, args.count, args.seed)
+    else:
+        write(sys.stdout, args.count, args.seed)
@@ -0,0 +1,62 @@
+"""
+Shared fixtures: a synthetic layer served by the stand-in server, and main.py wired to it.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import standInServer
+import syntheticData
+import ingestion
+
+# incidents of the synthetic layer, and the stand-in server's record cap
+LAYER_SIZE = 2000
+MAX_RECORD_COUNT = 300
+
+
+def layer_url(url: str) -> str:
+    """
+    Returns a stand-in query url asking for the outFields of main.BASE_URL.
+    """
+    return ingestion.with_params(url, outFields=ingestion.query_param(main.BASE_URL, 'outFields'))
+
+
+@pytest.fixture(scope='session')
+def layer():
+    """
+    A synthetic query response, with a few incident names the where clause has to escape.
+    """
+    payload = syntheticData.generate(LAYER_SIZE, seed=7)
+    payload['features'][0]['attributes']['IncidentName'] = "O'Neil Creek"
+    payload['features'][1]['attributes']['IncidentName'] = "100% Ridge"
+    payload['features'][2]['attributes']['IncidentName'] = "Under_Score  Fire"
+    return payload
+
+
+@pytest.fixture(scope='session')
+def layer_server(layer):
+    """
+    The query url of the synthetic layer served by the stand-in server.
+    """
+    server, url = standInServer.serve(layer, max_record_count=MAX_RECORD_COUNT)
+    yield layer_url(url)
+    server.shutdown()
+
+
+@pytest.fixture
+def service(layer_server, tmp_path, monkeypatch):
+    """
+    main.py serving the stand-in layer from scratch, with its snapshots in a temporary directory.
+    """
+    monkeypatch.setattr(main, 'BASE_URL', layer_server)
+    monkeypatch.setattr(main, 'SNAPSHOT_DIR', str(tmp_path / 'snapshot'))
+    monkeypatch.setattr(main, 'QUERY_PUSHDOWN', False)
+    for name in ('_refresher', '_plot_cache', '_response_cache', '_pushdown', '_follower'):
+        monkeypatch.setattr(main, name, None)
+    main._dataset.clear()
+    yield main
+    main._dataset.clear()
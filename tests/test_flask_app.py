@@ -0,0 +1,239 @@
+import json
+
+import pytest
+
+import flask_app
+import standInServer
+from conftest import layer_url
+
+
+@pytest.fixture
+def client(service):
+    return flask_app.create_app().test_client()
+
+
+def source_oids(response):
+    return sorted(feature['SourceOID'] for feature in response.get_json())
+
+
+def test_location(client, layer):
+    response = client.get('/fires/location?location=Riverside')
+
+    assert response.status_code == 200
+    expected = [feature['attributes']['SourceOID'] for feature in layer['features']
+                if 'riverside' in ' '.join(str(feature['attributes'][name] or '') for name in ('POOCounty', 'POOCity', 'IncidentName',
+                                                                                            'IncidentShortDescription')).lower()]
+    assert source_oids(response) == sorted(expected)
+    assert int(response.headers['X-Total-Count']) == len(expected)
+    assert client.get('/fires/location').get_json() == []
+
+
+def test_pages_follow_their_cursor(client):
+    first = client.get('/fires/location?location=Riverside&limit=50&fields=SourceOID,geometry')
+    second = client.get(f"/fires/location?location=Riverside&limit=50&fields=SourceOID,geometry&cursor={first.headers['X-Next-Cursor']}")
+    everything = client.get('/fires/location?location=Riverside&fields=SourceOID')
+
+    assert set(first.get_json()[0]) == {'SourceOID', 'geometry'}
+    assert [feature['SourceOID'] for feature in first.get_json() + second.get_json()] == [
+        feature['SourceOID'] for feature in everything.get_json()[:100]]
+
+
+def test_formats(client):
+    geojson = client.get('/fires/location?location=Fresno&format=geojson')
+    ndjson = client.get('/fires/location?location=Fresno&format=ndjson')
+
+    assert geojson.get_json()['type'] == 'FeatureCollection'
+    assert len(geojson.get_json()['features']) == len(ndjson.get_data(as_text=True).splitlines())
+
+
+@pytest.mark.parametrize('query', [
+    'location=Fresno&format=xml',
+    'location=Fresno&fields=NoSuchField',
+    'location=Fresno&limit=-1',
+    'location=Fresno&limit=ten',
+    'location=Fresno&cursor=not-a-cursor',
+])
+def test_send_features_rejects_bad_parameters(client, query):
+    response = client.get(f'/fires/location?{query}')
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_date(client, layer):
+    response = client.get('/fires/date?start_date=2022-06-01&end_date=2022-06-30')
+
+    assert response.status_code == 200
+    assert response.get_json()
+    assert client.get('/fires/date?start_date=2022-06-01&end_date=2022-06-30&field=ContainmentDateTime').status_code == 200
+
+
+@pytest.mark.parametrize('query', [
+    'start_date=2022-06-01',
+    'start_date=2022-06-01&end_date=30.06.2022',
+    'start_date=2022-06-01&end_date=2022-06-30&field=IncidentSize',
+])
+def test_date_rejects_bad_parameters(client, query):
+    assert client.get(f'/fires/date?{query}').status_code == 400
+
+
+def test_areas(client, layer):
+    expected = [feature['attributes']['SourceOID'] for feature in layer['features']
+                if (feature['attributes']['IncidentSize'] or 0) > 1000]
+
+    assert source_oids(client.get('/fires/areas')) == sorted(expected)
+
+
+def test_query(client):
+    response = client.get('/fires/query?min_size=10&cause=Human,Natural&type_kind=FI&bbox=-125,30,-100,50&order_by=size')
+    sizes = [feature['IncidentSize'] for feature in response.get_json()]
+
+    assert response.status_code == 200
+    assert sizes and sizes == sorted(sizes) and min(sizes) >= 10
+    assert {feature['FireCause'] for feature in response.get_json()} <= {'Human', 'Natural'}
+
+
+@pytest.mark.parametrize('query', [
+    'min_size=ten',
+    'bbox=1,2,3',
+    'bbox=-100,30,-110,50',
+    'min_size=10&max_size=5',
+    'order_by=IncidentName',
+    'start_date=yesterday',
+    'start_date=2022-01-01&date_field=IncidentSize',
+])
+def test_query_rejects_bad_parameters(client, query):
+    assert client.get(f'/fires/query?{query}').status_code == 400
+
+
+def longitude(feature):
+    # incidents without a geometry are placed at their initial coordinates
+    geometry = feature['geometry'] or {}
+    return feature['InitialLongitude'] if geometry.get('x') is None else geometry['x']
+
+
+def test_bbox_and_near(client):
+    inside = client.get('/fires/bbox?min_lon=-119&min_lat=33&max_lon=-117&max_lat=35').get_json()
+    near = client.get('/fires/near?lat=34.3&lon=-118.2&radius_km=30').get_json()
+
+    assert inside and all(-119 <= longitude(feature) <= -117 for feature in inside)
+    distances = [feature['distance_km'] for feature in near]
+    assert distances and distances == sorted(distances) and distances[-1] <= 30
+
+
+@pytest.mark.parametrize('path', [
+    '/fires/bbox?min_lon=-119&min_lat=33&max_lon=-117',
+    '/fires/bbox?min_lon=-117&min_lat=33&max_lon=-119&max_lat=35',
+    '/fires/bbox?min_lon=west&min_lat=33&max_lon=-117&max_lat=35',
+    '/fires/near?lat=34&lon=-118',
+    '/fires/near?lat=34&lon=-118&radius_km=-1',
+])
+def test_bbox_and_near_reject_bad_parameters(client, path):
+    assert client.get(path).status_code == 400
+
+
+def test_cached_responses_revalidate(client):
+    first = client.get('/fires/location?location=Kern')
+    cached = client.get('/fires/location?location=Kern')
+    again = client.get('/fires/location?location=Kern', headers={'If-None-Match': cached.headers['ETag']})
+
+    assert first.headers['X-Data-Version'] == cached.headers['X-Data-Version'] == '0'
+    assert cached.get_json() == first.get_json()
+    assert again.status_code == 304
+
+
+@pytest.mark.parametrize('path', [
+    '/plots/incident_hours',
+    '/plots/incident_hours?location=Fresno&timezone=UTC&format=svg',
+    '/plots/affected_areas',
+    '/plots/correlation?format=svg',
+    '/plots/time_series?frequency=week',
+])
+def test_plots(client, path):
+    response = client.get(path)
+
+    assert response.status_code == 200
+    assert response.mimetype in ('image/png', 'image/svg+xml')
+    assert client.get(path, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+@pytest.fixture
+def empty_client(service, layer, monkeypatch):
+    server, url = standInServer.serve({**layer, 'features': []})
+    monkeypatch.setattr(service, 'BASE_URL', layer_url(url))
+    yield flask_app.create_app().test_client()
+    server.shutdown()
+
+
+@pytest.mark.parametrize('path', ['/plots/incident_hours', '/plots/affected_areas', '/plots/correlation', '/plots/time_series'])
+def test_plots_without_data(empty_client, path):
+    assert empty_client.get(path).status_code == 404
+
+
+@pytest.mark.parametrize('path', [
+    '/plots/incident_hours?format=gif',
+    '/plots/incident_hours?timezone=Mars/Olympus',
+    '/plots/affected_areas?format=jpg',
+    '/plots/correlation?format=pdf',
+    '/plots/time_series?frequency=hour',
+    '/plots/time_series?timezone=Mars/Olympus',
+])
+def test_plots_reject_bad_parameters(client, path):
+    assert client.get(path).status_code == 400
+
+
+def test_analyses(client, layer):
+    hours = client.get('/analysis/ignition_times?location=Ventura&timezone=UTC').get_json()
+    by_zone = client.get('/analysis/ignition_times?timezone=UTC,US/Eastern').get_json()
+    areas = client.get('/analysis/affected_areas?threshold=100&percentiles=50,90&group_by=county').get_json()
+    series = client.get('/analysis/time_series?frequency=month&window=3').get_json()
+
+    assert hours['hour_distribution'] and all(0 <= int(hour) <= 23 for hour in hours['hour_distribution'])
+    assert set(by_zone) == {'UTC', 'US/Eastern'}
+    assert sum(by_zone['UTC']['hour_distribution'].values()) == sum(by_zone['US/Eastern']['hour_distribution'].values())
+    assert areas['total_fires'] == sum(1 for feature in layer['features'] if feature['attributes']['IncidentSize'] is not None)
+    assert series['frequency'] == 'month' and series['periods']
+
+
+@pytest.mark.parametrize('path', [
+    '/analysis/ignition_times?timezone=Mars/Olympus',
+    '/analysis/ignition_times?group_by=weekday',
+    '/analysis/affected_areas?threshold=big',
+    '/analysis/affected_areas?percentiles=50,101',
+    '/analysis/affected_areas?group_by=weekday',
+    '/analysis/time_series?frequency=hour',
+    '/analysis/time_series?timezone=Mars/Olympus',
+    '/analysis/time_series?window=three',
+    '/analysis/time_series?start_date=yesterday',
+])
+def test_analyses_reject_bad_parameters(client, path):
+    assert client.get(path).status_code == 400
+
+
+def test_batch(client):
+    specs = [{'location': 'Fresno', 'analyses': ['ignition_times']},
+             {'start_date': '2022-01-01', 'end_date': '2022-12-31', 'group_by': 'cause', 'threshold': 10, 'percentiles': [50]}]
+    response = client.post('/analysis/batch', json=specs)
+
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
+
+
+@pytest.mark.parametrize('body', [
+    'not json',
+    json.dumps({'location': 'Fresno'}),
+    json.dumps([{'location': 'Fresno', 'colour': 'red'}]),
+    json.dumps([{'timezone': 'Mars/Olympus'}]),
+    json.dumps([{'analyses': ['everything']}]),
+    json.dumps([{'percentiles': [150]}]),
+])
+def test_batch_rejects_bad_specs(client, body):
+    assert client.post('/analysis/batch', data=body, content_type='application/json').status_code == 400
+
+
+def test_metrics(client):
+    client.get('/fires/location?location=Kern')
+    body = client.get('/metrics').get_data(as_text=True)
+
+    assert 'fire_dataset_version 0' in body
+    assert 'fire_dataset_incidents 2000' in body
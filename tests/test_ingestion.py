@@ -0,0 +1,75 @@
+import numpy
+import pytest
+
+import asyncIngestion
+import ingestion
+import standInServer
+from conftest import LAYER_SIZE, MAX_RECORD_COUNT, layer_url
+
+
+def source_oids(features):
+    return sorted(feature['attributes']['SourceOID'] for feature in features)
+
+
+@pytest.mark.parametrize('strategy', ['offset', 'oid'])
+def test_fetch_all_reads_every_page(layer_server, strategy):
+    data = asyncIngestion.fetch_all(layer_server, strategy=strategy, concurrency=4)
+
+    assert source_oids(data['features']) == list(range(LAYER_SIZE))
+    assert not data['exceededTransferLimit']
+    assert [field['name'] for field in data['fields']][:3] == ['ContainmentDateTime', 'ControlDateTime', 'IncidentSize']
+
+
+@pytest.mark.parametrize('strategy', ['offset', 'oid'])
+def test_fetch_store_matches_fetch_all(layer_server, strategy):
+    data = asyncIngestion.fetch_all(layer_server, strategy=strategy)
+    header, store = asyncIngestion.fetch_store(layer_server, strategy=strategy)
+
+    assert len(store) == len(data['features'])
+    assert 'features' not in header
+    by_oid = {feature['attributes']['SourceOID']: feature['attributes'] for feature in data['features']}
+    for row in range(0, len(store), 97):
+        attributes = store.attributes(row)
+        assert attributes == by_oid[attributes['SourceOID']]
+
+
+@pytest.mark.parametrize('strategy', ['offset', 'oid'])
+def test_paging_follows_a_filter(layer_server, strategy):
+    url = ingestion.with_params(layer_server, where="POOCounty = 'Riverside'")
+    data = asyncIngestion.fetch_all(url, strategy=strategy)
+
+    assert len(data['features']) > MAX_RECORD_COUNT
+    assert all(feature['attributes']['POOCounty'] == 'Riverside' for feature in data['features'])
+    assert len(set(source_oids(data['features']))) == len(data['features'])
+
+
+def test_oid_paging_skips_gaps_in_object_ids(layer):
+    # object ids with holes, as left by deleted incidents
+    features = [dict(feature, attributes=dict(feature['attributes'], OBJECTID=3 * i + 1))
+                for i, feature in enumerate(layer['features'][:700])]
+    server, url = standInServer.serve({**layer, 'features': features}, max_record_count=128)
+    try:
+        data = asyncIngestion.fetch_all(layer_url(url), strategy='oid')
+    finally:
+        server.shutdown()
+
+    assert source_oids(data['features']) == list(range(700))
+
+
+def test_an_empty_layer_has_no_pages(layer):
+    server, url = standInServer.serve({**layer, 'features': []}, max_record_count=MAX_RECORD_COUNT)
+    try:
+        for strategy in ('offset', 'oid'):
+            assert asyncIngestion.fetch_all(layer_url(url), strategy=strategy)['features'] == []
+    finally:
+        server.shutdown()
+
+
+def test_oid_ranges_cover_every_id_once():
+    object_ids = sorted(numpy.random.default_rng(0).choice(10000, 1234, replace=False).tolist())
+    ranges = ingestion.oid_ranges(object_ids, 100)
+
+    assert len(ranges) == 13
+    covered = [oid for first, last in ranges for oid in object_ids if first <= oid <= last]
+    assert covered == object_ids
+    assert ingestion.oid_ranges([], 100) == []
@@ -0,0 +1,118 @@
+import copy
+import random
+
+import numpy
+import pytest
+
+import asyncIngestion
+import queryPushdown
+from arcGISResponse import ArcGISResponse
+from fireQuery import FireQuery
+from queryPushdown import PushdownCache
+
+
+@pytest.fixture(scope='module')
+def full(layer):
+    return ArcGISResponse(**copy.deepcopy(layer))
+
+
+def global_ids(store, rows):
+    column = store.column('SourceGlobalID')
+    return sorted(column.get(row) for row in rows.tolist())
+
+
+def exact_timestamp(full, field, row):
+    return int(full.store.values(field)[full.time_index(field).rows[row]])
+
+
+def queries(full):
+    """
+    Queries on every predicate the server evaluates, including bounds on exact timestamps and
+    locations with characters a LIKE pattern or a quoted literal treats specially.
+    """
+    yield FireQuery(location="O'Neil creek")
+    yield FireQuery(location='100%')
+    yield FireQuery(location='under_score   FIRE')
+    yield FireQuery(location='los  angeles')
+    yield FireQuery(location='ventura', min_size=10)
+    yield FireQuery(min_size=5, max_size=5.5)
+    yield FireQuery(causes=['Human', 'Natural'])
+    yield FireQuery(type_kinds=['FI'], complexity_levels=['Type 3 Incident', 'Type 4 Incident'])
+    yield FireQuery(causes=["No'Such"], location='riverside')
+    for field in ('FireDiscoveryDateTime', 'ContainmentDateTime', 'FireOutDateTime'):
+        start, end = exact_timestamp(full, field, 100), exact_timestamp(full, field, 160)
+        yield FireQuery(start=start, end=end, date_field=field)
+        yield FireQuery(start=start, date_field=field, location='fresno')
+        yield FireQuery(end=end, date_field=field, bbox=(-122, 33, -114, 38))
+
+    rng = random.Random(5)
+    causes = [cause for cause in full.store.column('FireCause').categories if cause]
+    for _ in range(60):
+        arguments = {}
+        if rng.random() < 0.5:
+            arguments['min_size'] = rng.choice([0.5, 10, 50.5, 100])
+        if rng.random() < 0.3:
+            arguments['max_size'] = rng.choice([200, 1000])
+        if rng.random() < 0.5:
+            arguments['location'] = rng.choice(['kern', 'San Diego', 'creek 1', 'Oak', 'visalia'])
+        if rng.random() < 0.4:
+            field = rng.choice(['FireDiscoveryDateTime', 'ContainmentDateTime'])
+            start = 1600000000000 + rng.randint(0, 5 * 10 ** 10) + rng.randint(0, 999)
+            arguments.update(date_field=field, start=start, end=start + rng.randint(0, 5 * 10 ** 10))
+        if rng.random() < 0.3:
+            arguments['causes'] = rng.sample(causes, 2)
+        if rng.random() < 0.2:
+            arguments['bbox'] = (-120, 33, -112, 40)
+        if not arguments:
+            arguments['location'] = 'phoenix'
+        yield FireQuery(**arguments)
+
+
+def test_compiled_queries_never_drop_a_match(layer_server, full):
+    for query in queries(full):
+        header, store = asyncIngestion.fetch_store(queryPushdown.compile_query(query, layer_server))
+        fetched = set(global_ids(store, numpy.arange(len(store))))
+
+        assert set(global_ids(full.store, query.execute(full))) <= fetched
+
+
+def test_pushdown_answers_like_the_full_collection(layer_server, full):
+    fetches = []
+
+    def fetch_store(url):
+        fetches.append(url)
+        return asyncIngestion.fetch_store(url)
+
+    cache = PushdownCache(layer_server, fetch_store)
+    for query in queries(full):
+        dataset, rows = cache.execute(query)
+        assert global_ids(dataset.store, rows) == global_ids(full.store, query.execute(full))
+
+    # queries implied by one fetched before are answered without a request
+    fetched = len(fetches)
+    cache.execute(FireQuery(location='ventura', min_size=100))
+    cache.execute(FireQuery(location='ventura', min_size=20, max_size=50))
+    assert len(fetches) == fetched
+
+
+def test_pushdown_keeps_the_order(layer_server, full):
+    cache = PushdownCache(layer_server, asyncIngestion.fetch_store)
+    query = FireQuery(location='riverside', order_by='size')
+    dataset, rows = cache.execute(query)
+    expected = query.execute(full)
+
+    assert numpy.array_equal(dataset.store.values('IncidentSize')[rows], full.store.values('IncidentSize')[expected])
+
+
+def test_an_unsupported_predicate_is_refused():
+    with pytest.raises(ValueError):
+        queryPushdown.compile_predicate(object())
+
+
+@pytest.mark.parametrize('location', ["O'Neil creek", '100%', 'under_score   FIRE'])
+def test_escaped_locations_reach_their_incident(layer_server, full, location):
+    query = FireQuery(location=location)
+    dataset, rows = PushdownCache(layer_server, asyncIngestion.fetch_store).execute(query)
+
+    assert len(rows) >= 1
+    assert global_ids(dataset.store, rows) == global_ids(full.store, query.execute(full))
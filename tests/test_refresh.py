@@ -0,0 +1,146 @@
+import copy
+
+import numpy
+import pytest
+
+import main
+import standInServer
+from arcGISResponse import ArcGISResponse
+from datasetHandle import DatasetHandle
+from refresher import Refresher
+from conftest import layer_url
+
+TIMEZONES = ('US/Pacific', 'UTC')
+GROUPS = (None, 'county', 'cause')
+
+
+def warm(dataset):
+    """
+    Builds the lazily built structures, so a merge has to update them instead of building them anew.
+    """
+    for timezone in TIMEZONES:
+        dataset.analytics_cube(timezone)
+    for group_by in GROUPS:
+        dataset.size_distribution(group_by)
+    dataset.location_index
+    return dataset
+
+
+def edited(payload, round_number, changed, added, modified_at):
+    """
+    Returns a copy of the payload with `changed` incidents renamed and resized, `added` new ones
+    appended, and all of them modified at `modified_at`, along with the features that differ.
+    """
+    payload = copy.deepcopy(payload)
+    features = payload['features']
+    rng = numpy.random.default_rng(round_number)
+    delta = []
+    for row in rng.choice(len(features), changed, replace=False).tolist():
+        attributes = features[row]['attributes']
+        attributes.update(IncidentName=f"Renamed {round_number} {row}", POOCounty=f"New County {round_number % 3}",
+                          IncidentSize=float(rng.integers(1, 5000)), FireCause=None,
+                          FireDiscoveryDateTime=attributes['FireDiscoveryDateTime'] and attributes['FireDiscoveryDateTime'] + 7 * 3600 * 1000,
+                          ModifiedOnDateTime_dt=modified_at)
+        features[row]['geometry'] = {'x': -100.0 - round_number, 'y': 45.0}
+        delta.append(features[row])
+    for i in range(added):
+        source = features[i]
+        feature = {'attributes': dict(source['attributes'], SourceGlobalID=f"{{NEW-{round_number}-{i}}}", SourceOID=10 ** 6 + 100 * round_number + i,
+                                      IncidentName=f"Added {round_number} {i}", ModifiedOnDateTime_dt=modified_at),
+                   'geometry': source['geometry']}
+        features.append(feature)
+        delta.append(feature)
+    return payload, copy.deepcopy(delta)
+
+
+def assert_same_collection(merged, rebuilt):
+    store, other = merged.store, rebuilt.store
+    assert len(store) == len(other)
+    for row in range(len(store)):
+        assert store.attributes(row) == other.attributes(row)
+        assert store.geometry(row) == other.geometry(row)
+    assert merged.high_water_mark == rebuilt.high_water_mark
+
+    for field, index in rebuilt.time_indexes.items():
+        for start, end in ((None, None), (1.6e12, 1.65e12), (1.65e12, 1.75e12)):
+            start = index.timestamps[0] if start is None else int(start)
+            end = index.timestamps[-1] if end is None else int(end)
+            assert numpy.array_equal(numpy.sort(merged.time_index(field).range(start, end)), numpy.sort(index.range(start, end)))
+
+    for text in ('riverside', 'renamed', 'added 1', "o'neil", 'new county 2', 'creek'):
+        assert numpy.array_equal(numpy.sort(merged.location_index.search(text)), numpy.sort(rebuilt.location_index.search(text)))
+    for bbox in ((-125, 30, -100, 50), (-120, 33, -115, 36)):
+        assert numpy.array_equal(numpy.sort(merged.spatial_index.within_bbox(*bbox)), numpy.sort(rebuilt.spatial_index.within_bbox(*bbox)))
+
+    for timezone in TIMEZONES:
+        assert merged.get_incident_hours(timezone=timezone) == rebuilt.get_incident_hours(timezone=timezone)
+        for group_by in ('county', 'cause', 'month'):
+            assert (merged.get_incident_hours_by_group(timezone=timezone, group_by=group_by)
+                    == rebuilt.get_incident_hours_by_group(timezone=timezone, group_by=group_by))
+    for group_by in GROUPS:
+        assert (main.summarize_sizes(merged, merged.size_distribution(group_by), 100, [10, 50, 99])
+                == main.summarize_sizes(rebuilt, rebuilt.size_distribution(group_by), 100, [10, 50, 99]))
+    assert merged.time_series('week').to_dict() == rebuilt.time_series('week').to_dict()
+
+
+def test_upserts_match_a_full_rebuild(layer):
+    payload = layer
+    dataset = warm(ArcGISResponse(**copy.deepcopy(payload)))
+    for round_number in range(1, 6):
+        payload, delta = edited(payload, round_number, changed=40, added=5, modified_at=dataset.high_water_mark + round_number * 1000)
+        dataset = warm(dataset.upsert(delta))
+
+        assert dataset.version == round_number
+        assert_same_collection(dataset, ArcGISResponse(**copy.deepcopy(payload)))
+
+
+def test_an_unchanged_upsert_keeps_every_answer(layer):
+    dataset = warm(ArcGISResponse(**copy.deepcopy(layer)))
+    again = dataset.upsert(copy.deepcopy(layer['features'][:50]))
+
+    assert_same_collection(again, dataset)
+
+
+@pytest.fixture
+def edited_server(layer):
+    """
+    The query url of a layer in which some incidents were modified and others added since `layer`.
+    """
+    high_water_mark = max(feature['attributes']['ModifiedOnDateTime_dt'] for feature in layer['features'])
+    payload, delta = edited(layer, 1, changed=60, added=10, modified_at=high_water_mark + 60 * 1000)
+    server, url = standInServer.serve(payload, max_record_count=25)
+    yield payload, layer_url(url)
+    server.shutdown()
+
+
+def test_refresh_matches_a_full_rebuild(layer, edited_server):
+    payload, url = edited_server
+    handle = DatasetHandle(lambda: warm(ArcGISResponse(**copy.deepcopy(layer))))
+    handle.get()
+    refresher = Refresher(url, lambda: handle.current, handle.publish, strategy='oid')
+
+    # the delta pages through the stand-in server's record cap, and also holds the unchanged
+    # incidents modified at the second of the high water mark
+    assert refresher.refresh_once() >= 70
+    assert handle.version == 1
+    assert_same_collection(handle.current, ArcGISResponse(**copy.deepcopy(payload)))
+
+    # the incidents at the high water mark come again, but change nothing
+    assert refresher.refresh_once() == 70
+    assert handle.version == 1
+
+
+def test_revalidate_reloads_when_incidents_were_deleted(layer, edited_server):
+    payload, url = edited_server
+    up_to_date = DatasetHandle(lambda: ArcGISResponse(**copy.deepcopy(payload)))
+    up_to_date.get()
+    assert not Refresher(url, lambda: up_to_date.current, up_to_date.publish).revalidate()
+    assert up_to_date.version == 0
+
+    # an incident deleted upstream since the collection was loaded
+    deleted = dict(layer['features'][0], attributes=dict(layer['features'][0]['attributes'], SourceGlobalID='{DELETED}', SourceOID=-1))
+    stale = DatasetHandle(lambda: ArcGISResponse(**dict(copy.deepcopy(layer), features=copy.deepcopy(layer['features']) + [deleted])))
+    stale.get()
+    assert Refresher(url, lambda: stale.current, stale.publish).revalidate()
+    assert stale.version == 2
+    assert_same_collection(stale.current, ArcGISResponse(**copy.deepcopy(payload)))
@@ -0,0 +1,130 @@
+import copy
+import json
+import os
+
+import numpy
+import pytest
+
+import snapshot
+from arcGISResponse import ArcGISResponse
+from datasetHandle import DatasetHandle
+
+
+@pytest.fixture
+def dataset(layer):
+    payload = copy.deepcopy(layer)
+    # dictionary strings holding the separator of the snapshot's string files, or nothing
+    payload['features'][3]['attributes']['IncidentName'] = 'with\x00nul'
+    payload['features'][4]['attributes']['IncidentName'] = ''
+    payload['features'][5]['attributes']['POOCity'] = 'Cañada ✓'
+    return ArcGISResponse(**payload)
+
+
+def assert_same_snapshot(loaded, dataset):
+    assert (loaded.version, loaded.epoch, loaded.high_water_mark) == (dataset.version, dataset.epoch, dataset.high_water_mark)
+    assert loaded.header() == dataset.header()
+    store, other = loaded.store, dataset.store
+    assert len(store) == len(other)
+    for name, column in other.columns.items():
+        mine = store.columns[name]
+        assert numpy.array_equal(mine.valid, column.valid), name
+        if column.kind == 'string':
+            assert [mine.get(row) for row in range(len(mine))] == [column.get(row) for row in range(len(column))], name
+        else:
+            assert numpy.array_equal(mine.values[mine.valid], column.values[column.valid]), name
+    assert numpy.array_equal(store.x, other.x, equal_nan=True)
+    assert numpy.array_equal(store.y, other.y, equal_nan=True)
+    for field, index in dataset.time_indexes.items():
+        assert numpy.array_equal(loaded.time_index(field).rows, index.rows), field
+    assert numpy.array_equal(numpy.sort(loaded.spatial_index.within_bbox(-125, 30, -100, 50)),
+                             numpy.sort(dataset.spatial_index.within_bbox(-125, 30, -100, 50)))
+    assert loaded.get_incident_hours() == dataset.get_incident_hours()
+    assert numpy.array_equal(loaded.location_index.search('with'), dataset.location_index.search('with'))
+
+
+def changed(dataset, round_number):
+    """
+    Returns the dataset with a few incidents renamed and one added.
+    """
+    rows = numpy.random.default_rng(round_number).choice(len(dataset.store), 5, replace=False)
+    features = [{'attributes': dataset.store.attributes(int(row)), 'geometry': dataset.store.geometry(int(row))} for row in rows]
+    for feature in features:
+        feature['attributes'].update(IncidentSize=float(round_number), IncidentName=f"Renamed {round_number}")
+    added = dict(features[0]['attributes'], SourceGlobalID=f"{{NEW-{round_number}}}", SourceOID=10 ** 6 + round_number)
+    return dataset.upsert(features + [{'attributes': added, 'geometry': {'x': -120 + round_number / 10, 'y': 38.0}}])
+
+
+def snapshot_meta(directory):
+    with open(os.path.join(directory, 'meta.json')) as stream:
+        return json.load(stream)
+
+
+def test_a_full_snapshot_loads_back(dataset, tmp_path):
+    assert snapshot.load(str(tmp_path)) is None
+    snapshot.save(dataset, str(tmp_path))
+
+    assert_same_snapshot(snapshot.load(str(tmp_path)), dataset)
+
+
+def test_deltas_load_back(dataset, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, 'MAX_DELTAS', 4)
+    root = str(tmp_path)
+    snapshot.save(dataset, root)
+    chains = []
+    for round_number in range(1, 11):
+        dataset = changed(dataset, round_number)
+        chains.append(len(snapshot_meta(snapshot.save(dataset, root))['chain']))
+
+        assert_same_snapshot(snapshot.load(root), dataset)
+
+    # every MAX_DELTAS deltas the next version is saved in full again
+    assert chains == [2, 3, 4, 5, 1, 2, 3, 4, 5, 1]
+    # the chain of the current snapshot and of the one before it are kept
+    assert len([entry for entry in os.listdir(root) if os.path.isdir(os.path.join(root, entry))]) <= 2 * (4 + 1)
+
+
+def test_an_unrelated_dataset_is_saved_in_full(dataset, layer, tmp_path):
+    root = str(tmp_path)
+    snapshot.save(dataset, root)
+    other = changed(ArcGISResponse(**copy.deepcopy(layer)), 1)
+
+    assert snapshot_meta(snapshot.save(other, root))['chain'] == [os.path.basename(snapshot.current(root))]
+    assert_same_snapshot(snapshot.load(root), other)
+
+
+def test_a_snapshot_of_another_format_is_ignored(dataset, tmp_path):
+    directory = snapshot.save(dataset, str(tmp_path))
+    meta = snapshot_meta(directory)
+    meta['format'] = snapshot.FORMAT_VERSION - 1
+    with open(os.path.join(directory, 'meta.json'), 'w') as stream:
+        json.dump(meta, stream)
+
+    assert snapshot.load(str(tmp_path)) is None
+
+
+def test_a_follower_applies_every_snapshot(dataset, layer, tmp_path):
+    root = str(tmp_path)
+    snapshot.save(dataset, root)
+    handle = DatasetHandle(lambda: snapshot.wait(root, 5, 0.01))
+    follower = snapshot.Follower(root, lambda: handle.current, handle.publish, 0.01)
+    handle.get()
+    assert follower.follow_once() is False
+
+    for round_number in range(1, 4):
+        dataset = changed(dataset, round_number)
+        snapshot.save(dataset, root)
+        assert follower.follow_once()
+        assert_same_snapshot(handle.current, dataset)
+    assert not follower.follow_once()
+
+    # the loader starts over from scratch: its versions restart in a new epoch
+    restarted = ArcGISResponse(**copy.deepcopy(layer))
+    snapshot.save(restarted, root)
+    assert follower.follow_once()
+    assert handle.current.epoch == restarted.epoch
+    assert handle.version == 4
+
+    snapshot.save(changed(restarted, 9), root)
+    assert follower.follow_once()
+    assert handle.version == 5
+    assert len(handle.current.store) == len(restarted.store) + 1
@@ -0,0 +1,64 @@
+import asyncio
+import socket
+
+import pytest
+import requests
+
+import asyncIngestion
+from conftest import LAYER_SIZE
+
+aiohttp = pytest.importorskip('aiohttp')
+
+
+@pytest.fixture(params=['aiohttp', 'thread'])
+def transport(request, monkeypatch):
+    """
+    Makes the downloads use each transport in turn.
+    """
+    if request.param == 'thread':
+        monkeypatch.setattr(asyncIngestion, 'aiohttp', None)
+    return request.param
+
+
+def test_create_transport_prefers_aiohttp():
+    async def created():
+        transport = asyncIngestion.create_transport(2, 5)
+        await transport.close()
+        return transport
+
+    assert isinstance(asyncio.run(created()), asyncIngestion.AiohttpTransport)
+
+
+@pytest.mark.parametrize('strategy', ['offset', 'oid'])
+def test_transports_download_the_same_layer(layer_server, transport, strategy):
+    data = asyncIngestion.fetch_all(layer_server, strategy=strategy, concurrency=3)
+    header, store = asyncIngestion.fetch_store(layer_server, strategy=strategy, concurrency=3)
+
+    assert [feature['attributes']['SourceOID'] for feature in data['features']] == list(range(LAYER_SIZE))
+    assert store.values('SourceOID').tolist() == list(range(LAYER_SIZE))
+    assert not header['exceededTransferLimit']
+    for row in range(0, LAYER_SIZE, 113):
+        assert store.attributes(row) == data['features'][row]['attributes']
+        if data['features'][row]['geometry'] is not None:
+            assert store.geometry(row) == data['features'][row]['geometry']
+
+
+def test_an_error_body_raises(layer_server, transport):
+    with pytest.raises(ValueError):
+        asyncIngestion.fetch_all(layer_server.replace('where=1%3D1', 'where=%28%28'))
+
+
+def test_aiohttp_failures_surface_as_request_errors():
+    with socket.socket() as unused:
+        unused.bind(('127.0.0.1', 0))
+        port = unused.getsockname()[1]
+
+    async def fetch():
+        transport = asyncIngestion.AiohttpTransport(1, 5, retries=2, backoff_factor=0)
+        try:
+            return await transport.get_json(f"http://127.0.0.1:{port}/query?f=json")
+        finally:
+            await transport.close()
+
+    with pytest.raises(requests.RequestException):
+        asyncio.run(fetch())
@@ -0,0 +1,74 @@
+import numpy
+
+# the date attributes that can be range-queried
+TIME_FIELDS = ('FireDiscoveryDateTime', 'ContainmentDateTime', 'FireOutDateTime', 'ModifiedOnDateTime_dt')
+
+
+class TimeIndex:
+    """
+    Sorted index of one date column.
+
+    Holds the non-null timestamps in ascending order next to the row each one belongs to,
+    so a time range is answered with two binary searches and a slice.
+    """
+    def __init__(self, timestamps: numpy.ndarray, rows: numpy.ndarray):
+        self.timestamps = timestamps
+        self.rows = rows
+
+    @classmethod
+    def build(cls, column) -> 'TimeIndex':
+        """
+        Builds the index of a date Column.
+        """
+        rows = numpy.flatnonzero(column.valid)
+        order = numpy.argsort(column.values[rows], kind='stable')
+        rows = rows[order]
+        return cls(column.values[rows], rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def range(self, start: int, end: int) -> numpy.ndarray:
+        """
+        Returns the rows whose timestamp lies within [start, end], in ascending time order.
+
+        Parameters:
+        - start (int): Start of the range, in epoch milliseconds. None leaves it open.
+        - end (int): End of the range, in epoch milliseconds. None leaves it open.
+
+        Returns:
+        - numpy.ndarray: The matching row numbers.
+        """
+        low = 0 if start is None else numpy.searchsorted(self.timestamps, start, side='left')
+        high = len(self.timestamps) if end is None else numpy.searchsorted(self.timestamps, end, side='right')
+        return self.rows[low:high]
+
+    def count(self, start: int, end: int) -> int:
+        """
+        Returns the number of rows whose timestamp lies within [start, end].
+        """
+        return len(self.range(start, end))
+
+    def updated(self, column, changed_rows: numpy.ndarray) -> 'TimeIndex':
+        """
+        Returns an index reflecting new values at `changed_rows`, without re-sorting the unchanged entries.
+
+        Parameters:
+        - column (Column): The date column after the update.
+        - changed_rows (numpy.ndarray): The rows that were replaced or appended.
+
+        Returns:
+        - TimeIndex: The updated index. This index is left untouched.
+        """
+        keep = ~numpy.isin(self.rows, changed_rows)
+        timestamps = self.timestamps[keep]
+        rows = self.rows[keep]
+
+        changed_rows = numpy.unique(changed_rows)
+        changed_rows = changed_rows[column.valid[changed_rows]]
+        new_timestamps = column.values[changed_rows]
+        order = numpy.argsort(new_timestamps, kind='stable')
+        new_timestamps = new_timestamps[order]
+
+        positions = numpy.searchsorted(timestamps, new_timestamps, side='right')
+        return TimeIndex(numpy.insert(timestamps, positions, new_timestamps), numpy.insert(rows, positions, changed_rows[order]))
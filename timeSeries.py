@@ -0,0 +1,215 @@
+"""
+Incident counts and acreage per day, week or month of discovery.
+
+A TimeSeries keeps, for every period between the first and the last discovery (empty periods
+included), the number of incidents, the sum of their sizes and the sums needed to correlate
+discovery time with size. Rolling correlations and growth rates are then computed from these
+per-period sums, so their cost depends on the number of periods, not of incidents.
+"""
+import math
+
+import numpy
+
+from localTime import to_local
+
+FREQUENCIES = ('day', 'week', 'month')
+
+TIME_FIELD = 'FireDiscoveryDateTime'
+SIZE_FIELD = 'IncidentSize'
+
+DAY_MS = 86400000
+
+# bins of the discovery time / size histogram drawn instead of a scatter plot
+HISTOGRAM_BINS = (120, 60)
+
+# smallest size on the logarithmic size axis of the histogram, in acres; smaller sizes are counted in the first bin
+HISTOGRAM_MIN_SIZE = 0.01
+
+
+def period_codes(timestamps: numpy.ndarray, frequency: str, timezone: str) -> numpy.ndarray:
+    """
+    Returns the local period of every UTC epoch ms timestamp, counted since 1970: days,
+    weeks starting on Monday, or months.
+    """
+    days = to_local(timestamps, timezone) // DAY_MS
+    if frequency == 'day':
+        return days
+    if frequency == 'week':
+        # 1970-01-01 was a Thursday, so week 0 starts on Monday 1969-12-29
+        return (days + 3) // 7
+    if frequency == 'month':
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype(numpy.int64)
+    raise ValueError(f"Unknown frequency '{frequency}'. Use one of: {', '.join(FREQUENCIES)}")
+
+
+def period_starts(codes: numpy.ndarray, frequency: str) -> numpy.ndarray:
+    """
+    Returns the first day of every period code of period_codes.
+    """
+    if frequency == 'day':
+        return codes.astype('datetime64[D]')
+    if frequency == 'week':
+        return (codes * 7 - 3).astype('datetime64[D]')
+    return codes.astype('datetime64[M]').astype('datetime64[D]')
+
+
+def growth_rates(values: numpy.ndarray) -> numpy.ndarray:
+    """
+    Returns the change of every period relative to the previous one, NaN for the first
+    period and after an empty one.
+    """
+    rates = numpy.full(len(values), numpy.nan)
+    previous = values[:-1].astype(numpy.float64)
+    nonzero = previous != 0
+    rates[1:][nonzero] = (values[1:][nonzero] - previous[nonzero]) / previous[nonzero]
+    return rates
+
+
+def _number(value: float):
+    # NaN is not valid JSON
+    return None if math.isnan(value) else value
+
+
+class TimeSeries:
+    """
+    Incident counts, acreage and correlation sums per period of discovery in one time zone.
+    """
+    def __init__(self, frequency: str, timezone: str, first: int, counts: numpy.ndarray, acres: numpy.ndarray, sums: numpy.ndarray):
+        """
+        Parameters:
+        - frequency (str): One of FREQUENCIES.
+        - timezone (str): The time zone the periods are delimited in.
+        - first (int): The period code of the first period.
+        - counts (numpy.ndarray): Incidents discovered per period.
+        - acres (numpy.ndarray): Sum of the known incident sizes per period.
+        - sums (numpy.ndarray): Per period, over the incidents with a size: their number and the
+          sums of t, s, t², s² and t·s, t being the discovery time in days and s the size.
+        """
+        self.frequency = frequency
+        self.timezone = timezone
+        self.first = first
+        self.counts = counts
+        self.acres = acres
+        self.sums = sums
+
+    @classmethod
+    def build(cls, store, frequency: str = 'month', timezone: str = 'US/Pacific', rows: numpy.ndarray = None) -> 'TimeSeries':
+        """
+        Builds the series of a store's incidents in one pass.
+
+        Parameters:
+        - store (FeatureStore): The incidents.
+        - frequency (str, optional): 'day', 'week' or 'month'. Defaults to 'month'.
+        - timezone (str, optional): The time zone the periods are delimited in. Defaults to 'US/Pacific'.
+        - rows (numpy.ndarray, optional): The incidents to include. All of them if not given.
+
+        Returns:
+        - TimeSeries: The series, without periods if no incident has a discovery time.
+        """
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency '{frequency}'. Use one of: {', '.join(FREQUENCIES)}")
+        with_time = store.not_null(TIME_FIELD)
+        rows = numpy.flatnonzero(with_time) if rows is None else rows[with_time[rows]]
+        if len(rows) == 0:
+            return cls(frequency, timezone, 0, numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0), numpy.zeros((0, 6)))
+
+        timestamps = store.values(TIME_FIELD)[rows]
+        codes = period_codes(timestamps, frequency, timezone)
+        first = int(codes.min())
+        periods = codes - first
+        length = int(periods.max()) + 1
+
+        with_size = store.not_null(SIZE_FIELD)[rows]
+        sizes = store.values(SIZE_FIELD)[rows][with_size]
+        sized = periods[with_size]
+        # days since the start of the first period keep the squared sums small
+        days = (timestamps[with_size] - timestamps.min()) / DAY_MS
+        sums = numpy.stack([numpy.bincount(sized, weights=weights, minlength=length)
+                            for weights in (None, days, sizes, days * days, sizes * sizes, days * sizes)], axis=1)
+        return cls(frequency, timezone, first, numpy.bincount(periods, minlength=length), sums[:, 2].copy(), sums)
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def starts(self) -> numpy.ndarray:
+        """
+        The first day of every period.
+        """
+        return period_starts(self.first + numpy.arange(len(self)), self.frequency)
+
+    def rolling_correlation(self, window: int) -> numpy.ndarray:
+        """
+        Returns, for every period, the correlation between discovery time and size of the
+        incidents of the `window` periods ending with it. NaN where fewer than `window`
+        periods precede or the correlation is undefined.
+        """
+        if window < 1:
+            raise ValueError("The window must be at least one period")
+        totals = numpy.concatenate((numpy.zeros((1, 6)), numpy.cumsum(self.sums, axis=0)))
+        correlations = numpy.full(len(self), numpy.nan)
+        if len(self) < window:
+            return correlations
+        n, t, s, tt, ss, ts = (totals[window:] - totals[:-window]).T
+        covariance = n * ts - t * s
+        variance = (n * tt - t * t) * (n * ss - s * s)
+        defined = (n > 1) & (variance > 0)
+        correlations[window - 1:][defined] = covariance[defined] / numpy.sqrt(variance[defined])
+        return correlations
+
+    def correlation(self) -> float:
+        """
+        Returns the correlation between discovery time and size over the whole series, or NaN.
+        """
+        return float(self.rolling_correlation(len(self))[-1]) if len(self) else math.nan
+
+    def downsampled(self, max_periods: int) -> tuple:
+        """
+        Merges runs of consecutive periods so that at most `max_periods` remain, e.g. for plotting.
+
+        Returns:
+        - tuple: (first day of each merged period, incident counts, acreage) as NumPy arrays.
+        """
+        step = max(1, -(-len(self) // max_periods))
+        starts = self.starts[::step]
+        boundaries = numpy.arange(0, len(self), step)
+        if len(self) == 0:
+            return starts, self.counts, self.acres
+        return starts, numpy.add.reduceat(self.counts, boundaries), numpy.add.reduceat(self.acres, boundaries)
+
+    def to_dict(self, window: int = None) -> dict:
+        """
+        Returns the series for a JSON response: every period with its count, acreage, growth
+        rates and, if a window is given, the rolling correlation ending with it.
+        """
+        columns = {
+            'start': [str(start) for start in self.starts],
+            'count': self.counts.tolist(),
+            'acres': self.acres.tolist(),
+            'count_growth': [_number(rate) for rate in growth_rates(self.counts).tolist()],
+            'acres_growth': [_number(rate) for rate in growth_rates(self.acres).tolist()],
+        }
+        if window is not None:
+            columns['correlation'] = [_number(value) for value in self.rolling_correlation(window).tolist()]
+        return {
+            'frequency': self.frequency,
+            'timezone': self.timezone,
+            'window': window,
+            'correlation': _number(self.correlation()),
+            'periods': [dict(zip(columns, values)) for values in zip(*columns.values())],
+        }
+
+
+def time_size_histogram(timestamps: numpy.ndarray, sizes: numpy.ndarray, bins: tuple = HISTOGRAM_BINS) -> tuple:
+    """
+    Counts incidents on a grid of discovery time (linear) by size (logarithmic), so a plot of
+    them costs the same however many incidents there are.
+
+    Returns:
+    - tuple: (time bin edges as datetime64[ms], size bin edges in acres, counts of shape bins).
+    """
+    time_edges = numpy.linspace(timestamps.min(), max(timestamps.max(), timestamps.min() + 1), bins[0] + 1)
+    clipped = numpy.maximum(sizes, HISTOGRAM_MIN_SIZE)
+    size_edges = numpy.geomspace(HISTOGRAM_MIN_SIZE, max(clipped.max(), HISTOGRAM_MIN_SIZE * 10), bins[1] + 1)
+    counts, _, _ = numpy.histogram2d(timestamps, clipped, bins=(time_edges, size_edges))
+    return time_edges.astype(numpy.int64).astype('datetime64[ms]'), size_edges, counts